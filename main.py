@@ -1,4 +1,5 @@
 import argparse
+import sys
 import uvicorn
 
 
@@ -8,6 +9,7 @@ def main():
     parser.add_argument("--host", type=str, default="0.0.0.0", help="Host to bind to")
     parser.add_argument("--node-id", type=str, default="0", help="Unique ID for this node")
     parser.add_argument("--peers", type=str, default="", help="Comma-separated list of peer URLs (e.g. http://localhost:8001,http://localhost:8002)")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes, each owning a key-hash partition (default: 1, single process)")
     args = parser.parse_args()
 
     import os
@@ -15,9 +17,19 @@ def main():
     os.environ["DB_NODE_ID"] = args.node_id
     os.environ["DB_PEERS"] = args.peers
 
+    if args.workers > 1 and "DB_PARTITION" not in os.environ:
+        if args.peers:
+            parser.error("--workers cannot be combined with --peers (replication is per process)")
+        from src.db.workers import supervise
+        sys.exit(supervise(args.workers, os.getenv("DB_DATA_DIR", "data"), sys.argv))
+
     # Import app AFTER setting environment variables
     from src.db.server import app
-    uvicorn.run(app, host=args.host, port=args.port)
+    if "DB_PARTITION" in os.environ:
+        from src.db.workers import serve_partition
+        serve_partition(app, args.host, args.port)
+    else:
+        uvicorn.run(app, host=args.host, port=args.port)
 
 if __name__ == "__main__":
     main()
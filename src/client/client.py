@@ -1,5 +1,7 @@
 import requests
-from typing import Any, List, Tuple, Optional
+import json
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Tuple, Optional, Union
 
 class DatabaseClient:
     """
@@ -14,6 +16,26 @@ class DatabaseClient:
         self.base_url = f"http://{host}:{port}"
         self.session = requests.Session()
 
+    def wait_until_ready(self, timeout: float = 30.0) -> bool:
+        """
+        Wait until the server is up and has finished recovering its data.
+        
+        Args:
+            timeout (float): Seconds to wait at most.
+            
+        Returns:
+            bool: True once /health/ready succeeds, False if the timeout expired first.
+        """
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                if self.session.get(f"{self.base_url}/health/ready", timeout=1).status_code == 200:
+                    return True
+            except requests.RequestException:
+                pass
+            time.sleep(0.05)
+        return False
+
     def get(self, key: str) -> Any:
         """
         Retrieve a value by key.
@@ -34,7 +56,28 @@ class DatabaseClient:
         except requests.RequestException:
             return None
 
-    def set(self, key: str, value: Any, debug: bool = False) -> bool:
+    def get_with_version(self, key: str) -> Tuple[Any, int]:
+        """
+        Retrieve a value together with its version.
+        
+        Args:
+            key (str): The key to retrieve.
+            
+        Returns:
+            Tuple[Any, int]: (value, version); (None, 0) if the key does not exist.
+            
+        Raises:
+            requests.RequestException: On network or server errors, so a failed
+                read is never mistaken for "absent" by compare_and_set callers.
+        """
+        resp = self.session.get(f"{self.base_url}/get/{key}")
+        if resp.status_code == 404:
+            return None, 0
+        resp.raise_for_status()
+        body = resp.json()
+        return body["value"], body["version"]
+
+    def set(self, key: str, value: Any, debug: bool = False, ttl: Optional[float] = None) -> bool:
         """
         Set a key-value pair.
         
@@ -42,12 +85,15 @@ class DatabaseClient:
             key (str): The key.
             value (Any): The value (must be JSON serializable).
             debug (bool): If True, simulate random write failure.
+            ttl (float, optional): Expire the key after this many seconds.
             
         Returns:
             bool: True if successful, False otherwise.
         """
         try:
             payload = {"key": key, "value": value, "debug": debug}
+            if ttl is not None:
+                payload["ttl"] = ttl
             resp = self.session.post(f"{self.base_url}/set", json=payload)
             resp.raise_for_status()
             return True
@@ -71,21 +117,282 @@ class DatabaseClient:
         except requests.RequestException:
             return False
 
-    def bulk_set(self, items: List[Tuple[str, Any]], debug: bool = False) -> bool:
+    def bulk_set(self, items: List[Tuple[str, Any]], debug: bool = False, ttl: Optional[float] = None) -> bool:
         """
         Set multiple key-value pairs atomically.
         
         Args:
             items (List[Tuple[str, Any]]): List of (key, value) tuples.
             debug (bool): If True, simulate random write failure.
+            ttl (float, optional): Expire all the keys after this many seconds.
             
         Returns:
             bool: True if successful, False otherwise.
         """
         try:
             payload = {"items": items, "debug": debug}
+            if ttl is not None:
+                payload["ttl"] = ttl
             resp = self.session.post(f"{self.base_url}/bulk", json=payload)
             resp.raise_for_status()
             return True
         except requests.RequestException:
             return False
+
+    def import_items(self, items: Iterable[Tuple[str, Any]], batch_size: int = 1000) -> int:
+        """
+        Stream a large number of key-value pairs to the server.
+        
+        Unlike bulk_set, items are sent and written as they are produced, so
+        neither side holds the whole data set in memory. The import is not
+        atomic: on failure, the items before the failing one stay written.
+        
+        Args:
+            items (Iterable[Tuple[str, Any]]): (key, value) pairs; may be a generator.
+            batch_size (int): Items per write batch on the server.
+        
+        Returns:
+            int: Number of items imported.
+        
+        Raises:
+            requests.RequestException: If the import fails.
+        """
+        def lines() -> Iterator[bytes]:
+            chunk = []
+            size = 0
+            for key, value in items:
+                line = json.dumps({"key": key, "value": value})
+                chunk.append(line)
+                size += len(line)
+                if size >= 65536:
+                    yield ("\n".join(chunk) + "\n").encode("utf-8")
+                    chunk, size = [], 0
+            if chunk:
+                yield ("\n".join(chunk) + "\n").encode("utf-8")
+        
+        resp = self.session.post(f"{self.base_url}/import", params={"batch_size": batch_size}, data=lines(),
+                                 headers={"Content-Type": "application/x-ndjson"})
+        resp.raise_for_status()
+        return resp.json()["count"]
+        
+    def export(self, prefix: str = "") -> Iterator[Tuple[str, Any]]:
+        """
+        Stream a point-in-time dump of the store.
+        
+        Args:
+            prefix (str): Only export keys starting with this prefix.
+        
+        Yields:
+            Tuple[str, Any]: (key, value) pairs.
+        
+        Raises:
+            requests.RequestException: If the dump cannot be read.
+        """
+        with self.session.get(f"{self.base_url}/export", params={"prefix": prefix}, stream=True) as resp:
+            resp.raise_for_status()
+            for line in resp.iter_lines():
+                if line:
+                    item = json.loads(line)
+                    yield item["key"], item["value"]
+        
+    def incr(self, key: str, by: Union[int, float] = 1) -> Optional[Union[int, float]]:
+        """
+        Atomically add to a numeric value on the server (a missing key counts as 0).
+        
+        Args:
+            key (str): The key.
+            by (int | float): Amount to add (may be negative).
+            
+        Returns:
+            Optional[int | float]: The new value, or None on error (e.g. value is not a number).
+        """
+        try:
+            resp = self.session.post(f"{self.base_url}/incr", json={"key": key, "by": by})
+            resp.raise_for_status()
+            return resp.json()["value"]
+        except requests.RequestException:
+            return None
+
+    def append(self, key: str, value: Any) -> bool:
+        """
+        Append to a string (concatenation) or list (one item) value on the server.
+        
+        Args:
+            key (str): The key.
+            value (Any): String to concatenate, or item to add to a list.
+            
+        Returns:
+            bool: True if successful, False otherwise.
+        """
+        return self._update("append", {"key": key, "value": value})
+
+    def patch(self, key: str, path: str, value: Any) -> bool:
+        """
+        Set one location inside a JSON value without sending the whole value.
+        
+        Args:
+            key (str): The key.
+            path (str): JSON Pointer to the location, e.g. "/profile/name" or "/items/-".
+            value (Any): New value at that location.
+            
+        Returns:
+            bool: True if successful, False otherwise.
+        """
+        return self._update("patch", {"key": key, "path": path, "value": value})
+
+    def merge(self, key: str, patch: Any) -> bool:
+        """
+        Apply a JSON merge patch (RFC 7396) to a value; None removes a member.
+        
+        Args:
+            key (str): The key.
+            patch (Any): Object to merge into the current value.
+            
+        Returns:
+            bool: True if successful, False otherwise.
+        """
+        return self._update("merge", {"key": key, "patch": patch})
+
+    def _update(self, endpoint: str, payload: Dict[str, Any]) -> bool:
+        try:
+            resp = self.session.post(f"{self.base_url}/{endpoint}", json=payload)
+            resp.raise_for_status()
+            return True
+        except requests.RequestException:
+            return False
+
+    def compare_and_set(self, key: str, value: Any, expected_version: int,
+                        ttl: Optional[float] = None) -> Tuple[bool, int]:
+        """
+        Set a key only if its version still matches.
+        
+        Args:
+            key (str): The key.
+            value (Any): The new value.
+            expected_version (int): Version from get_with_version() (0 = key must not exist).
+            ttl (float, optional): Expire the key after this many seconds.
+            
+        Returns:
+            Tuple[bool, int]: (True, new version) on success, (False, current version)
+            on conflict, (False, -1) on error.
+        """
+        try:
+            payload = {"key": key, "value": value, "expected_version": expected_version}
+            if ttl is not None:
+                payload["ttl"] = ttl
+            resp = self.session.post(f"{self.base_url}/cas", json=payload)
+            if resp.status_code == 409:
+                return False, resp.json()["detail"]["current_version"]
+            resp.raise_for_status()
+            return True, resp.json()["version"]
+        except requests.RequestException:
+            return False, -1
+
+    def transaction(self, checks: Dict[str, int], sets: Optional[List[Tuple[str, Any]]] = None,
+                    deletes: Optional[List[str]] = None) -> Tuple[bool, Dict[str, int]]:
+        """
+        Atomically apply writes if none of the keys read have changed.
+        
+        Args:
+            checks (Dict[str, int]): Keys read by the transaction and the versions seen
+                (0 = key must not exist).
+            sets (List[Tuple[str, Any]], optional): (key, value) pairs to write.
+            deletes (List[str], optional): Keys to delete.
+            
+        Returns:
+            Tuple[bool, Dict[str, int]]: (True, new versions of written keys) on commit,
+            (False, current versions of conflicting keys) on conflict, (False, {}) on error.
+        """
+        try:
+            payload = {"checks": checks, "set": sets or [], "delete": deletes or []}
+            resp = self.session.post(f"{self.base_url}/txn", json=payload)
+            if resp.status_code == 409:
+                return False, resp.json()["detail"]["conflicts"]
+            resp.raise_for_status()
+            return True, resp.json()["versions"]
+        except requests.RequestException:
+            return False, {}
+
+    def watch(self, prefix: str = "", since: Optional[int] = None,
+              timeout: Optional[float] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Tail committed changes instead of polling.
+        
+        Args:
+            prefix (str): Only report keys starting with this prefix.
+            since (int, optional): Resume after this LSN (the "lsn" of the last event
+                processed). By default only changes made from now on are reported.
+            timeout (float, optional): Read timeout in seconds for the stream.
+            
+        Yields:
+            Dict[str, Any]: Change records ({"lsn": ..., "op": "SET", "k": ..., "v": ...},
+            "DEL", "BULK", "IMPORT", "EXPIRE" or "TXN"; IMPORT events carry only the
+            imported "keys", not their values). An "op": "RESET" event means the
+            requested position is no longer available: re-read the keys you track,
+            then watch again with since set to its "lsn".
+            
+        Raises:
+            requests.RequestException: If the stream cannot be opened or breaks.
+        """
+        params: Dict[str, Any] = {"prefix": prefix, "format": "ndjson"}
+        if since is not None:
+            params["since"] = since
+        with self.session.get(f"{self.base_url}/watch", params=params, stream=True, timeout=timeout) as resp:
+            resp.raise_for_status()
+            for line in resp.iter_lines():
+                if line:  # blank lines are keepalives
+                    yield json.loads(line)
+
+    def ttl(self, key: str) -> Optional[float]:
+        """
+        Remaining time to live of a key.
+        
+        Args:
+            key (str): The key.
+            
+        Returns:
+            Optional[float]: Seconds until expiry, or None if the key has no TTL or does not exist.
+        """
+        try:
+            resp = self.session.get(f"{self.base_url}/ttl/{key}")
+            if resp.status_code == 200:
+                return resp.json()["ttl"]
+            return None
+        except requests.RequestException:
+            return None
+
+    def search(self, query: str) -> List[str]:
+        """
+        Full-text search over string values (all clauses must match).
+        
+        Args:
+            query (str): Space separated clauses: words, `prefix*` terms and
+                "quoted phrases" (words in that order, next to each other).
+            
+        Returns:
+            List[str]: Matching keys (empty list on error).
+        """
+        try:
+            resp = self.session.get(f"{self.base_url}/search", params={"q": query})
+            resp.raise_for_status()
+            return resp.json()["keys"]
+        except requests.RequestException:
+            return []
+
+    def vector_search(self, query: str, top_k: int = 5) -> List[str]:
+        """
+        Nearest-neighbour search over value embeddings.
+        
+        Args:
+            query (str): Text to embed and compare against stored values.
+            top_k (int): Number of keys to return.
+            
+        Returns:
+            List[str]: Closest keys, best first (empty list on error).
+        """
+        try:
+            resp = self.session.get(f"{self.base_url}/vector_search", params={"q": query, "top_k": top_k})
+            resp.raise_for_status()
+            return resp.json()["keys"]
+        except requests.RequestException:
+            return []
@@ -0,0 +1,110 @@
+"""
+Admission control for the write path.
+
+Without it, an overloaded node keeps accepting writes: they queue in the
+event loop behind the store lock, fsyncs and per-peer replication, and every
+request gets slower instead of some being turned away. AdmissionControl is an
+ASGI middleware that decides before a write's body is read:
+
+- at most `max_inflight_writes` writes are being handled at once;
+- writes are refused while any peer has more than `max_replication_backlog`
+  replicated records it has not acknowledged yet;
+- writes are refused while the WAL holds more than `max_wal_bytes` not yet
+  covered by a snapshot, and `on_wal_full` is called to start one.
+
+Refused writes get a 429 with Retry-After right away. Heartbeat and vote RPCs
+are never counted or refused, so shedding writes leaves the event loop free
+for them and overload does not turn into spurious elections. Replicated
+records are never refused either: the leader has already committed them.
+A limit of 0 disables that check.
+"""
+import json
+import math
+from typing import Callable, Optional
+
+from src.db.metrics import MetricsRegistry, REGISTRY
+
+# Client routes that write. Reads, /internal/* and admin routes are always admitted.
+WRITE_ROUTES = ("/set", "/bulk", "/cas", "/txn", "/incr", "/append", "/patch", "/merge", "/import")
+WRITE_PREFIXES = ("/delete/",)
+
+
+def is_write(method: str, path: str) -> bool:
+    return (method == "POST" and path in WRITE_ROUTES) or (method == "DELETE" and path.startswith(WRITE_PREFIXES))
+
+
+class AdmissionControl:
+    """
+    ASGI middleware shedding writes with 429 when the node is over its limits.
+
+    Args:
+        app: The wrapped ASGI app.
+        max_inflight_writes (int): Writes handled concurrently (0 = unlimited).
+        max_replication_backlog (int): Unacknowledged records per peer (0 = unlimited).
+        max_wal_bytes (int): WAL bytes since the last snapshot (0 = unlimited).
+        retry_after (float): Seconds suggested to rejected clients.
+        replication_backlog (Callable[[], int]): Current backlog of the most lagging peer.
+        wal_bytes (Callable[[], int]): Current WAL size.
+        on_wal_full (Callable[[], None], optional): Called when the WAL limit rejects a write.
+    """
+
+    def __init__(self, app, max_inflight_writes: int = 0, max_replication_backlog: int = 0,
+                 max_wal_bytes: int = 0, retry_after: float = 1.0,
+                 replication_backlog: Callable[[], int] = lambda: 0,
+                 wal_bytes: Callable[[], int] = lambda: 0,
+                 on_wal_full: Optional[Callable[[], None]] = None,
+                 metrics: Optional[MetricsRegistry] = None):
+        self.app = app
+        self.max_inflight_writes = max_inflight_writes
+        self.max_replication_backlog = max_replication_backlog
+        self.max_wal_bytes = max_wal_bytes
+        self.retry_after = retry_after
+        self.replication_backlog = replication_backlog
+        self.wal_bytes = wal_bytes
+        self.on_wal_full = on_wal_full
+        self.inflight_writes = 0
+
+        m = metrics or REGISTRY
+        self._m_inflight = m.gauge("inflight_writes", "Write requests being handled")
+        self._m_rejected = m.counter("admission_rejected_total", "Writes refused with 429, by reason", ["reason"])
+
+    def _refusal(self) -> Optional[str]:
+        """Why a new write must be refused right now, or None to admit it."""
+        if self.max_inflight_writes and self.inflight_writes >= self.max_inflight_writes:
+            return "inflight"
+        if self.max_replication_backlog and self.replication_backlog() > self.max_replication_backlog:
+            return "replication"
+        if self.max_wal_bytes and self.wal_bytes() > self.max_wal_bytes:
+            if self.on_wal_full is not None:
+                self.on_wal_full()
+            return "wal"
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not is_write(scope["method"], scope["path"]):
+            return await self.app(scope, receive, send)
+        reason = self._refusal()
+        if reason is not None:
+            self._m_rejected.labels(reason).inc()
+            return await self._reject(send, reason)
+
+        self.inflight_writes += 1
+        self._m_inflight.set(self.inflight_writes)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.inflight_writes -= 1
+            self._m_inflight.set(self.inflight_writes)
+
+    async def _reject(self, send, reason: str):
+        detail = {
+            "inflight": "Too many writes in flight",
+            "replication": "Replication backlog too large",
+            "wal": "WAL backlog too large; waiting for a snapshot",
+        }[reason]
+        body = json.dumps({"detail": detail, "reason": reason}).encode("utf-8")
+        await send({"type": "http.response.start", "status": 429, "headers": [
+            (b"content-type", b"application/json"),
+            (b"retry-after", str(max(1, math.ceil(self.retry_after))).encode("latin-1")),
+        ]})
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,376 @@
+"""
+Bitcask-style log-structured hash store.
+
+Keys and the location of their latest value (the "keydir") are kept in
+memory; values live in append-only data files and are read back with a
+single positioned read. This lets KVStore serve datasets much larger than
+RAM: only the keys need to fit.
+
+On-disk record layout (big endian):
+
+    crc32 (4) | key_len (4) | value_len (4) | key | value
+
+value_len == TOMBSTONE marks a deletion. The CRC covers everything after
+it, so a torn write at the tail of the active file is detected and
+truncated on open.
+
+Files are named "<major>_<minor>.data" and always replayed in (major, minor)
+order. A merge (compaction) of files up to N_m is written as N_(m+1): it
+sorts after its inputs and before any newer file, so a crash in the middle
+of deleting the inputs (which happens oldest first) can never resurrect
+stale values. Immutable files get a ".hint" file listing their keys and
+offsets so opening the store does not have to read the values back.
+
+Durability comes from the KVStore WAL: writes here are not fsynced until
+sync() is called, which KVStore does before truncating its WAL.
+"""
+import json
+import logging
+import os
+import struct
+import threading
+import zlib
+from typing import Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+HEADER = struct.Struct(">III")
+TOMBSTONE = 0xFFFFFFFF
+
+FileId = Tuple[int, int]
+# (file id, value offset, value length)
+Location = Tuple[FileId, int, int]
+
+
+def _file_name(fid: FileId, ext: str = "data") -> str:
+    return f"{fid[0]:06d}_{fid[1]}.{ext}"
+
+
+def _parse_file_name(name: str) -> Optional[FileId]:
+    stem, _, ext = name.partition(".")
+    if ext != "data":
+        return None
+    major, _, minor = stem.partition("_")
+    try:
+        return int(major), int(minor or 0)
+    except ValueError:
+        return None
+
+
+class DiskStore:
+    """
+    Dict-like store of str -> bytes backed by append-only files.
+
+    Args:
+        path (str): Directory holding the data and hint files.
+        max_file_bytes (int): Roll over to a new data file past this size.
+        compact_ratio (float): Start a background merge when this fraction of the
+            immutable files is dead (overwritten or deleted) data.
+    """
+
+    def __init__(self, path: str, max_file_bytes: int = 64 * 1024 * 1024, compact_ratio: float = 0.5):
+        self.path = path
+        self.max_file_bytes = max_file_bytes
+        self.compact_ratio = compact_ratio
+
+        self.keydir: Dict[str, Location] = {}
+        self._lock = threading.RLock()
+        self._read_fds: Dict[FileId, int] = {}
+        self._file_bytes: Dict[FileId, int] = {}
+        self._dead_bytes: Dict[FileId, int] = {}
+        self._compacting = False
+        self._compaction_thread: Optional[threading.Thread] = None
+
+        os.makedirs(self.path, exist_ok=True)
+        self._open()
+
+    # --- Opening / recovery ---
+
+    def _data_files(self) -> List[FileId]:
+        ids = [fid for fid in (_parse_file_name(n) for n in os.listdir(self.path)) if fid is not None]
+        return sorted(ids)
+
+    def _open(self):
+        files = self._data_files()
+        for fid in files:
+            if fid != files[-1] and self._load_hint(fid):
+                continue
+            self._scan(fid, truncate=(fid == files[-1]))
+
+        # New writes always go to a fresh file so the ones we just opened stay immutable.
+        self._active_id: FileId = ((files[-1][0] + 1) if files else 1, 0)
+        if files and not os.path.exists(os.path.join(self.path, _file_name(files[-1], "hint"))):
+            self._write_hint(files[-1])
+        self._active = open(os.path.join(self.path, _file_name(self._active_id)), "ab")
+        self._active_offset = self._active.tell()
+        self._file_bytes[self._active_id] = self._active_offset
+        logger.info(f"Opened disk store with {len(self.keydir)} keys in {len(files)} files.")
+
+    def _track(self, key: str, loc: Optional[Location]):
+        """Point `key` at `loc` (None deletes it), accounting the replaced value as dead bytes."""
+        old = self.keydir.pop(key, None) if loc is None else self.keydir.get(key)
+        if old is not None:
+            self._dead_bytes[old[0]] = self._dead_bytes.get(old[0], 0) + HEADER.size + len(key.encode("utf-8")) + old[2]
+        if loc is not None:
+            self.keydir[key] = loc
+
+    def _track_tombstone(self, fid: FileId, key: str):
+        """Tombstones are dead weight as soon as they are written."""
+        self._dead_bytes[fid] = self._dead_bytes.get(fid, 0) + HEADER.size + len(key.encode("utf-8"))
+
+    def _scan(self, fid: FileId, truncate: bool):
+        path = os.path.join(self.path, _file_name(fid))
+        good = 0
+        with open(path, "rb") as f:
+            data = f.read()
+        while good + HEADER.size <= len(data):
+            crc, klen, vlen = HEADER.unpack_from(data, good)
+            body_len = klen + (0 if vlen == TOMBSTONE else vlen)
+            end = good + HEADER.size + body_len
+            if end > len(data) or zlib.crc32(data[good + 4:end]) != crc:
+                break
+            key = data[good + HEADER.size:good + HEADER.size + klen].decode("utf-8")
+            if vlen == TOMBSTONE:
+                self._track(key, None)
+                self._track_tombstone(fid, key)
+            else:
+                self._track(key, (fid, good + HEADER.size + klen, vlen))
+            good = end
+        self._file_bytes[fid] = good
+        if good < len(data):
+            logger.warning(f"Disk store file {_file_name(fid)}: {len(data) - good} trailing bytes are corrupt.")
+            if truncate:
+                with open(path, "r+b") as f:
+                    f.truncate(good)
+
+    def _load_hint(self, fid: FileId) -> bool:
+        path = os.path.join(self.path, _file_name(fid, "hint"))
+        try:
+            with open(path, "r") as f:
+                hint = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return False
+        for key, offset, length in hint["entries"]:
+            if length < 0:
+                self._track(key, None)
+                self._track_tombstone(fid, key)
+            else:
+                self._track(key, (fid, offset, length))
+        self._file_bytes[fid] = hint["size"]
+        return True
+
+    def _write_hint(self, fid: FileId, entries: Optional[List[Tuple[str, int, int]]] = None):
+        """Record the keys of an immutable file. Without `entries`, rebuild them by scanning the file."""
+        if entries is None:
+            entries = []
+            path = os.path.join(self.path, _file_name(fid))
+            with open(path, "rb") as f:
+                data = f.read()
+            pos = 0
+            while pos + HEADER.size <= len(data):
+                _, klen, vlen = HEADER.unpack_from(data, pos)
+                key = data[pos + HEADER.size:pos + HEADER.size + klen].decode("utf-8")
+                offset = pos + HEADER.size + klen
+                entries.append((key, offset, -1 if vlen == TOMBSTONE else vlen))
+                pos = offset + (0 if vlen == TOMBSTONE else vlen)
+        tmp = os.path.join(self.path, _file_name(fid, "hint.tmp"))
+        with open(tmp, "w") as f:
+            json.dump({"size": self._file_bytes.get(fid, 0), "entries": entries}, f)
+        os.replace(tmp, os.path.join(self.path, _file_name(fid, "hint")))
+
+    # --- Reads ---
+
+    def _read_at(self, fid: FileId, offset: int, length: int) -> bytes:
+        if fid == self._active_id:
+            self._active.flush()
+        fd = self._read_fds.get(fid)
+        if fd is None:
+            fd = os.open(os.path.join(self.path, _file_name(fid)), os.O_RDONLY | getattr(os, "O_BINARY", 0))
+            self._read_fds[fid] = fd
+        if hasattr(os, "pread"):
+            return os.pread(fd, length, offset)
+        os.lseek(fd, offset, os.SEEK_SET)
+        return os.read(fd, length)
+
+    def get(self, key: str, default=None) -> Optional[bytes]:
+        with self._lock:
+            loc = self.keydir.get(key)
+            if loc is None:
+                return default
+            return self._read_at(*loc)
+
+    def __getitem__(self, key: str) -> bytes:
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.keydir
+
+    def __len__(self) -> int:
+        return len(self.keydir)
+
+    def keys(self) -> List[str]:
+        with self._lock:
+            return list(self.keydir)
+
+    def items(self) -> Iterator[Tuple[str, bytes]]:
+        """Iterate over (key, value), reading each value from disk."""
+        for key in self.keys():
+            value = self.get(key)
+            if value is not None:
+                yield key, value
+
+    # --- Writes ---
+
+    def _append(self, key: str, value: Optional[bytes]) -> int:
+        kbytes = key.encode("utf-8")
+        body = kbytes + (value or b"")
+        vlen = TOMBSTONE if value is None else len(value)
+        header_tail = HEADER.pack(0, len(kbytes), vlen)[4:]
+        crc = zlib.crc32(header_tail + body)
+        record = HEADER.pack(crc, len(kbytes), vlen) + body
+        offset = self._active_offset
+        self._active.write(record)
+        self._active_offset += len(record)
+        self._file_bytes[self._active_id] = self._active_offset
+        return offset + HEADER.size + len(kbytes)
+
+    def __setitem__(self, key: str, value: bytes):
+        with self._lock:
+            value_offset = self._append(key, value)
+            self._track(key, (self._active_id, value_offset, len(value)))
+            self._maybe_roll()
+
+    def pop(self, key: str, default=None) -> Optional[bytes]:
+        with self._lock:
+            old = self.get(key)
+            if old is None:
+                return default
+            self._append(key, None)
+            self._track(key, None)
+            self._track_tombstone(self._active_id, key)
+            self._maybe_roll()
+            return old
+
+    def __delitem__(self, key: str):
+        if self.pop(key) is None:
+            raise KeyError(key)
+
+    def sync(self):
+        """Flush and fsync the active file."""
+        with self._lock:
+            self._active.flush()
+            os.fsync(self._active.fileno())
+
+    def _maybe_roll(self):
+        if self._active_offset < self.max_file_bytes:
+            return
+        self.sync()
+        self._active.close()
+        sealed = self._active_id
+        self._write_hint(sealed)
+        self._active_id = (sealed[0] + 1, 0)
+        self._active = open(os.path.join(self.path, _file_name(self._active_id)), "ab")
+        self._active_offset = 0
+        self._file_bytes[self._active_id] = 0
+        if self._should_compact():
+            self.compact_in_background()
+
+    # --- Compaction ---
+
+    def dead_ratio(self) -> float:
+        with self._lock:
+            immutable = [fid for fid in self._file_bytes if fid != self._active_id]
+            total = sum(self._file_bytes[f] for f in immutable)
+            dead = sum(self._dead_bytes.get(f, 0) for f in immutable)
+        return dead / total if total else 0.0
+
+    def _should_compact(self) -> bool:
+        return not self._compacting and self.dead_ratio() >= self.compact_ratio
+
+    def compact_in_background(self):
+        with self._lock:
+            if self._compacting:
+                return
+            self._compacting = True
+            self._compaction_thread = threading.Thread(target=self._compact, daemon=True)
+            self._compaction_thread.start()
+
+    def compact(self):
+        """Merge all immutable files now (blocking), after any merge already in flight."""
+        while True:
+            with self._lock:
+                if not self._compacting:
+                    self._compacting = True
+                    break
+                thread = self._compaction_thread
+            thread.join()
+        self._compact()
+
+    def _compact(self):
+        try:
+            with self._lock:
+                inputs = sorted(fid for fid in self._file_bytes if fid != self._active_id)
+                if len(inputs) < 2 and not any(self._dead_bytes.get(f) for f in inputs):
+                    return
+                live = [(k, loc) for k, loc in self.keydir.items() if loc[0] in inputs]
+            out_id = (inputs[-1][0], inputs[-1][1] + 1)
+            out_path = os.path.join(self.path, _file_name(out_id))
+            moved: Dict[str, Tuple[Location, Location]] = {}
+            entries = []
+            offset = 0
+            # Inputs are immutable, so they can be read without holding the lock.
+            with open(out_path + ".tmp", "wb") as out:
+                for key, loc in live:
+                    with self._lock:
+                        value = self._read_at(*loc)
+                    kbytes = key.encode("utf-8")
+                    header_tail = HEADER.pack(0, len(kbytes), len(value))[4:]
+                    crc = zlib.crc32(header_tail + kbytes + value)
+                    out.write(HEADER.pack(crc, len(kbytes), len(value)) + kbytes + value)
+                    value_offset = offset + HEADER.size + len(kbytes)
+                    moved[key] = (loc, (out_id, value_offset, len(value)))
+                    entries.append((key, value_offset, len(value)))
+                    offset = value_offset + len(value)
+                out.flush()
+                os.fsync(out.fileno())
+            os.replace(out_path + ".tmp", out_path)
+
+            with self._lock:
+                self._file_bytes[out_id] = offset
+                self._write_hint(out_id, entries)
+                for key, (old, new) in moved.items():
+                    if self.keydir.get(key) == old:
+                        self.keydir[key] = new
+                    else:  # overwritten or deleted while we were copying
+                        self._dead_bytes[out_id] = self._dead_bytes.get(out_id, 0) + HEADER.size + len(key.encode("utf-8")) + new[2]
+                # Oldest first: see the module docstring.
+                for fid in inputs:
+                    fd = self._read_fds.pop(fid, None)
+                    if fd is not None:
+                        os.close(fd)
+                    self._file_bytes.pop(fid, None)
+                    self._dead_bytes.pop(fid, None)
+                    for ext in ("data", "hint"):
+                        try:
+                            os.remove(os.path.join(self.path, _file_name(fid, ext)))
+                        except FileNotFoundError:
+                            pass
+            logger.info(f"Compacted {len(inputs)} files into {_file_name(out_id)} ({len(entries)} live keys).")
+        except Exception as e:
+            logger.error(f"Disk store compaction failed: {e}")
+        finally:
+            with self._lock:
+                self._compacting = False
+
+    def close(self):
+        if self._compaction_thread is not None:
+            self._compaction_thread.join()
+        with self._lock:
+            self.sync()
+            self._active.close()
+            for fd in self._read_fds.values():
+                os.close(fd)
+            self._read_fds = {}
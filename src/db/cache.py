@@ -0,0 +1,281 @@
+"""
+Size-bounded value caches used in front of KVStore.get.
+
+Capacity is measured in bytes (the caller passes each entry's cost, normally
+the length of its encoded value), not in number of entries. Three eviction
+policies are available:
+
+- "lru": least recently used.
+- "arc": Adaptive Replacement Cache, balancing recency (T1) and frequency
+  (T2) with ghost lists of recently evicted keys; sizes are tracked in bytes.
+- "tinylfu": LRU main space with TinyLFU admission, where a new entry only
+  displaces the LRU victim if a count-min sketch has seen it more often.
+
+Caches are not thread-safe; KVStore only touches them under its own lock.
+"""
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+
+class ValueCache:
+    """Base class: byte accounting and hit/miss/eviction counters."""
+
+    policy = ""
+
+    def __init__(self, capacity_bytes: int):
+        self.capacity = capacity_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.rejections = 0
+
+    def get(self, key: str, default: Any = None) -> Any:
+        raise NotImplementedError
+
+    def put(self, key: str, value: Any, cost: int):
+        raise NotImplementedError
+
+    def invalidate(self, key: str):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "policy": self.policy,
+            "capacity_bytes": self.capacity,
+            "size_bytes": self.size,
+            "entries": len(self),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "rejections": self.rejections,
+        }
+
+
+class LRUCache(ValueCache):
+    policy = "lru"
+
+    def __init__(self, capacity_bytes: int):
+        super().__init__(capacity_bytes)
+        self._entries: "OrderedDict[str, Tuple[Any, int]]" = OrderedDict()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def _evict_one(self) -> Tuple[str, int]:
+        key, (_, cost) = self._entries.popitem(last=False)
+        self.size -= cost
+        self.evictions += 1
+        return key, cost
+
+    def put(self, key: str, value: Any, cost: int):
+        if cost > self.capacity:
+            return
+        self.invalidate(key)
+        while self.size + cost > self.capacity:
+            self._evict_one()
+        self._entries[key] = (value, cost)
+        self.size += cost
+
+    def invalidate(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[1]
+
+    def clear(self):
+        self._entries.clear()
+        self.size = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class ARCCache(ValueCache):
+    policy = "arc"
+
+    def __init__(self, capacity_bytes: int):
+        super().__init__(capacity_bytes)
+        self.p = 0.0  # target size of T1 in bytes
+        self._t1: "OrderedDict[str, Tuple[Any, int]]" = OrderedDict()
+        self._t2: "OrderedDict[str, Tuple[Any, int]]" = OrderedDict()
+        self._b1: "OrderedDict[str, int]" = OrderedDict()  # ghosts: key -> cost
+        self._b2: "OrderedDict[str, int]" = OrderedDict()
+        self._t1_bytes = 0
+        self._b1_bytes = 0
+        self._b2_bytes = 0
+
+    def get(self, key: str, default: Any = None) -> Any:
+        entry = self._t1.pop(key, None)
+        if entry is not None:
+            self._t1_bytes -= entry[1]
+            self._t2[key] = entry  # second hit: promote to the frequency list
+            self.hits += 1
+            return entry[0]
+        entry = self._t2.get(key)
+        if entry is not None:
+            self._t2.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+        self.misses += 1
+        return default
+
+    def _replace(self, in_b2: bool):
+        if self._t1 and (not self._t2 or self._t1_bytes > self.p or (in_b2 and self._t1_bytes >= self.p)):
+            key, (_, cost) = self._t1.popitem(last=False)
+            self._t1_bytes -= cost
+            self._b1[key] = cost
+            self._b1_bytes += cost
+        else:
+            key, (_, cost) = self._t2.popitem(last=False)
+            self._b2[key] = cost
+            self._b2_bytes += cost
+        self.size -= cost
+        self.evictions += 1
+
+    def _trim_ghosts(self):
+        while self._b1 and self._t1_bytes + self._b1_bytes > self.capacity:
+            _, cost = self._b1.popitem(last=False)
+            self._b1_bytes -= cost
+        while self._b2 and self.size + self._b1_bytes + self._b2_bytes > 2 * self.capacity:
+            _, cost = self._b2.popitem(last=False)
+            self._b2_bytes -= cost
+
+    def put(self, key: str, value: Any, cost: int):
+        if cost > self.capacity:
+            return
+        self.invalidate(key)
+        ghost_b1 = self._b1.pop(key, None)
+        ghost_b2 = self._b2.pop(key, None) if ghost_b1 is None else None
+        if ghost_b1 is not None:
+            self._b1_bytes -= ghost_b1
+            # Recently evicted from the recency side: grow it.
+            self.p = min(float(self.capacity), self.p + max(self._b2_bytes / max(self._b1_bytes, 1), 1.0) * cost)
+        elif ghost_b2 is not None:
+            self._b2_bytes -= ghost_b2
+            self.p = max(0.0, self.p - max(self._b1_bytes / max(self._b2_bytes, 1), 1.0) * cost)
+
+        while self.size + cost > self.capacity and (self._t1 or self._t2):
+            self._replace(in_b2=ghost_b2 is not None)
+
+        if ghost_b1 is not None or ghost_b2 is not None:
+            self._t2[key] = (value, cost)
+        else:
+            self._t1[key] = (value, cost)
+            self._t1_bytes += cost
+        self.size += cost
+        self._trim_ghosts()
+
+    def invalidate(self, key: str):
+        entry = self._t1.pop(key, None)
+        if entry is not None:
+            self._t1_bytes -= entry[1]
+        else:
+            entry = self._t2.pop(key, None)
+        if entry is not None:
+            self.size -= entry[1]
+
+    def clear(self):
+        self._t1.clear()
+        self._t2.clear()
+        self._b1.clear()
+        self._b2.clear()
+        self.size = self._t1_bytes = self._b1_bytes = self._b2_bytes = 0
+        self.p = 0.0
+
+    def __len__(self) -> int:
+        return len(self._t1) + len(self._t2)
+
+
+class CountMinSketch:
+    """4-row count-min sketch with periodic halving so old popularity fades."""
+
+    def __init__(self, width: int = 4096, sample_size: Optional[int] = None):
+        self.width = max(16, 1 << (width - 1).bit_length())
+        self.mask = self.width - 1
+        self.rows = [[0] * self.width for _ in range(4)]
+        self.sample_size = sample_size or self.width * 10
+        self.additions = 0
+
+    def _indexes(self, key: str):
+        h = hash(key)
+        for i in range(4):
+            h = (h * 0x9E3779B1 + i) & 0xFFFFFFFFFFFFFFFF
+            yield i, (h >> 16) & self.mask
+
+    def add(self, key: str):
+        for row, idx in self._indexes(key):
+            self.rows[row][idx] += 1
+        self.additions += 1
+        if self.additions >= self.sample_size:
+            for row in self.rows:
+                for i in range(self.width):
+                    row[i] >>= 1
+            self.additions //= 2
+
+    def estimate(self, key: str) -> int:
+        return min(self.rows[row][idx] for row, idx in self._indexes(key))
+
+
+class TinyLFUCache(LRUCache):
+    policy = "tinylfu"
+
+    def __init__(self, capacity_bytes: int, sketch_width: int = 4096):
+        super().__init__(capacity_bytes)
+        self.sketch = CountMinSketch(sketch_width)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        self.sketch.add(key)
+        return super().get(key, default)
+
+    def put(self, key: str, value: Any, cost: int):
+        if cost > self.capacity:
+            return
+        self.invalidate(key)
+        if self.size + cost > self.capacity:
+            # Admission: only displace victims the candidate is more popular than.
+            candidate_freq = self.sketch.estimate(key)
+            freed = 0
+            victims = []
+            for victim, (_, victim_cost) in self._entries.items():
+                if self.size - freed + cost <= self.capacity:
+                    break
+                if self.sketch.estimate(victim) >= candidate_freq:
+                    self.rejections += 1
+                    return
+                victims.append(victim)
+                freed += victim_cost
+            for victim in victims:
+                _, victim_cost = self._entries.pop(victim)
+                self.size -= victim_cost
+                self.evictions += 1
+        self._entries[key] = (value, cost)
+        self.size += cost
+
+
+POLICIES = {
+    "lru": LRUCache,
+    "arc": ARCCache,
+    "tinylfu": TinyLFUCache,
+}
+
+
+def make_cache(policy: str, capacity_bytes: int) -> ValueCache:
+    try:
+        cls = POLICIES[policy]
+    except KeyError:
+        raise ValueError(f"Unknown cache policy '{policy}' (expected one of {', '.join(POLICIES)})")
+    return cls(capacity_bytes)
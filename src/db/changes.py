@@ -0,0 +1,127 @@
+"""
+In-memory change feed for watch/CDC consumers.
+
+KVStore publishes every committed record here together with its log sequence
+number (LSN). The feed keeps the most recent `capacity` records so consumers
+can resume from an LSN after a disconnect; a consumer that fell further behind
+than that gets a reset and must re-read the keys it cares about.
+
+IMPORT records are published as the list of keys they wrote, without values:
+a bulk import would otherwise keep up to `capacity` whole batches in memory.
+
+Records are published under the KVStore lock from whichever thread wrote, while
+watchers are asyncio tasks, so waking them goes through call_soon_threadsafe.
+"""
+import asyncio
+import threading
+from collections import deque
+from itertools import islice
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+
+# Records that change values; others (e.g. INDEX) are not reported to watchers.
+CHANGE_OPS = ("SET", "DEL", "BULK", "IMPORT", "EXPIRE", "TXN")
+
+
+def filter_record(record: Dict[str, Any], prefix: str) -> Optional[Dict[str, Any]]:
+    """The part of `record` touching keys under `prefix`, or None if there is none."""
+    op = record.get("op")
+    if op not in CHANGE_OPS:
+        return None
+    if not prefix:
+        return record
+    if op in ("SET", "DEL"):
+        return record if record["k"].startswith(prefix) else None
+    if op == "BULK":
+        items = [item for item in record["data"] if item[0].startswith(prefix)]
+        return dict(record, data=items) if items else None
+    if op in ("IMPORT", "EXPIRE"):
+        keys = [k for k in record["keys"] if k.startswith(prefix)]
+        return dict(record, keys=keys) if keys else None
+    if op == "TXN":
+        sets = [item for item in record["set"] if item[0].startswith(prefix)]
+        dels = [k for k in record["del"] if k.startswith(prefix)]
+        return {**record, "set": sets, "del": dels} if sets or dels else None
+    return None
+
+
+class _Watcher:
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.event = asyncio.Event()
+
+
+class ChangeFeed:
+    """
+    Bounded, LSN-ordered log of recent committed records.
+
+    Args:
+        capacity (int): Number of records kept for resuming watchers.
+    """
+
+    def __init__(self, capacity: int = 10000):
+        self.capacity = capacity
+        self._records: "deque[Tuple[int, Dict[str, Any]]]" = deque(maxlen=capacity)
+        self._watchers: Set[_Watcher] = set()
+        self._lock = threading.Lock()
+        self.last_lsn = 0
+
+    def publish(self, lsn: int, record: Dict[str, Any]):
+        with self._lock:
+            if lsn != self.last_lsn + 1:
+                self._records.clear()  # keep the buffer contiguous; older readers get a reset
+            self._records.append((lsn, record))
+            self.last_lsn = lsn
+            watchers = list(self._watchers)
+        for w in watchers:
+            w.loop.call_soon_threadsafe(w.event.set)
+
+    def reset(self, lsn: int):
+        """Forget buffered records (state was replaced wholesale, e.g. by a snapshot load)."""
+        with self._lock:
+            self._records.clear()
+            self.last_lsn = lsn
+
+    def read(self, after_lsn: int, limit: int = 1000) -> Tuple[Optional[List[Tuple[int, Dict[str, Any]]]], int]:
+        """
+        Records with an LSN greater than `after_lsn`, oldest first.
+
+        Returns (records, last_lsn). `records` is None if the requested position
+        is not in the buffer (dropped already, or unknown to this log).
+        """
+        with self._lock:
+            if after_lsn == self.last_lsn:
+                return [], self.last_lsn
+            if after_lsn > self.last_lsn:
+                return None, self.last_lsn  # e.g. an LSN from another node's log
+            first_lsn = self._records[0][0] if self._records else self.last_lsn + 1
+            if after_lsn < first_lsn - 1:
+                return None, self.last_lsn
+            # LSNs in the buffer are contiguous, so the position is arithmetic.
+            start = after_lsn - first_lsn + 1
+            return list(islice(self._records, start, start + limit)), self.last_lsn
+
+    def subscribe(self) -> _Watcher:
+        watcher = _Watcher(asyncio.get_running_loop())
+        with self._lock:
+            self._watchers.add(watcher)
+        return watcher
+
+    def unsubscribe(self, watcher: _Watcher):
+        with self._lock:
+            self._watchers.discard(watcher)
+
+    @property
+    def watchers(self) -> int:
+        return len(self._watchers)
+
+    async def wait(self, watcher: _Watcher, after_lsn: int, timeout: float) -> bool:
+        """Wait until a record newer than `after_lsn` is published; False on timeout."""
+        watcher.event.clear()
+        if self.last_lsn > after_lsn:
+            return True
+        try:
+            await asyncio.wait_for(watcher.event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
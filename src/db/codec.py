@@ -0,0 +1,114 @@
+"""
+Compact value encoding for KVStore.
+
+Values are stored as bytes with a one-byte header describing how the payload
+was produced, so the format can change per value (e.g. only large values are
+compressed) and stores written with one setting stay readable with another:
+
+    bit 0x01: payload is msgpack (otherwise UTF-8 JSON)
+    bit 0x02: payload is zlib-compressed
+    bit 0x04: payload is zstd-compressed
+
+msgpack and zstandard are optional dependencies; asking for them when they
+are not installed raises at construction time.
+"""
+import json
+import sys
+import zlib
+from typing import Any, Optional
+
+try:
+    import msgpack
+except ImportError:  # optional
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:  # optional
+    zstandard = None
+
+FLAG_MSGPACK = 0x01
+FLAG_ZLIB = 0x02
+FLAG_ZSTD = 0x04
+
+ENCODINGS = ("object", "json", "msgpack")
+COMPRESSIONS = ("none", "zlib", "zstd")
+
+
+class ValueCodec:
+    """
+    Encodes values to compact bytes and back.
+
+    Args:
+        encoding (str): "json" or "msgpack".
+        compression (str): "none", "zlib" or "zstd".
+        compress_threshold (int): Only payloads at least this many bytes are compressed.
+    """
+
+    def __init__(self, encoding: str = "json", compression: str = "zlib", compress_threshold: int = 1024):
+        if encoding not in ("json", "msgpack"):
+            raise ValueError(f"Unknown value encoding '{encoding}'")
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"Unknown compression '{compression}'")
+        if encoding == "msgpack" and msgpack is None:
+            raise RuntimeError("msgpack encoding requested but the 'msgpack' package is not installed")
+        if compression == "zstd" and zstandard is None:
+            raise RuntimeError("zstd compression requested but the 'zstandard' package is not installed")
+
+        self.encoding = encoding
+        self.compression = compression
+        self.compress_threshold = compress_threshold
+        self._zstd_c = zstandard.ZstdCompressor() if compression == "zstd" else None
+        self._zstd_d = zstandard.ZstdDecompressor() if zstandard is not None else None
+
+    def encode(self, value: Any) -> bytes:
+        if self.encoding == "msgpack":
+            flags = FLAG_MSGPACK
+            payload = msgpack.packb(value, use_bin_type=True)
+        else:
+            flags = 0
+            payload = json.dumps(value, separators=(",", ":")).encode("utf-8")
+
+        if self.compression != "none" and len(payload) >= self.compress_threshold:
+            if self.compression == "zlib":
+                packed, flag = zlib.compress(payload), FLAG_ZLIB
+            else:
+                packed, flag = self._zstd_c.compress(payload), FLAG_ZSTD
+            if len(packed) < len(payload):
+                flags |= flag
+                payload = packed
+
+        return bytes((flags,)) + payload
+
+    def decode(self, data: bytes) -> Any:
+        flags = data[0]
+        payload = memoryview(data)[1:]
+        if flags & FLAG_ZLIB:
+            payload = zlib.decompress(payload)
+        elif flags & FLAG_ZSTD:
+            if self._zstd_d is None:
+                raise RuntimeError("zstd-compressed value found but the 'zstandard' package is not installed")
+            payload = self._zstd_d.decompress(payload)
+        if flags & FLAG_MSGPACK:
+            if msgpack is None:
+                raise RuntimeError("msgpack value found but the 'msgpack' package is not installed")
+            return msgpack.unpackb(payload, raw=False)
+        return json.loads(bytes(payload))
+
+    def raw_json(self, data: bytes) -> Optional[bytes]:
+        """The JSON text of an encoded value if it is stored uncompressed as JSON, else None."""
+        if data[0] == 0:
+            return data[1:]
+        return None
+
+
+def deep_sizeof(obj: Any) -> int:
+    """Approximate memory footprint of a JSON-like object, including its contents."""
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for k, v in obj.items():
+            size += deep_sizeof(k) + deep_sizeof(v)
+    elif isinstance(obj, (list, tuple)):
+        for item in obj:
+            size += deep_sizeof(item)
+    return size
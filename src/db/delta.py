@@ -0,0 +1,117 @@
+"""
+Server-side partial updates, logged as compact delta records.
+
+Instead of rewriting a whole value, the WAL and replication stream carry only
+the change, and every node re-applies it to its own copy:
+
+    {"op": "INCR",   "k": key, "by": 5}
+    {"op": "APPEND", "k": key, "v": "tail"}              # string concat / list append
+    {"op": "PATCH",  "k": key, "path": ["a", "0"], "v": x}  # set one JSON location
+    {"op": "MERGE",  "k": key, "v": {"a": null, "b": 1}}  # RFC 7396 merge patch
+
+apply_delta() is a pure function of (current value, record), so leader,
+followers and WAL replay all arrive at the same result. It never mutates
+`current`: containers along a patched path are shallow-copied, because in
+"object" encoding the stored value is shared with readers.
+"""
+from typing import Any, Dict, List
+
+DELTA_OPS = ("INCR", "APPEND", "PATCH", "MERGE")
+
+
+class DeltaError(ValueError):
+    """A delta cannot be applied to the current value (e.g. INCR on a string)."""
+
+
+def parse_pointer(pointer: str) -> List[str]:
+    """Split an RFC 6901 JSON Pointer ("/a/b/0") into unescaped reference tokens."""
+    if pointer == "":
+        return []
+    if not pointer.startswith("/"):
+        raise DeltaError(f"JSON pointer must start with '/': {pointer!r}")
+    return [t.replace("~1", "/").replace("~0", "~") for t in pointer[1:].split("/")]
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _incr(current: Any, by: Any) -> Any:
+    if not _is_number(by):
+        raise DeltaError("increment must be a number")
+    if current is None:
+        current = 0
+    elif not _is_number(current):
+        raise DeltaError("value is not a number")
+    return current + by
+
+
+def _append(current: Any, item: Any) -> Any:
+    if current is None:
+        return item if isinstance(item, str) else [item]
+    if isinstance(current, str):
+        if not isinstance(item, str):
+            raise DeltaError("can only append a string to a string value")
+        return current + item
+    if isinstance(current, list):
+        return current + [item]
+    raise DeltaError("value is not a string or list")
+
+
+def _list_index(container: list, token: str, for_insert: bool) -> int:
+    if token == "-" and for_insert:
+        return len(container)
+    if not token.isdigit() or (len(token) > 1 and token[0] == "0"):
+        raise DeltaError(f"invalid list index {token!r}")
+    index = int(token)
+    if index > len(container) or (index == len(container) and not for_insert):
+        raise DeltaError(f"list index {index} out of range")
+    return index
+
+
+def _patch(current: Any, path: List[str], value: Any) -> Any:
+    if not path:
+        return value
+    token, rest = path[0], path[1:]
+    if current is None:
+        current = {}
+    if isinstance(current, dict):
+        updated = dict(current)
+        updated[token] = _patch(current.get(token), rest, value)
+        return updated
+    if isinstance(current, list):
+        index = _list_index(current, token, for_insert=not rest)
+        updated = list(current)
+        if index == len(updated):
+            updated.append(_patch(None, rest, value))
+        else:
+            updated[index] = _patch(updated[index], rest, value)
+        return updated
+    raise DeltaError(f"cannot descend into a {type(current).__name__} at {token!r}")
+
+
+def merge_patch(current: Any, patch: Any) -> Any:
+    """RFC 7396 JSON Merge Patch: objects merge recursively, null removes a member."""
+    if not isinstance(patch, dict):
+        return patch
+    updated = dict(current) if isinstance(current, dict) else {}
+    for k, v in patch.items():
+        if v is None:
+            updated.pop(k, None)
+        else:
+            updated[k] = merge_patch(updated.get(k), v)
+    return updated
+
+
+def apply_delta(current: Any, record: Dict[str, Any]) -> Any:
+    """New value of a key after applying delta `record` to `current` (None = absent)."""
+    op = record["op"]
+    if op == "INCR":
+        return _incr(current, record.get("by", 1))
+    if op == "APPEND":
+        return _append(current, record["v"])
+    if op == "PATCH":
+        return _patch(current, record["path"], record["v"])
+    if op == "MERGE":
+        return merge_patch(current, record["v"])
+    raise DeltaError(f"unknown delta op {op!r}")
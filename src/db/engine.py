@@ -1,48 +1,276 @@
 import os
+import sys
 import json
+import heapq
 import threading
 import time
-from typing import Optional, List, Tuple, Dict, Any
+from contextlib import contextmanager
+from typing import Optional, Iterable, Iterator, List, Tuple, Dict, Any
 import logging
+from src.db import tracing
+from src.db.bitcask import DiskStore
+from src.db.changes import ChangeFeed
+from src.db.cache import ValueCache, make_cache
+from src.db.codec import ValueCodec, deep_sizeof
+from src.db.delta import DELTA_OPS, DeltaError, apply_delta
 from src.db.indexes import IndexManager
+from src.db.metrics import MetricsRegistry, REGISTRY, SIZE_BUCKETS
 
 logger = logging.getLogger(__name__)
 
+_MISSING = object()
+
+# Snapshots are written as {SNAPSHOT_MARKER: SNAPSHOT_VERSION, "meta": {...}, "data": {...}}.
+# Older snapshots are a bare {key: value} object and are still accepted.
+SNAPSHOT_MARKER = "__kvstore_snapshot__"
+SNAPSHOT_VERSION = 2
+# Version reported for keys restored from snapshots that predate per-key versions.
+_LEGACY_VERSION = 1
+
+def _record_keys(record: Dict[str, Any]) -> Optional[List[str]]:
+    """Keys whose value a record changes, or None if the record shape is unknown."""
+    op = record.get("op")
+    if op in ("SET", "DEL") or op in DELTA_OPS:
+        return [record["k"]]
+    if op in ("BULK", "IMPORT"):
+        return [item[0] for item in record.get("data", [])]
+    if op == "EXPIRE":
+        return list(record.get("keys", []))
+    if op == "TXN":
+        return [item[0] for item in record.get("set", [])] + list(record.get("del", []))
+    if op == "INDEX":
+        return []
+    return None
+
+
+def _record_size(record: Dict[str, Any]) -> int:
+    """Number of key operations carried by a WAL record."""
+    op = record.get("op")
+    if op in ("BULK", "IMPORT"):
+        return len(record["data"])
+    if op == "EXPIRE":
+        return len(record["keys"])
+    if op == "TXN":
+        return len(record["set"]) + len(record["del"])
+    return 1
+
+
 class KVStore:
-    def __init__(self, data_dir: str = "data", wal_file: str = "wal.log", snapshot_file: str = "db.snapshot"):
+    """
+    In-memory key-value store backed by a WAL and snapshots.
+
+    By default values are kept as the Python objects parsed from JSON
+    (value_encoding="object"). With value_encoding="json" or "msgpack" they
+    are kept as compact encoded bytes instead (optionally compressed above
+    compress_threshold bytes) and decoded on every read, trading CPU on
+    get() for a much smaller memory footprint per key.
+
+    With storage="disk" values live in a Bitcask-style log on disk (see
+    src/db/bitcask.py) and only keys are kept in memory, so the dataset can
+    be much larger than RAM. Disk storage always uses an encoded value
+    format (JSON unless value_encoding says otherwise).
+
+    When values are encoded (or on disk), cache_bytes > 0 puts a byte-bounded
+    cache of decoded values in front of get(), evicting with cache_policy
+    ("lru", "arc" or "tinylfu"). Every applied record invalidates the keys it
+    touches, so leader writes and replicated writes keep the cache coherent.
+
+    Keys can carry an absolute expiry time (expire_at, epoch seconds). Expired
+    keys are hidden from reads immediately and physically removed by
+    reap_expired(), which deletes them in batches as a single EXPIRE record.
+
+    Every applied record advances a log sequence number (LSN). A key's
+    version is the LSN of the record that last wrote it (0 = absent), which
+    gives compare_and_set() and transact() optimistic concurrency control
+    without ABA problems when a key is deleted and recreated.
+
+    Committed records are also published with their LSN to `changes`, a
+    bounded ChangeFeed (change_log_size records, 0 disables it) that watch
+    consumers tail and resume from. Delta records are published as the SET
+    they resulted in, so consumers never need the previous value.
+
+    Bulk loads go through import_batch(), whose IMPORT records skip index
+    maintenance, and finish_import(), whose INDEX record indexes everything
+    imported in one pass. export() streams a point-in-time dump in chunks,
+    taking the lock per chunk rather than for the whole keyspace.
+
+    Snapshots also persist the search indexes (<data_dir>/index, tagged with
+    the snapshot's LSN). Recovery loads them when they match the snapshot and
+    replays the WAL on top; otherwise it replays the WAL without indexing and
+    rebuilds the indexes from the recovered data in one bulk pass.
+    `stopwords` are left out of the full-text index (see IndexManager), and
+    vector_index=False skips the vector index (and importing numpy).
+
+    The constructor recovers the store unless recover=False, in which case
+    the caller runs load() itself (the server does, in the background).
+    `recovery` reports its phase and progress meanwhile.
+    """
+
+    def __init__(self, data_dir: str = "data", wal_file: str = "wal.log", snapshot_file: str = "db.snapshot",
+                 metrics: Optional[MetricsRegistry] = None, value_encoding: str = "object",
+                 compression: str = "zlib", compress_threshold: int = 1024, storage: str = "memory",
+                 disk_file_bytes: int = 64 * 1024 * 1024, cache_bytes: int = 0, cache_policy: str = "lru",
+                 change_log_size: int = 10000, stopwords: Optional[Iterable[str]] = None,
+                 vector_index: bool = True, recover: bool = True):
         self.data_dir = data_dir
         self.wal_path = os.path.join(data_dir, wal_file)
         self.snapshot_path = os.path.join(data_dir, snapshot_file)
         
+        if storage not in ("memory", "disk"):
+            raise ValueError(f"Unknown storage '{storage}'")
+        if storage == "disk" and value_encoding == "object":
+            value_encoding = "json"
+        self.storage = storage
+        self.value_encoding = value_encoding
+        self.codec: Optional[ValueCodec] = None
+        if value_encoding != "object":
+            self.codec = ValueCodec(value_encoding, compression, compress_threshold)
+
         self._data: Dict[str, Any] = {}
-        self.indexer = IndexManager()
+        if storage == "disk":
+            self._data = DiskStore(os.path.join(data_dir, "bitcask"), max_file_bytes=disk_file_bytes)
+        self.indexer = IndexManager(stopwords, vectors=vector_index)
+        self.index_dir = os.path.join(data_dir, "index")
+        # Set while recovery defers indexing to one rebuild at the end (see load()).
+        self._index_deferred = False
+        # Bytes in the WAL, i.e. written since the last snapshot
+        self.wal_size = 0
+        # Progress of load(), read without the lock while it runs (see load()).
+        self.recovery: Dict[str, Any] = {"phase": "pending"}
         self._lock = threading.RLock()
+        # Serializes create_snapshot() calls, which only take _lock for parts of their work.
+        self._snapshot_lock = threading.Lock()
+
+        # Caching decoded values only pays off when reads have to decode (or hit the disk).
+        self.cache: Optional[ValueCache] = None
+        if cache_bytes > 0 and self.codec is not None:
+            self.cache = make_cache(cache_policy, cache_bytes)
+        # Log sequence number: bumped by every applied record. Also lets get() detect
+        # writes that raced its decode.
+        self._lsn = 0
+        # key -> LSN of the record that last wrote it
+        self._versions: Dict[str, int] = {}
+        self.changes: Optional[ChangeFeed] = ChangeFeed(change_log_size) if change_log_size > 0 else None
+        # Keys written by IMPORT records and not yet indexed (see finish_import()).
+        self._unindexed: List[str] = []
+        # Running export() calls: each collects the value a key had when the export
+        # started, the first time a record changes it (see _save_for_exports()).
+        self._exports: List[Dict[str, Tuple[Any, Optional[float]]]] = []
+
+        # Key expiry: key -> epoch seconds, plus a min-heap of (expiry, key) for the reaper.
+        # Heap entries are not removed when a key is rewritten or deleted; stale ones are
+        # skipped, and _set_expiry() rebuilds the heap when they dominate.
+        self._expiry: Dict[str, float] = {}
+        self._expiry_heap: List[Tuple[float, str]] = []
+        self.meta_path = self.snapshot_path + ".meta"
+
+        self.metrics = metrics or REGISTRY
+        self._init_metrics()
         
         # Ensure data directory exists
         os.makedirs(self.data_dir, exist_ok=True)
         
-        self.load()
+        if recover:
+            self.load()
 
-    def load(self):
-        """Recover state from snapshot and WAL."""
+    def _init_metrics(self):
+        m = self.metrics
+        self._m_lock_wait = m.histogram("lock_wait_seconds", "Time spent waiting to acquire the store lock")
+        self._m_wal_append = m.histogram("wal_append_seconds", "Time to write one WAL record, including fsync")
+        self._m_wal_fsync = m.histogram("wal_fsync_seconds", "Time spent in flush + fsync of the WAL")
+        self._m_wal_batch = m.histogram("wal_batch_records", "Key/value operations carried by one WAL write", buckets=SIZE_BUCKETS)
+        self._m_wal_bytes = m.counter("wal_bytes_total", "Bytes appended to the WAL")
+        self._m_wal_errors = m.counter("wal_errors_total", "Failed WAL writes")
+        self._m_index_update = m.histogram("index_update_seconds", "Time spent updating indexes for one key")
+        self._m_snapshot = m.histogram("snapshot_seconds", "Duration of snapshot creation")
+        self._m_cache_hits = m.counter("cache_hits_total", "Value cache hits")
+        self._m_cache_misses = m.counter("cache_misses_total", "Value cache misses")
+        self._m_cache_evictions = m.counter("cache_evictions_total", "Value cache evictions")
+        self._m_cache_bytes = m.gauge("cache_bytes", "Bytes held by the value cache")
+        self._m_expired = m.counter("keys_expired_total", "Keys removed by the expiry reaper")
+        self._m_recovery = m.gauge("recovery_seconds", "Duration of the last snapshot load + WAL replay")
+        self._m_replayed = m.counter("wal_replayed_records_total", "WAL records replayed during recovery")
+
+    @contextmanager
+    def _locked(self):
+        """Acquire the store lock, recording how long we waited for it."""
+        t0 = time.perf_counter()
         with self._lock:
+            waited = time.perf_counter() - t0
+            self._m_lock_wait.observe(waited)
+            tracing.add_time("engine.lock_wait", waited)
+            yield
+
+    @property
+    def ready(self) -> bool:
+        """Whether load() has finished."""
+        return self.recovery["phase"] == "done"
+
+    def load(self):
+        """
+        Recover state from snapshot and WAL.
+
+        `recovery` goes through the phases "snapshot", "index" (loading the
+        persisted indexes), "wal" (with bytes and records replayed so far),
+        "index" again if they must be rebuilt, and "done".
+        """
+        t0 = time.perf_counter()
+        progress = self.recovery = {"phase": "snapshot", "wal_bytes": 0, "wal_bytes_replayed": 0,
+                                    "records_replayed": 0}
+        with self._locked():
+            restored = False
             # 1. Load Snapshot if exists
             if os.path.exists(self.snapshot_path):
                 try:
                     with open(self.snapshot_path, "r") as f:
-                        self._data = json.load(f)
-                        logger.info(f"Loaded snapshot with {len(self._data)} keys.")
+                        snapshot, meta = self._unwrap_snapshot(json.load(f))
+                    self._restore_meta(meta)
+                    if self.storage == "disk":
+                        self._import_snapshot(snapshot)
+                    elif self.codec is not None:
+                        self._data = {k: self.codec.encode(v) for k, v in snapshot.items()}
+                    else:
+                        self._data = snapshot
+                    restored = True
+                    logger.info(f"Loaded snapshot with {len(snapshot)} keys.")
                 except (json.JSONDecodeError, OSError) as e:
                     logger.error(f"Failed to load snapshot: {e}")
-                    self._data = {}
+                    if self.storage == "memory":
+                        self._data = {}
+            elif self.storage == "disk" and os.path.exists(self.meta_path):
+                try:
+                    with open(self.meta_path, "r") as f:
+                        self._restore_meta(json.load(f))
+                    restored = True
+                except (json.JSONDecodeError, OSError) as e:
+                    logger.error(f"Failed to load snapshot metadata: {e}")
+
+            # Indexes persisted with the snapshot spare re-indexing it; without them,
+            # index once after the WAL replay instead of once per replayed write.
+            # Disk storage already holds the writes the WAL is about to replay, so
+            # updating its persisted index from them would diff each value against
+            # itself: rebuild unless the WAL is empty.
+            progress["phase"] = "index"
+            wal_pending = os.path.exists(self.wal_path) and os.path.getsize(self.wal_path) > 0
+            usable = restored and not (self.storage == "disk" and wal_pending)
+            self._index_deferred = not (usable and self._load_index())
 
             # 2. Replay WAL
+            progress["phase"] = "wal"
             if os.path.exists(self.wal_path):
+                self.wal_size = progress["wal_bytes"] = os.path.getsize(self.wal_path)
                 valid_entries = 0
                 corrupt_entries = 0
+                replayed_bytes = 0
+                report_at = 0
                 try:
-                    with open(self.wal_path, "r") as f:
+                    with open(self.wal_path, "rb") as f:
                         for line in f:
+                            replayed_bytes += len(line)
+                            if replayed_bytes >= report_at:  # every MB
+                                progress["wal_bytes_replayed"] = replayed_bytes
+                                progress["records_replayed"] = valid_entries
+                                report_at = replayed_bytes + (1 << 20)
                             line = line.strip()
                             if not line:
                                 continue
@@ -50,53 +278,343 @@ class KVStore:
                                 record = json.loads(line)
                                 self._apply_record(record)
                                 valid_entries += 1
-                            except json.JSONDecodeError:
+                            except DeltaError as e:
+                                # Only possible if the log diverged from the leader's; keep going.
+                                corrupt_entries += 1
+                                logger.warning(f"Skipping WAL delta that no longer applies: {e}")
+                            except (json.JSONDecodeError, UnicodeDecodeError):
                                 corrupt_entries += 1
                                 # Logic: Stop or Skip? Usually stop if strict, but for simple app, maybe skip or just assume tail corruption.
                                 logger.warning("Corrupt WAL entry found, ignoring.")
+                    self._m_replayed.inc(valid_entries)
+                    progress["wal_bytes_replayed"] = replayed_bytes
+                    progress["records_replayed"] = valid_entries
                     logger.info(f"Replayed WAL: {valid_entries} valid, {corrupt_entries} corrupt.")
                 except Exception as e:
                      logger.error(f"Error reading WAL: {e}")
 
-    def _apply_record(self, record: Dict[str, Any]):
-        """Apply a single record to the in-memory store."""
+            progress["phase"] = "index"
+            if self._index_deferred:
+                self._index_deferred = False
+                self._unindexed = []
+                self._rebuild_index()
+            elif self._unindexed:
+                logger.warning(f"WAL ends inside a bulk import; indexing its {len(self._unindexed)} keys now.")
+                self._index_pending()
+        elapsed = time.perf_counter() - t0
+        self._m_recovery.set(elapsed)
+        progress["seconds"] = round(elapsed, 3)
+        progress["phase"] = "done"
+
+    @staticmethod
+    def _unwrap_snapshot(snapshot: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """Split a snapshot into (data, meta), accepting the legacy bare-dict format."""
+        if snapshot.get(SNAPSHOT_MARKER) == SNAPSHOT_VERSION:
+            return snapshot["data"], snapshot.get("meta", {})
+        return snapshot, {}
+
+    def _snapshot_meta(self) -> Dict[str, Any]:
+        """State besides the key/value pairs that must survive WAL truncation (copied)."""
+        return {"expiry": dict(self._expiry), "lsn": self._lsn, "versions": dict(self._versions)}
+
+    def _restore_meta(self, meta: Dict[str, Any]):
+        # Snapshots from before versioning: their keys report _LEGACY_VERSION, so
+        # start the sequence there to keep later versions distinct from it.
+        self._lsn = meta.get("lsn", _LEGACY_VERSION)
+        self._versions = dict(meta.get("versions", {}))
+        self._expiry = dict(meta.get("expiry", {}))
+        self._expiry_heap = [(exp, k) for k, exp in self._expiry.items()]
+        heapq.heapify(self._expiry_heap)
+        if self.changes is not None:
+            self.changes.reset(self._lsn)
+
+    def _import_snapshot(self, snapshot: Dict[str, Any]):
+        """Move a JSON snapshot (e.g. written in memory mode) into the disk store, then drop the file."""
+        for k, v in snapshot.items():
+            self._data[k] = self.codec.encode(v)
+        self._data.sync()
+        self._write_meta()
+        os.remove(self.snapshot_path)
+
+    def _apply_record(self, record: Dict[str, Any], computed: Any = _MISSING) -> Dict[str, Any]:
+        """
+        Apply a single record to the in-memory store.
+
+        `computed` lets the leader pass the result of a delta record it has
+        already evaluated while validating it, instead of evaluating it twice.
+
+        Returns the record to write to the WAL: `record` itself, except that
+        disk storage logs a delta as the SET it resolved to (see update()).
+        """
+        with tracing.span("engine.apply"):
+            return self._apply_op(record, computed)
+
+    def _apply_op(self, record: Dict[str, Any], computed: Any = _MISSING):
         op = record.get("op")
+        # The form of the record reported to watchers (see self.changes).
+        published = record
+        self._lsn += 1
+        if self._exports:
+            self._save_for_exports(record)
+        if self.cache is not None:
+            self._invalidate_cached(record)
         if op == "SET":
             k, v = record["k"], record["v"]
-            old_v = self._data.get(k)
-            self._data[k] = v
-            self.indexer.update(k, v, old_v)
+            old_v = self._decode(self._data.get(k))
+            self._data[k] = self._encode(v)
+            self._versions[k] = self._lsn
+            self._set_expiry(k, record.get("exp"))
+            self._index_update(k, v, old_v)
         elif op == "DEL":
-            k = record["k"]
-            old_v = self._data.get(k)
-            self._data.pop(k, None)
-            self.indexer.remove(k, old_v)
+            self._remove_key(record["k"])
         elif op == "BULK":
+            exp = record.get("exp")
             for k, v in record.get("data", []):
-                old_v = self._data.get(k)
-                self._data[k] = v
-                self.indexer.update(k, v, old_v)
+                old_v = self._decode(self._data.get(k))
+                self._data[k] = self._encode(v)
+                self._versions[k] = self._lsn
+                self._set_expiry(k, exp)
+                self._index_update(k, v, old_v)
+        elif op == "EXPIRE":
+            for k in record.get("keys", []):
+                self._remove_key(k)
+        elif op == "TXN":
+            for k, v in record.get("set", []):
+                old_v = self._decode(self._data.get(k))
+                self._data[k] = self._encode(v)
+                self._versions[k] = self._lsn
+                self._set_expiry(k, None)
+                self._index_update(k, v, old_v)
+            for k in record.get("del", []):
+                self._remove_key(k)
+        elif op == "IMPORT":
+            # Index maintenance is deferred to the INDEX record that ends the import;
+            # only entries of overwritten values are dropped now.
+            exps = record.get("exp", {})
+            for k, v in record["data"]:
+                if k in self._data:
+                    self._index_remove(k, self._decode(self._data[k]))
+                self._data[k] = self._encode(v)
+                self._versions[k] = self._lsn
+                self._set_expiry(k, exps.get(k))
+                self._unindexed.append(k)
+            if self.changes is not None:
+                # Imports can be large: watchers only get the keys (see ChangeFeed).
+                published = {"op": "IMPORT", "keys": [k for k, _ in record["data"]]}
+        elif op == "INDEX":
+            self._index_pending()
+        elif op in DELTA_OPS:
+            # Deltas keep the key's expiry, like any in-place update.
+            k = record["k"]
+            old_v = self._decode(self._data.get(k))
+            v = apply_delta(old_v, record) if computed is _MISSING else computed
+            self._data[k] = self._encode(v)
+            self._versions[k] = self._lsn
+            self._index_update(k, v, old_v)
+            if self.changes is not None or self.storage == "disk":
+                # Watchers get the resulting value; disk storage also logs it (see update()).
+                published = self._delta_as_set(k, v)
+                if self.storage == "disk":
+                    record = published
+
+        if self.changes is not None:
+            self.changes.publish(self._lsn, published)
+        return record
+
+    def _delta_as_set(self, k: str, v: Any) -> Dict[str, Any]:
+        """The SET record equivalent to a delta that left `k` at `v`, keeping its expiry."""
+        record = {"op": "SET", "k": k, "v": v}
+        if k in self._expiry:
+            record["exp"] = self._expiry[k]
+        return record
+
+    def _remove_key(self, k: str):
+        old_v = self._decode(self._data.pop(k, None))
+        self._expiry.pop(k, None)
+        self._versions.pop(k, None)
+        self._index_remove(k, old_v)
 
-    def _append_wal(self, record: Dict[str, Any], sync: bool = True):
-        """Append record to WAL and fsync."""
+    def _set_expiry(self, k: str, exp: Optional[float]):
+        """A write without an expiry clears any previous one."""
+        if exp is None:
+            if self._expiry:
+                self._expiry.pop(k, None)
+            return
+        self._expiry[k] = exp
+        heapq.heappush(self._expiry_heap, (exp, k))
+        # Rewrites leave stale heap entries behind. Rebuilding here rather than in
+        # reap_expired() also bounds the heap on followers, which never reap.
+        if len(self._expiry_heap) > 2 * len(self._expiry) + 1024:
+            self._expiry_heap = [(e, key) for key, e in self._expiry.items()]
+            heapq.heapify(self._expiry_heap)
+
+    def _is_expired(self, k: str, now: Optional[float] = None) -> bool:
+        exp = self._expiry.get(k)
+        return exp is not None and exp <= (now or time.time())
+
+    def _invalidate_cached(self, record: Dict[str, Any]):
+        keys = _record_keys(record)
+        if keys is None:
+            self.cache.clear()  # unknown record shape: be safe
+            return
+        for k in keys:
+            self.cache.invalidate(k)
+
+    def _save_for_exports(self, record: Dict[str, Any]):
+        """Before a record changes keys, remember their current state for running exports."""
+        keys = _record_keys(record) or []
+        for saved in self._exports:
+            for k in keys:
+                if k not in saved:
+                    saved[k] = (self._data[k] if k in self._data else _MISSING, self._expiry.get(k))
+
+    def _index_pending(self):
+        """Index the values written by IMPORT records since the last INDEX record."""
+        t0 = time.perf_counter()
+        keys = dict.fromkeys(self._unindexed)  # a key may have been imported more than once
+        self._unindexed = []
+        if self._index_deferred:
+            return
+        for k in keys:
+            if k in self._data:
+                self.indexer.update(k, self._decode(self._data[k]))
+        elapsed = time.perf_counter() - t0
+        tracing.add_time("index.update", elapsed)
+        logger.info(f"Indexed {len(keys)} imported keys in {elapsed:.2f}s.")
+
+    def _encode(self, value: Any) -> Any:
+        """Convert a value to its stored representation."""
+        if self.codec is None:
+            return value
+        return self.codec.encode(value)
+
+    def _decode(self, stored: Any) -> Any:
+        """Convert a stored representation back to the value."""
+        if self.codec is None or stored is None:
+            return stored
+        return self.codec.decode(stored)
+
+    def _index_update(self, key: str, value: Any, old_value: Any):
+        if self._index_deferred:
+            return
+        t0 = time.perf_counter()
+        self.indexer.update(key, value, old_value)
+        elapsed = time.perf_counter() - t0
+        self._m_index_update.observe(elapsed)
+        tracing.add_time("index.update", elapsed)
+
+    def _index_remove(self, key: str, old_value: Any):
+        if self._index_deferred:
+            return
+        t0 = time.perf_counter()
+        self.indexer.remove(key, old_value)
+        elapsed = time.perf_counter() - t0
+        self._m_index_update.observe(elapsed)
+        tracing.add_time("index.update", elapsed)
+
+    def _load_index(self) -> bool:
+        t0 = time.perf_counter()
+        if not self.indexer.load(self.index_dir, self._lsn):
+            return False
+        logger.info(f"Loaded persisted index for {len(self._data)} keys in {time.perf_counter() - t0:.2f}s.")
+        return True
+
+    def _rebuild_index(self):
+        """Build the indexes from the current data in one bulk pass."""
+        t0 = time.perf_counter()
+        self.indexer.rebuild((k, self._decode(stored)) for k, stored in self._data.items())
+        logger.info(f"Rebuilt index for {len(self._data)} keys in {time.perf_counter() - t0:.2f}s.")
+
+    def _dump_index(self) -> Optional[Dict[str, Any]]:
+        """The indexes as of now, for _save_index(); None if that failed. Needs the lock."""
         try:
-            line = json.dumps(record) + "\n"
-            with open(self.wal_path, "a") as f:
+            return self.indexer.dump()
+        except Exception as e:
+            logger.error(f"Saving the index failed; it will be rebuilt on restart: {e}")
+            return None
+
+    def _save_index(self, dump: Optional[Dict[str, Any]], lsn: int):
+        """Persist indexes dumped with a snapshot. A failure only costs a rebuild at startup."""
+        if dump is None:
+            return
+        try:
+            self.indexer.write(self.index_dir, lsn, dump)
+        except Exception as e:
+            logger.error(f"Saving the index failed; it will be rebuilt on restart: {e}")
+
+    def _append_wal(self, record: Dict[str, Any], sync: bool = True, line: Optional[str] = None):
+        """
+        Append record to WAL and fsync.
+
+        `line` is the record already serialized on one line (e.g. spliced from
+        request bytes by src.db.wire.record_line); it is written as-is.
+        """
+        t0 = time.perf_counter()
+        try:
+            line = (line if line is not None else json.dumps(record)) + "\n"
+            with tracing.span("engine.wal_append"), open(self.wal_path, "a", encoding="utf-8") as f:
                 f.write(line)
                 if sync:
+                    t_sync = time.perf_counter()
                     f.flush()
                     os.fsync(f.fileno())
+                    synced = time.perf_counter() - t_sync
+                    self._m_wal_fsync.observe(synced)
+                    tracing.add_time("engine.fsync", synced)
+            self._m_wal_bytes.inc(len(line))
+            self.wal_size += len(line)
+            self._m_wal_batch.observe(_record_size(record))
+            self._m_wal_append.observe(time.perf_counter() - t0)
             return True
         except Exception as e:
+            self._m_wal_errors.inc()
             logger.error(f"WAL write failed: {e}")
             return False
 
     def get(self, key: str) -> Any:
-        with self._lock:
-            return self._data.get(key)
+        return self.get_with_version(key)[0]
 
-    def set(self, key: str, value: Any, debug_simulate_error: bool = False) -> bool:
-        with self._lock:
+    def get_with_version(self, key: str) -> Tuple[Any, int]:
+        """Read a value and its version atomically, for use with compare_and_set()/transact()."""
+        if self.cache is not None:
+            return self._get_cached(key)
+        with self._locked():
+            version = self._current_version(key)
+            stored = self._data.get(key) if version else None
+        # Decoding happens outside the lock: stored bytes are never mutated in place.
+        return self._decode(stored), version
+
+    def _get_cached(self, key: str) -> Tuple[Any, int]:
+        cache = self.cache
+        with self._locked():
+            version = self._current_version(key)
+            if not version:
+                return None, 0
+            evictions = cache.evictions
+            value = cache.get(key, _MISSING)
+            if value is not _MISSING:
+                self._m_cache_hits.inc()
+                return value, version
+            self._m_cache_misses.inc()
+            stored = self._data.get(key)
+            lsn = self._lsn
+        value = self._decode(stored)
+        with self._locked():
+            if lsn == self._lsn:  # no write slipped in while we decoded
+                cache.put(key, value, len(stored) + len(key))
+            self._m_cache_evictions.inc(cache.evictions - evictions)
+            self._m_cache_bytes.set(cache.size)
+        return value, version
+
+    def cache_stats(self) -> Optional[Dict[str, Any]]:
+        if self.cache is None:
+            return None
+        with self._locked():
+            return self.cache.stats()
+
+    def set(self, key: str, value: Any, debug_simulate_error: bool = False, expire_at: Optional[float] = None,
+            wal_line: Optional[str] = None) -> bool:
+        with self._locked():
             # Simulation of failure (Bonus)
             if debug_simulate_error:
                 import random
@@ -110,21 +628,24 @@ class KVStore:
                      return False
 
             record = {"op": "SET", "k": key, "v": value}
-            if self._append_wal(record):
+            if expire_at is not None:
+                record["exp"] = expire_at
+            if self._append_wal(record, line=wal_line):
                 self._apply_record(record)
                 return True
             return False
 
     def delete(self, key: str) -> bool:
-        with self._lock:
+        with self._locked():
             record = {"op": "DEL", "k": key}
             if self._append_wal(record):
                 self._apply_record(record)
                 return True
             return False
 
-    def bulk_set(self, items: List[Tuple[str, Any]], debug_simulate_error: bool = False) -> bool:
-        with self._lock:
+    def bulk_set(self, items: List[Tuple[str, Any]], debug_simulate_error: bool = False,
+                 expire_at: Optional[float] = None, wal_line: Optional[str] = None) -> bool:
+        with self._locked():
             if debug_simulate_error:
                 import random
                 if random.random() < 0.01:
@@ -132,29 +653,340 @@ class KVStore:
             
             # Atomic: Write one big record.
             record = {"op": "BULK", "data": items}
+            if expire_at is not None:
+                record["exp"] = expire_at
+            if self._append_wal(record, line=wal_line):
+                self._apply_record(record)
+                return True
+            return False
+
+    def import_batch(self, items: List[Tuple[str, Any]], expire_at: Optional[Dict[str, float]] = None,
+                     wal_line: Optional[str] = None) -> bool:
+        """
+        Write one batch of a bulk load as a single IMPORT record, without indexing it.
+
+        `expire_at` maps keys of the batch to absolute expiry times. Call
+        finish_import() after the last batch (also after a failed one) to index
+        what was imported; recovery does it too if the log ends mid-import.
+        """
+        with self._locked():
+            record = {"op": "IMPORT", "data": items}
+            if expire_at:
+                record["exp"] = expire_at
+            if self._append_wal(record, line=wal_line):
+                self._apply_record(record)
+                return True
+            return False
+
+    def finish_import(self) -> bool:
+        """Log an INDEX record and index everything imported since the last one."""
+        with self._locked():
+            record = {"op": "INDEX"}
             if self._append_wal(record):
                 self._apply_record(record)
                 return True
             return False
 
+    def export(self, prefix: str = "", chunk_size: int = 1000) -> Iterator[List[Tuple[str, Any, Optional[float]]]]:
+        """
+        Point-in-time dump of the keys starting with `prefix`, in chunks of (key, value, expire_at).
+
+        The lock is only held to copy the key list and to read each chunk. Records
+        applied in between first save the state they overwrite (_save_for_exports),
+        so every chunk reflects the store as it was when the export started.
+        """
+        saved: Dict[str, Tuple[Any, Optional[float]]] = {}
+        with self._locked():
+            keys = [k for k in self._data.keys() if k.startswith(prefix)] if prefix else list(self._data.keys())
+            started = time.time()
+            self._exports.append(saved)
+        try:
+            for start in range(0, len(keys), chunk_size):
+                chunk = []
+                with self._locked():
+                    for k in keys[start:start + chunk_size]:
+                        # Once read, a key's saved state is no longer needed.
+                        stored, exp = saved.pop(k) if k in saved else (self._data[k], self._expiry.get(k))
+                        if stored is _MISSING or (exp is not None and exp <= started):
+                            continue
+                        chunk.append((k, stored, exp))
+                yield [(k, self._decode(stored), exp) for k, stored, exp in chunk]
+        finally:
+            with self._locked():
+                self._exports = [e for e in self._exports if e is not saved]
+
+    def _current_version(self, key: str) -> int:
+        if key not in self._data or (self._expiry and self._is_expired(key)):
+            return 0
+        return self._versions.get(key, _LEGACY_VERSION)
+
+    def version(self, key: str) -> int:
+        """Version of `key` (LSN of its last write), 0 if it does not exist."""
+        with self._locked():
+            return self._current_version(key)
+
+    def update(self, record: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], Any]:
+        """
+        Apply a delta record (INCR/APPEND/PATCH/MERGE, see src.db.delta) to one key.
+
+        Only the delta is written to the WAL; the caller should replicate the
+        returned record, which is a full SET if the key had expired (replicas
+        must not depend on their own clocks to apply it).
+
+        Disk storage logs the resulting SET instead: its store already holds
+        the writes made since the last checkpoint when the WAL is replayed on
+        top of it, so every WAL record must be safe to apply twice.
+
+        Returns (logged record, new value), or (None, None) if the WAL write failed.
+        Raises DeltaError if the delta does not fit the current value.
+        """
+        key = record["k"]
+        with self._locked():
+            expired = bool(self._expiry) and self._is_expired(key)
+            current = None if expired else self._decode(self._data.get(key))
+            value = apply_delta(current, record)
+            if expired:
+                record = {"op": "SET", "k": key, "v": value}
+            elif self.storage == "disk":
+                record = self._delta_as_set(key, value)
+            if not self._append_wal(record):
+                return None, None
+            self._apply_record(record, computed=value)
+            return record, value
+
+    def compare_and_set(self, key: str, value: Any, expected_version: int,
+                        expire_at: Optional[float] = None) -> Tuple[bool, int]:
+        """
+        Set `key` only if its current version is `expected_version` (0 = must not exist).
+
+        Returns (success, version): the new version on success, the current one on conflict.
+        A WAL failure returns (False, -1).
+        """
+        with self._locked():
+            current = self._current_version(key)
+            if current != expected_version:
+                return False, current
+            record = {"op": "SET", "k": key, "v": value}
+            if expire_at is not None:
+                record["exp"] = expire_at
+            if not self._append_wal(record):
+                return False, -1
+            self._apply_record(record)
+            return True, self._versions[key]
+
+    def transact(self, checks: Dict[str, int], sets: List[Tuple[str, Any]],
+                 deletes: List[str]) -> Tuple[bool, Dict[str, int]]:
+        """
+        Validate a read set and commit writes atomically as one TXN record.
+
+        `checks` maps keys to the versions the caller read (0 = must not exist).
+        Returns (True, {written key: new version}) on commit, or
+        (False, {conflicting key: current version}) if validation failed.
+        A WAL failure returns (False, {}).
+        """
+        with self._locked():
+            conflicts = {}
+            for k, expected in checks.items():
+                current = self._current_version(k)
+                if current != expected:
+                    conflicts[k] = current
+            if conflicts:
+                return False, conflicts
+            record = {"op": "TXN", "set": [[k, v] for k, v in sets], "del": list(deletes)}
+            if not self._append_wal(record):
+                return False, {}
+            self._apply_record(record)
+            written = {k: self._versions[k] for k, _ in sets if k in self._versions}
+            written.update({k: 0 for k in deletes})
+            return True, written
+
+    def ttl(self, key: str) -> Optional[float]:
+        """Seconds until `key` expires, or None if it has no expiry (or does not exist)."""
+        with self._locked():
+            exp = self._expiry.get(key)
+            if exp is None or key not in self._data:
+                return None
+            return max(0.0, exp - time.time())
+
+    def reap_expired(self, max_batch: int = 1000) -> Optional[Dict[str, Any]]:
+        """
+        Delete up to `max_batch` expired keys as one EXPIRE record.
+
+        Returns the record (for replication) or None if nothing had expired.
+        """
+        now = time.time()
+        with self._locked():
+            heap = self._expiry_heap
+            keys = []
+            while heap and heap[0][0] <= now and len(keys) < max_batch:
+                exp, k = heapq.heappop(heap)
+                if self._expiry.get(k) == exp:  # skip entries superseded by a later write
+                    keys.append(k)
+            if not keys:
+                return None
+            record = {"op": "EXPIRE", "keys": keys}
+            if not self._append_wal(record):
+                for k in keys:  # retry on the next pass
+                    heapq.heappush(self._expiry_heap, (self._expiry[k], k))
+                return None
+            self._apply_record(record)
+            self._m_expired.inc(len(keys))
+            return record
+
+    def search(self, query: str) -> List[str]:
+        """Keys matching a full-text query: words, prefix* terms and "phrases" (see IndexManager.search)."""
+        with self._locked():
+            keys = self.indexer.search(query, value_of=lambda k: self._decode(self._data.get(k)))
+            if self._expiry:
+                now = time.time()
+                keys = [k for k in keys if not self._is_expired(k, now)]
+            return keys
+
+    def vector_search(self, query: str, top_k: int = 5) -> List[str]:
+        return [k for _, k in self.vector_search_scored(query, top_k=top_k)]
+
+    def vector_search_scored(self, query: str, top_k: int = 5) -> List[Tuple[float, str]]:
+        """Like vector_search(), with each key's cosine similarity: [(score, key)], best first."""
+        with self._locked():
+            results = self.indexer.vector_search_scored(query, top_k=top_k)
+            if not self._expiry:
+                return results
+            # Expired keys stay indexed until reaped: if they took some of the top_k
+            # places, search again for twice as many.
+            now = time.time()
+            fetch = top_k
+            while True:
+                live = [r for r in results if not self._is_expired(r[1], now)]
+                if len(live) >= top_k or len(results) < fetch:
+                    return live[:top_k]
+                fetch *= 2
+                results = self.indexer.vector_search_scored(query, top_k=fetch)
+
     def create_snapshot(self):
-        """Compact WAL into a snapshot."""
-        with self._lock:
-            temp_path = self.snapshot_path + ".tmp"
+        """
+        Compact WAL into a snapshot.
+
+        The store lock is only held to copy the tables and dump the indexes,
+        and then to swap files; writing the snapshot happens outside it, so
+        reads and writes (which the server runs on its event loop) are not
+        stalled for the whole dump. The price is a transient shallow copy of
+        the store: values are replaced on write, never mutated in place, so
+        the copy is a consistent view.
+        """
+        if self.storage == "disk":
+            return self._checkpoint_disk()
+        temp_path = self.snapshot_path + ".tmp"
+        with self._snapshot_lock, self._m_snapshot.time():
             try:
+                with self._locked():
+                    data = dict(self._data)
+                    meta = self._snapshot_meta()
+                    wal_offset = os.path.getsize(self.wal_path) if os.path.exists(self.wal_path) else 0
+                    index = self._dump_index()
                 with open(temp_path, "w") as f:
-                    json.dump(self._data, f)
-                    f.flush()
-                    os.fsync(f.fileno())
-                os.replace(temp_path, self.snapshot_path)
-                # Clear WAL
-                with open(self.wal_path, "w") as f:
+                    if self.codec is None:
+                        json.dump({SNAPSHOT_MARKER: SNAPSHOT_VERSION, "meta": meta, "data": data}, f)
+                    else:
+                        self._write_encoded_snapshot(f, data, meta)
                     f.flush()
                     os.fsync(f.fileno())
+                with self._locked():
+                    os.replace(temp_path, self.snapshot_path)
+                    # Drop the WAL records the snapshot covers, keep those written since.
+                    self._cut_wal(wal_offset)
                 logger.info("Snapshot created and WAL cleared.")
+                self._save_index(index, meta["lsn"])
                 return True
             except Exception as e:
                 logger.error(f"Snapshot creation failed: {e}")
                 if os.path.exists(temp_path):
                     os.remove(temp_path)
                 return False
+
+    def _cut_wal(self, offset: int):
+        """Remove the first `offset` bytes of the WAL."""
+        with open(self.wal_path, "a+b") as f:
+            f.seek(offset)
+            tail = f.read()
+        temp_path = self.wal_path + ".tmp"
+        with open(temp_path, "wb") as f:
+            f.write(tail)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.wal_path)
+        self.wal_size = len(tail)
+
+    def _write_meta(self):
+        """Persist snapshot metadata next to the disk store (memory mode embeds it in the snapshot)."""
+        meta_tmp = self.meta_path + ".tmp"
+        with open(meta_tmp, "w") as f:
+            json.dump(self._snapshot_meta(), f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(meta_tmp, self.meta_path)
+
+    def _checkpoint_disk(self) -> bool:
+        """Disk storage is its own snapshot: make it durable, truncate the WAL and reclaim dead space."""
+        with self._snapshot_lock, self._m_snapshot.time():
+            try:
+                with self._locked():
+                    self._data.sync()
+                    self._write_meta()
+                    with open(self.wal_path, "w") as f:
+                        f.flush()
+                        os.fsync(f.fileno())
+                    self.wal_size = 0
+                    lsn = self._lsn
+                    index = self._dump_index()
+                logger.info("Disk store synced and WAL cleared.")
+                self._save_index(index, lsn)
+            except Exception as e:
+                logger.error(f"Checkpoint failed: {e}")
+                return False
+        if self._data.dead_ratio() >= self._data.compact_ratio:
+            self._data.compact_in_background()
+        return True
+
+    def close(self):
+        """Release file handles (disk storage)."""
+        if self.storage == "disk":
+            self._data.close()
+
+    def _write_encoded_snapshot(self, f, data: Dict[str, Any], meta: Dict[str, Any]):
+        """Stream encoded values as a snapshot without materializing it as a dict of values."""
+        f.write("{" + json.dumps(SNAPSHOT_MARKER) + ": " + str(SNAPSHOT_VERSION))
+        f.write(', "meta": ' + json.dumps(meta) + ', "data": {')
+        first = True
+        for k, stored in data.items():
+            raw = self.codec.raw_json(stored)
+            value_json = raw.decode("utf-8") if raw is not None else json.dumps(self.codec.decode(stored))
+            f.write(("" if first else ", ") + json.dumps(k) + ": " + value_json)
+            first = False
+        f.write("}}")
+
+    def memory_stats(self, sample_size: int = 1000) -> Dict[str, Any]:
+        """
+        Estimate memory used per key (key + stored value + dict slot).
+
+        Values are measured on a sample of up to `sample_size` keys and
+        extrapolated to the whole store.
+        """
+        with self._locked():
+            n = len(self._data)
+            sample = []
+            # In disk mode only the keydir (key -> file location) is resident.
+            resident = self._data.keydir if self.storage == "disk" else self._data
+            for i, item in enumerate(resident.items()):
+                if i >= sample_size:
+                    break
+                sample.append(item)
+            table_bytes = sys.getsizeof(resident)
+        entry_bytes = sum(deep_sizeof(k) + deep_sizeof(v) for k, v in sample)
+        per_key = (entry_bytes / len(sample) if sample else 0.0) + (table_bytes / n if n else 0.0)
+        return {
+            "storage": self.storage,
+            "value_encoding": self.value_encoding,
+            "keys": n,
+            "bytes_per_key": round(per_key, 1),
+            "estimated_total_bytes": int(per_key * n),
+        }
@@ -0,0 +1,45 @@
+"""
+Readiness gating while a node recovers.
+
+The server binds its port right away and replays the snapshot and WAL in the
+background (see startup_event in src/db/server.py), so orchestrators can tell
+a recovering node from a dead one. Until recovery is done, ReadinessGate
+answers every request except health checks, metrics and the API docs with
+503 and Retry-After, including /internal/* RPCs: a recovering node neither
+votes nor applies replicated records to a half-loaded store.
+"""
+import json
+import math
+from typing import Any, Callable, Dict
+
+# Served while recovering.
+ALWAYS_ALLOWED = ("/health/", "/metrics", "/docs", "/openapi.json")
+
+
+class ReadinessGate:
+    """
+    ASGI middleware refusing requests with 503 until `ready()` is true.
+
+    Args:
+        app: The wrapped ASGI app.
+        ready (Callable[[], bool]): Whether the node may serve requests.
+        progress (Callable[[], Dict[str, Any]]): Recovery progress included in refusals.
+        retry_after (float): Seconds suggested to refused clients.
+    """
+
+    def __init__(self, app, ready: Callable[[], bool], progress: Callable[[], Dict[str, Any]],
+                 retry_after: float = 1.0):
+        self.app = app
+        self.ready = ready
+        self.progress = progress
+        self.retry_after = retry_after
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.ready() or scope["path"].startswith(ALWAYS_ALLOWED):
+            return await self.app(scope, receive, send)
+        body = json.dumps({"detail": "Recovering", "recovery": self.progress()}).encode("utf-8")
+        await send({"type": "http.response.start", "status": 503, "headers": [
+            (b"content-type", b"application/json"),
+            (b"retry-after", str(max(1, math.ceil(self.retry_after))).encode("latin-1")),
+        ]})
+        await send({"type": "http.response.body", "body": body})
@@ -1,75 +1,438 @@
-from typing import Dict, List, Set, Any
+from array import array
+from bisect import bisect_left
+from typing import Dict, FrozenSet, Iterable, Iterator, List, Optional, Set, Any, Tuple, Callable
+import json
+import logging
+import os
 import re
-import numpy as np
+import sys
+
+logger = logging.getLogger(__name__)
+
+INDEX_FORMAT = 2
+MANIFEST_FILE = "manifest.json"
+
+_WORD = re.compile(r"\w+")
+_PHRASE = re.compile(r'"([^"]*)"')
+
+# DB_STOPWORDS=english: frequent words that would otherwise have the largest posting lists.
+ENGLISH_STOPWORDS = frozenset((
+    "a an and are as at be but by for if in into is it no not of on or such "
+    "that the their then there these they this to was will with").split())
+
+
+def tokenize(text: str) -> List[str]:
+    r"""Lowercased words of `text`, exactly as re.findall(r'\w+', text.lower()) finds them."""
+    text = text.lower()
+    # Text of only word characters and spaces splits the same way, several times faster.
+    if text.replace(" ", "").isalnum():
+        return text.split()
+    return _WORD.findall(text)
+
+
+def resolve_stopwords(spec: str) -> Optional[FrozenSet[str]]:
+    """Stopwords for a DB_STOPWORDS value: "" (none), "english", or a comma-separated list."""
+    spec = spec.strip()
+    if not spec:
+        return None
+    if spec.lower() == "english":
+        return ENGLISH_STOPWORDS
+    return frozenset(w for part in spec.split(",") for w in tokenize(part))
 
 class IndexManager:
-    def __init__(self):
+    """
+    Inverted index and, optionally, vector index over string values.
+
+    The vector index (src/db/vectors.py, `vector_index`) only exists when
+    `vectors` is true, and is created, importing numpy, on first use. load() keeps postings
+    as arrays and only turns a term's postings into a set in `inverted_index`
+    when the term is first used (_postings()).
+
+    save() and load() persist the index under a directory: a manifest naming
+    the LSN the index reflects, the indexed keys, the sorted term dictionary
+    with postings as offsets into one array of key ids (raw native-endian
+    arrays), and the vectors as .npy. save() is dump(), which needs the index
+    to hold still, then write(), which does not.
+
+    Queries (search()) AND together words, `prefix*` terms, expanded through
+    the sorted term dictionary, and "quoted phrases", whose candidates are
+    checked against the values. Stopwords, if configured, are not indexed
+    and are ignored in queries.
+
+    Args:
+        stopwords (Iterable[str], optional): Words to leave out of the inverted index.
+        vectors (bool): Maintain the vector index (needs numpy).
+    """
+
+    def __init__(self, stopwords: Optional[Iterable[str]] = None, vectors: bool = True):
+        self.stopwords: FrozenSet[str] = frozenset(stopwords or ())
         # Inverted Index: word -> set of keys
         self.inverted_index: Dict[str, Set[str]] = {}
-        # Simple Vector Index: key -> vector (not optimized for search, just storage)
-        self.vectors: Dict[str, np.ndarray] = {}
+        # Sorted term dictionary for prefix queries. New terms are queued in
+        # _new_terms and deleted ones left in place (counted in _dead_terms)
+        # until the next prefix query brings it up to date (_sync_terms()).
+        self._sorted_terms: List[str] = []
+        self._new_terms: List[str] = []
+        self._dead_terms = 0
+        # Loaded postings not yet needed: term -> (start, end) in _loaded_ids, ids into _loaded_keys
+        self._loaded_terms: Dict[str, Tuple[int, int]] = {}
+        self._loaded_ids = array("i")
+        self._loaded_keys: List[str] = []
+        # Terms whose posting set a dump() being written still reads: copied before
+        # their next change (_own()) instead of being copied by dump().
+        self._shared: Set[str] = set()
+        self.vectors_enabled = vectors
+        self._vector_index = None
+
+    @property
+    def vector_index(self):
+        """The VectorIndex, or None if disabled."""
+        if self._vector_index is None and self.vectors_enabled:
+            from src.db.vectors import VectorIndex
+            self._vector_index = VectorIndex()
+        return self._vector_index
 
     def _tokenize(self, text: str) -> List[str]:
-        return re.findall(r'\w+', text.lower())
+        return tokenize(text)
+
+    def _terms_of(self, text: str) -> Set[str]:
+        """Distinct indexed terms of a value."""
+        terms = set(tokenize(text))
+        if self.stopwords:
+            terms -= self.stopwords
+        return terms
+
+    def _postings(self, word: str, create: bool = False) -> Optional[Set[str]]:
+        """Keys containing `word`, materializing loaded postings; None if there are none."""
+        keys = self.inverted_index.get(word)
+        if keys is None:
+            span = self._loaded_terms.pop(word, None)
+            if span is not None:
+                keys = set(map(self._loaded_keys.__getitem__, self._loaded_ids[span[0]:span[1]].tolist()))
+                self.inverted_index[word] = keys
+            elif create:
+                keys = self.inverted_index[word] = set()
+                self._new_terms.append(word)
+        return keys
+
+    def _own(self, word: str, keys: Set[str]) -> Set[str]:
+        """The postings `keys` of `word`, copied first if a dump still reads them."""
+        if word in self._shared:
+            self._shared.discard(word)
+            keys = self.inverted_index[word] = set(keys)
+        return keys
+
+    def _discard(self, word: str, key: str):
+        keys = self._postings(word)
+        if keys is not None:
+            keys = self._own(word, keys)
+            keys.discard(key)
+            if not keys:
+                del self.inverted_index[word]
+                self._dead_terms += 1
+
+    def _has_term(self, word: str) -> bool:
+        return word in self.inverted_index or word in self._loaded_terms
 
-    def _get_embedding(self, text: str) -> np.ndarray:
-        # deterministic hash-based embedding for demo purpose
-        # In real world, use a model like SentenceTransformer
-        # Dimensions = 10
-        seed = abs(hash(text)) % (2**32)
-        rng = np.random.default_rng(seed)
-        return rng.random(10)
+    def _sync_terms(self):
+        """Merge queued new terms into the sorted term dictionary; drop deleted ones once they pile up."""
+        terms = self._sorted_terms
+        if self._new_terms:
+            # A term deleted and re-added may still be in the dictionary.
+            new = [t for t in set(self._new_terms) if not _contains_sorted(terms, t)]
+            self._new_terms = []
+            terms.extend(new)
+            terms.sort()  # two sorted runs: a linear merge
+        if self._dead_terms > len(terms) // 4:
+            self._sorted_terms = [t for t in terms if self._has_term(t)]
+            self._dead_terms = 0
+
+    def terms(self) -> List[str]:
+        """All indexed terms, sorted."""
+        self._sync_terms()
+        return [t for t in self._sorted_terms if self._has_term(t)]
+
+    def prefix_terms(self, prefix: str) -> List[str]:
+        """Indexed terms starting with `prefix`, sorted."""
+        self._sync_terms()
+        terms = self._sorted_terms
+        found = []
+        for i in range(bisect_left(terms, prefix), len(terms)):
+            if not terms[i].startswith(prefix):
+                break
+            if self._has_term(terms[i]):
+                found.append(terms[i])
+        return found
 
     def update(self, key: str, value: Any, old_value: Any = None):
         # Only index string values
-        if isinstance(old_value, str):
-            for word in self._tokenize(old_value):
-                if word in self.inverted_index:
-                    self.inverted_index[word].discard(key)
-                    if not self.inverted_index[word]:
-                        del self.inverted_index[word]
+        old_terms = self._terms_of(old_value) if isinstance(old_value, str) else set()
+        if not isinstance(value, str):
+            for word in old_terms:
+                self._discard(word, key)
+            return
+        if value == old_value:
+            return  # same text: postings and vector are already right
 
-        if isinstance(value, str):
-            # Update Inverted Index
-            for word in self._tokenize(value):
-                if word not in self.inverted_index:
-                    self.inverted_index[word] = set()
-                self.inverted_index[word].add(key)
-            
-            # Update Vector Index
-            self.vectors[key] = self._get_embedding(value)
+        # Update Inverted Index: only the terms that differ between the two values
+        new_terms = self._terms_of(value)
+        for word in old_terms - new_terms:
+            self._discard(word, key)
+        for word in new_terms - old_terms:
+            self._own(word, self._postings(word, create=True)).add(key)
+
+        if self.vector_index is not None:
+            self.vector_index.update(key, value)
 
     def remove(self, key: str, value: Any):
         if isinstance(value, str):
-            for word in self._tokenize(value):
-                if word in self.inverted_index:
-                    self.inverted_index[word].discard(key)
-            self.vectors.pop(key, None)
-
-    def search(self, query: str) -> List[str]:
-        words = self._tokenize(query)
-        if not words:
+            for word in self._terms_of(value):
+                self._discard(word, key)
+            if self.vector_index is not None:
+                self.vector_index.remove(key)
+
+    def rebuild(self, items: Iterable[Tuple[str, Any]]):
+        """Replace the index with one built from (key, value) pairs in a single pass."""
+        inverted: Dict[str, Set[str]] = {}
+        keys: List[str] = []
+        texts: List[str] = []
+        terms_of = self._terms_of
+        for key, value in items:
+            if not isinstance(value, str):
+                continue
+            for word in terms_of(value):
+                postings = inverted.get(word)
+                if postings is None:
+                    inverted[word] = {key}
+                else:
+                    postings.add(key)
+            keys.append(key)
+            texts.append(value)
+        self.inverted_index = inverted
+        self._sorted_terms = sorted(inverted)
+        self._new_terms = []
+        self._dead_terms = 0
+        self._loaded_terms = {}
+        self._loaded_ids = array("i")
+        self._loaded_keys = []
+        if self.vector_index is not None:
+            self.vector_index.rebuild(keys, texts)
+
+    def save(self, path: str, lsn: int):
+        """Persist the index as of `lsn` under directory `path`; the manifest is replaced last."""
+        self.write(path, lsn, self.dump())
+
+    def dump(self) -> Dict[str, Any]:
+        """
+        The index in its persisted form, for write().
+
+        Only this step needs the index to hold still, and it copies no
+        postings: it keeps references to the posting sets, which later
+        changes copy first (_own()) until write() is done with them, and to
+        the loaded posting arrays, which are never changed in place.
+        """
+        keys: List[str] = []
+        matrix = None
+        if self.vector_index is not None:
+            keys, matrix = self.vector_index.table()
+            keys = list(keys)
+        terms = self.terms()
+        self._sorted_terms = list(terms)  # _sync_terms() extends it in place
+        self._dead_terms = 0
+        sets = dict(self.inverted_index)
+        self._shared = set(sets)
+
+        # The merged table becomes the new base.
+        if matrix is not None:
+            self.vector_index.reset(keys, matrix)
+        return {"keys": keys, "terms": terms, "sets": sets, "matrix": matrix,
+                "loaded": (dict(self._loaded_terms), self._loaded_ids, self._loaded_keys),
+                "dim": self.vector_index.dim if matrix is not None else None}
+
+    def _dumped_postings(self, dump: Dict[str, Any]) -> Iterator[Iterable[str]]:
+        """The keys of each term of a dump(), in term order."""
+        sets = dump["sets"]
+        loaded_terms, loaded_ids, loaded_keys = dump["loaded"]
+        for term in dump["terms"]:
+            keys = sets.get(term)
+            if keys is None:
+                start, end = loaded_terms[term]
+                keys = map(loaded_keys.__getitem__, loaded_ids[start:end].tolist())
+            yield keys
+
+    def write(self, path: str, lsn: int, dump: Dict[str, Any]):
+        """Write a dump() as the index as of `lsn` under directory `path`; the manifest is replaced last."""
+        os.makedirs(path, exist_ok=True)
+        matrix = dump["matrix"]
+        # Every indexed key has a vector; without vectors, ids are given in order of appearance.
+        keys = list(dump["keys"])
+        ids = dict(zip(keys, range(len(keys))))
+        offsets = array("q", [0])
+        postings = array("i")
+        for term_postings in self._dumped_postings(dump):
+            for k in term_postings:
+                i = ids.get(k)
+                if i is None:
+                    i = ids[k] = len(keys)
+                    keys.append(k)
+                postings.append(i)
+            offsets.append(len(postings))
+        self._shared = set()  # done reading the dumped sets
+
+        manifest_path = os.path.join(path, MANIFEST_FILE)
+        generation = _read_manifest(manifest_path).get("generation", 0) + 1
+        names = [("keys", "json"), ("terms", "json"), ("offsets", "bin"), ("postings", "bin")]
+        if matrix is not None:
+            names.append(("vectors", "npy"))
+        files = {name: f"{name}.{generation}.{ext}" for name, ext in names}
+        for name, payload in (("keys", keys), ("terms", dump["terms"])):
+            with open(os.path.join(path, files[name]), "w", encoding="utf-8") as f:
+                json.dump(payload, f)
+        for name, values in (("offsets", offsets), ("postings", postings)):
+            with open(os.path.join(path, files[name]), "wb") as f:
+                values.tofile(f)
+        if matrix is not None:
+            self.vector_index.save(os.path.join(path, files["vectors"]), matrix)
+        for name in files.values():
+            _fsync(os.path.join(path, name))
+
+        tmp = manifest_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"format": INDEX_FORMAT, "lsn": lsn, "generation": generation,
+                       "byteorder": sys.byteorder, "dim": dump["dim"],
+                       "stopwords": sorted(self.stopwords), "files": files}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, manifest_path)
+        for name in os.listdir(path):
+            if name != MANIFEST_FILE and name not in files.values():
+                os.remove(os.path.join(path, name))  # previous generations
+
+    def load(self, path: str, lsn: int) -> bool:
+        """
+        Replace the index with the one persisted under `path`, if it reflects `lsn`.
+
+        Returns False (leaving the index untouched) when it is missing, stale,
+        or unreadable; the caller then rebuilds it. Vectors are memory-mapped.
+        """
+        manifest = _read_manifest(os.path.join(path, MANIFEST_FILE))
+        if not manifest:
+            return False
+        if (manifest.get("format") != INDEX_FORMAT or manifest.get("byteorder") != sys.byteorder
+                or manifest.get("lsn") != lsn):
+            logger.info(f"Persisted index is stale (LSN {manifest.get('lsn')}, store at {lsn}).")
+            return False
+        if self.vector_index is not None and manifest.get("dim") != self.vector_index.dim:
+            logger.info("Persisted index has no matching vector index.")
+            return False
+        if manifest.get("stopwords") != sorted(self.stopwords):
+            logger.info("Persisted index was built with other stopwords.")
+            return False
+        files = {name: os.path.join(path, f) for name, f in manifest["files"].items()}
+        try:
+            with open(files["keys"], encoding="utf-8") as f:
+                keys = json.load(f)
+            with open(files["terms"], encoding="utf-8") as f:
+                terms = json.load(f)
+            offsets = array("q")
+            postings = array("i")
+            for values, name in ((offsets, "offsets"), (postings, "postings")):
+                with open(files[name], "rb") as f:
+                    values.frombytes(f.read())
+            if len(offsets) != len(terms) + 1 or (len(offsets) and offsets[-1] != len(postings)):
+                raise ValueError("postings do not match the term dictionary")
+            if self.vector_index is not None and not self.vector_index.load(files["vectors"], keys):
+                raise ValueError("vectors do not match the keys")
+        except (OSError, ValueError) as e:
+            logger.error(f"Failed to load persisted index: {e}")
+            return False
+
+        self.inverted_index = {}
+        self._sorted_terms = terms  # saved sorted
+        self._new_terms = []
+        self._dead_terms = 0
+        self._loaded_terms = {term: (offsets[i], offsets[i + 1]) for i, term in enumerate(terms)}
+        self._loaded_ids = postings
+        self._loaded_keys = keys
+        return True
+
+    def search(self, query: str, value_of: Optional[Callable[[str], Any]] = None) -> List[str]:
+        """
+        Keys whose values match every clause of `query`.
+
+        Clauses are words, `prefix*` (any term starting with prefix) and
+        "quoted phrases" (the words in that order, next to each other).
+        Phrases are checked against the values returned by `value_of(key)`;
+        without it they only require all of their words.
+        """
+        phrases = [tokenize(p) for p in _PHRASE.findall(query)]
+        words: List[str] = []
+        prefixes: List[str] = []
+        for part in _PHRASE.sub(" ", query).split():
+            tokens = tokenize(part)
+            if part.endswith("*") and tokens:
+                prefixes.append(tokens.pop())
+            words.extend(tokens)
+        for phrase in phrases:
+            words.extend(phrase)
+        if self.stopwords:
+            words = [w for w in words if w not in self.stopwords]
+        if not words and not prefixes:
             return []
-        
-        # Intersection of all query words
-        result_keys = None
-        for word in words:
-            keys = self.inverted_index.get(word, set())
-            if result_keys is None:
-                result_keys = set(keys)
-            else:
-                result_keys &= keys
-        
-        return list(result_keys) if result_keys else []
+
+        # Intersection of all clauses, smallest first
+        clauses = [self._postings(w) or set() for w in set(words)]
+        for prefix in prefixes:
+            matched: Set[str] = set()
+            for term in self.prefix_terms(prefix):
+                matched |= self._postings(term)
+            clauses.append(matched)
+        clauses.sort(key=len)
+        result_keys = clauses[0].intersection(*clauses[1:])
+
+        phrases = [p for p in phrases if len(p) > 1]
+        if phrases and value_of is not None:
+            result_keys = [k for k in result_keys if _has_phrases(value_of(k), phrases)]
+        return list(result_keys)
     
     def vector_search(self, query: str, top_k: int = 5) -> List[str]:
-        # Brute-force cosine similarity
-        q_vec = self._get_embedding(query)
-        scores = []
-        for k, v_vec in self.vectors.items():
-            # cosine sim
-            sim = np.dot(q_vec, v_vec) / (np.linalg.norm(q_vec) * np.linalg.norm(v_vec) + 1e-9)
-            scores.append((sim, k))
-        
-        scores.sort(key=lambda x: x[0], reverse=True)
-        return [k for s, k in scores[:top_k]]
+        return [k for s, k in self.vector_search_scored(query, top_k)]
+
+    def vector_search_scored(self, query: str, top_k: int = 5) -> List[Tuple[float, str]]:
+        """[(cosine similarity, key)] of the `top_k` closest values; [] without a vector index."""
+        if self.vector_index is None:
+            return []
+        return self.vector_index.search_scored(query, top_k)
+
+
+def _contains_sorted(terms: List[str], term: str) -> bool:
+    i = bisect_left(terms, term)
+    return i < len(terms) and terms[i] == term
+
+
+def _has_phrases(value: Any, phrases: List[List[str]]) -> bool:
+    """Whether every phrase occurs as consecutive words of `value`."""
+    if not isinstance(value, str):
+        return False
+    tokens = tokenize(value)
+    for phrase in phrases:
+        n = len(phrase)
+        if not any(tokens[i:i + n] == phrase for i, t in enumerate(tokens) if t == phrase[0]):
+            return False
+    return True
+
+
+def _read_manifest(path: str) -> Dict[str, Any]:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _fsync(path: str):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
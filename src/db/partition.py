@@ -0,0 +1,406 @@
+"""
+Key-hash partitioning for multi-process serving.
+
+In multi-process mode (`main.py --workers N`, see src/db/workers.py) every
+worker process runs the full server over its own partition of the key space:
+its own KVStore, WAL, snapshots and indexes under <data dir>/partition-<i>.
+All workers accept connections on the public port (SO_REUSEPORT), so any of
+them may receive any request. PartitionRouter, an ASGI middleware, sends each
+request to the partition that owns it over that worker's private Unix socket:
+
+- single-key routes (/get, /set, /delete, /ttl, /cas, /incr, ...) go to
+  partition_for(key);
+- /bulk is split by partition and fanned out (atomic per partition only);
+- /import streams each NDJSON line to its partition's own /import, and
+  /export concatenates the partitions' dumps;
+- /txn must only touch keys of one partition;
+- /search, /vector_search and /snapshot are scattered to all partitions and
+  the results merged; /health/ready is ready once every partition is;
+- any request with a `partition=<i>` query parameter goes to that worker
+  (required for /watch, whose LSNs are per partition; useful for /metrics).
+
+Requests the worker owns are passed straight to the app; forwarded requests
+carry FORWARDED_HEADER so the receiving worker does not route them again.
+"""
+import asyncio
+import json
+import os
+import zlib
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple, Union
+from urllib.parse import parse_qs, urlencode
+
+import httpx
+
+FORWARDED_HEADER = b"x-kv-forwarded"
+
+# Routes whose JSON body carries the key in a "key" field.
+KEY_BODY_ROUTES = ("/set", "/cas", "/incr", "/append", "/patch", "/merge")
+# Routes with the key as the last path segment.
+KEY_PATH_ROUTES = ("/get/", "/delete/", "/ttl/")
+
+# Headers that describe one hop and must not be copied onto the next. Request
+# bodies are re-framed by httpx, so their length is dropped as well.
+_HOP_HEADERS = {b"connection", b"keep-alive", b"transfer-encoding"}
+_REQUEST_HOP_HEADERS = _HOP_HEADERS | {b"content-length", b"host"}
+
+
+def partition_for(key: str, partitions: int) -> int:
+    """Owning partition of `key`. Stable across processes and restarts (unlike hash())."""
+    return zlib.crc32(key.encode("utf-8")) % partitions
+
+
+def socket_path(socket_dir: str, partition: int) -> str:
+    return os.path.join(socket_dir, f"partition-{partition}.sock")
+
+
+class PartitionRouter:
+    """
+    ASGI middleware routing requests to the worker that owns their keys.
+
+    Args:
+        app: The wrapped ASGI app (this worker's server).
+        partition (int): Partition owned by this worker.
+        partitions (int): Total number of partitions/workers.
+        socket_dir (str): Directory holding the workers' Unix sockets.
+    """
+
+    def __init__(self, app, partition: int, partitions: int, socket_dir: str):
+        self.app = app
+        self.partition = partition
+        self.partitions = partitions
+        self.socket_dir = socket_dir
+        self._clients: Dict[int, httpx.AsyncClient] = {}
+
+    def _client(self, partition: int) -> httpx.AsyncClient:
+        client = self._clients.get(partition)
+        if client is None:
+            transport = httpx.AsyncHTTPTransport(uds=socket_path(self.socket_dir, partition))
+            client = httpx.AsyncClient(transport=transport, base_url="http://partition", timeout=None)
+            self._clients[partition] = client
+        return client
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or any(name == FORWARDED_HEADER for name, _ in scope["headers"]):
+            return await self.app(scope, receive, send)
+
+        path, method = scope["path"], scope["method"]
+        query = parse_qs(scope["query_string"].decode("latin-1"))
+        body = b""
+
+        if "partition" in query:
+            try:
+                target = int(query["partition"][0])
+            except ValueError:
+                target = -1
+            if not 0 <= target < self.partitions:
+                return await _send_json(send, 400, {"detail": f"partition must be in [0, {self.partitions})"})
+        elif path.startswith(KEY_PATH_ROUTES):
+            target = partition_for(path.split("/", 2)[2], self.partitions)
+        elif method == "POST" and path in KEY_BODY_ROUTES:
+            body = await _read_body(receive)
+            key = _json_field(body, "key")
+            target = partition_for(key, self.partitions) if isinstance(key, str) else self.partition
+        elif method == "POST" and path == "/bulk":
+            return await self._bulk(scope, await _read_body(receive), send)
+        elif method == "POST" and path == "/import":
+            return await self._import(scope, receive, send)
+        elif method == "GET" and path == "/export":
+            return await self._export(scope, send)
+        elif method == "POST" and path == "/txn":
+            body = await _read_body(receive)
+            target = self._txn_partition(body)
+            if target is None:
+                return await _send_json(send, 400, {"detail": "Transaction keys span several partitions"})
+        elif method == "GET" and path == "/search":
+            return await self._search(scope, send)
+        elif method == "GET" and path == "/vector_search":
+            return await self._vector_search(scope, query, send)
+        elif method == "POST" and path == "/snapshot":
+            return await self._snapshot(scope, send)
+        elif method == "GET" and path == "/health/ready":
+            return await self._ready(send)
+        elif path == "/watch":
+            return await _send_json(send, 400, {
+                "detail": f"LSNs are per partition: watch each partition with ?partition=0..{self.partitions - 1}"})
+        else:
+            target = self.partition
+
+        if target == self.partition:
+            return await self.app(scope, _replay(body, receive) if body else receive, send)
+        if not body and method in ("POST", "PUT", "PATCH"):
+            body = await _read_body(receive)
+        await self._forward(target, scope, body, send)
+
+    # --- Forwarding ---
+
+    def _request(self, partition: int, method: str, path: str, query_string: bytes = b"",
+                 headers: Optional[List[Tuple[bytes, bytes]]] = None,
+                 body: Union[bytes, AsyncIterator[bytes]] = b"") -> httpx.Request:
+        hdrs = [(k, v) for k, v in (headers or []) if k.lower() not in _REQUEST_HOP_HEADERS]
+        hdrs.append((FORWARDED_HEADER, b"1"))
+        url = path + ("?" + query_string.decode("latin-1") if query_string else "")
+        return self._client(partition).build_request(method, url, headers=hdrs, content=body)
+
+    async def _forward(self, partition: int, scope, body: bytes, send):
+        request = self._request(partition, scope["method"], scope["path"], scope["query_string"],
+                                scope["headers"], body)
+        try:
+            response = await self._client(partition).send(request, stream=True)
+        except httpx.TransportError as e:
+            return await _send_json(send, 503, {"detail": f"Partition {partition} unavailable: {e}"})
+        try:
+            headers = [(k, v) for k, v in response.headers.raw if k.lower() not in _HOP_HEADERS]
+            await send({"type": "http.response.start", "status": response.status_code, "headers": headers})
+            # Relay chunk by chunk so streaming responses (/watch) keep streaming.
+            async for chunk in response.aiter_raw():
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            await send({"type": "http.response.body", "body": b""})
+        finally:
+            await response.aclose()
+
+    async def _scatter(self, requests: Dict[int, httpx.Request]) -> Dict[int, Any]:
+        """Send one request per partition concurrently; each result is a Response or an exception."""
+        parts = list(requests)
+        results = await asyncio.gather(*(self._client(p).send(requests[p]) for p in parts),
+                                       return_exceptions=True)
+        return dict(zip(parts, results))
+
+    async def _gather_json(self, scope, send, method: str, path: str, query_string: bytes):
+        """Scatter one request to every partition; send an error response and return None on failure."""
+        results = await self._scatter({p: self._request(p, method, path, query_string)
+                                       for p in range(self.partitions)})
+        bodies = {}
+        for p, result in results.items():
+            if isinstance(result, Exception):
+                await _send_json(send, 503, {"detail": f"Partition {p} unavailable: {result}"})
+                return None
+            if result.status_code != 200:
+                await _send_response(send, result)
+                return None
+            bodies[p] = result.json()
+        return bodies
+
+    # --- Fan-out routes ---
+
+    async def _bulk(self, scope, body: bytes, send):
+        try:
+            payload = json.loads(body)
+            items = payload["items"]
+            groups: Dict[int, List[Any]] = {}
+            for item in items:
+                groups.setdefault(partition_for(item[0], self.partitions), []).append(item)
+        except (ValueError, KeyError, TypeError, IndexError):
+            # Malformed: let this worker's validation produce the error response.
+            return await self.app(scope, _replay(body, _disconnected), send)
+
+        requests = {}
+        for p, group in groups.items():
+            sub = json.dumps(dict(payload, items=group)).encode("utf-8")
+            requests[p] = self._request(p, "POST", "/bulk", headers=[(b"content-type", b"application/json")],
+                                        body=sub)
+        results = await self._scatter(requests)
+        failed = sorted(p for p, r in results.items() if isinstance(r, Exception) or r.status_code != 200)
+        if failed:
+            return await _send_json(send, 500, {"detail": f"Bulk write failed on partitions {failed}",
+                                                "written": sum(len(groups[p]) for p in results if p not in failed)})
+        await _send_json(send, 200, {"status": "ok", "count": len(items)})
+
+    async def _import(self, scope, receive, send):
+        """Stream each line of an NDJSON import to the /import of the partition owning its key."""
+        queues = {p: asyncio.Queue(maxsize=8) for p in range(self.partitions)}
+        sends = {p: asyncio.ensure_future(self._client(p).send(self._request(
+                     p, "POST", "/import", scope["query_string"], scope["headers"], _drain(queues[p]))))
+                 for p in range(self.partitions)}
+
+        async def feed(p: int, chunk: Optional[bytes]):
+            # A partition that already answered (e.g. rejected a line) reads no more input.
+            put = asyncio.ensure_future(queues[p].put(chunk))
+            await asyncio.wait({put, sends[p]}, return_when=asyncio.FIRST_COMPLETED)
+            if not put.done():
+                put.cancel()
+
+        pending = b""
+        try:
+            while True:
+                message = await receive()
+                if message["type"] != "http.request":
+                    break
+                lines = (pending + message.get("body", b"")).split(b"\n")
+                pending = lines.pop()
+                more = message.get("more_body", False)
+                if not more:
+                    lines.append(pending)
+                groups: Dict[int, List[bytes]] = {}
+                for line in lines:
+                    if line.strip():
+                        key = _json_field(line, "key")
+                        # Malformed lines go to this worker, whose /import reports them.
+                        p = partition_for(key, self.partitions) if isinstance(key, str) else self.partition
+                        groups.setdefault(p, []).append(line)
+                for p, group in groups.items():
+                    await feed(p, b"\n".join(group) + b"\n")
+                if not more:
+                    break
+        finally:
+            for p in queues:
+                await feed(p, None)
+
+        results = dict(zip(sends, await asyncio.gather(*sends.values(), return_exceptions=True)))
+        count, errors, status = 0, [], 200
+        for p, result in sorted(results.items()):
+            if isinstance(result, Exception):
+                errors.append(f"partition {p}: unavailable: {result}")
+                status = 503
+                continue
+            body = result.json()
+            # A partition that refused a line still reports the records it imported before it.
+            count += body.get("count", 0)
+            if result.status_code != 200:
+                errors.append(f"partition {p}: {body.get('detail')}")
+                status = result.status_code if status == 200 else status
+        if errors:
+            return await _send_json(send, status, {"detail": "; ".join(errors), "count": count})
+        await _send_json(send, 200, {"status": "ok", "count": count})
+
+    async def _export(self, scope, send):
+        """Concatenate the partitions' NDJSON dumps (each point-in-time for its own partition)."""
+        started = False
+        for p in range(self.partitions):
+            request = self._request(p, "GET", "/export", scope["query_string"])
+            try:
+                response = await self._client(p).send(request, stream=True)
+            except httpx.TransportError as e:
+                if not started:
+                    return await _send_json(send, 503, {"detail": f"Partition {p} unavailable: {e}"})
+                raise
+            try:
+                if response.status_code != 200:
+                    await response.aread()
+                    if not started:
+                        return await _send_response(send, response)
+                    raise RuntimeError(f"Partition {p} export failed with {response.status_code}")
+                if not started:
+                    await send({"type": "http.response.start", "status": 200,
+                                "headers": [(b"content-type", b"application/x-ndjson")]})
+                    started = True
+                async for chunk in response.aiter_raw():
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            finally:
+                await response.aclose()
+        await send({"type": "http.response.body", "body": b""})
+
+    def _txn_partition(self, body: bytes) -> Optional[int]:
+        """The single partition a transaction touches (own partition if none/malformed), or None."""
+        try:
+            payload = json.loads(body)
+            keys = list(payload.get("checks", {}))
+            keys += [item[0] for item in payload.get("set", [])]
+            keys += list(payload.get("delete", []))
+            owners = {partition_for(k, self.partitions) for k in keys}
+        except (ValueError, TypeError, AttributeError, IndexError):
+            return self.partition
+        if len(owners) > 1:
+            return None
+        return owners.pop() if owners else self.partition
+
+    async def _search(self, scope, send):
+        bodies = await self._gather_json(scope, send, "GET", "/search", scope["query_string"])
+        if bodies is not None:
+            keys = [k for p in sorted(bodies) for k in bodies[p]["keys"]]
+            await _send_json(send, 200, {"query": bodies[0]["query"], "keys": keys})
+
+    async def _vector_search(self, scope, query: Dict[str, List[str]], send):
+        params = {k: v[0] for k, v in query.items()}
+        with_scores = params.get("scores", "").lower() in ("1", "true")
+        params["scores"] = "true"  # partitions must return scores so the results can be merged
+        bodies = await self._gather_json(scope, send, "GET", "/vector_search", urlencode(params).encode())
+        if bodies is None:
+            return
+        try:
+            top_k = int(params.get("top_k", 5))
+        except ValueError:
+            top_k = 5
+        merged = sorted(((s, k) for b in bodies.values() for k, s in zip(b["keys"], b["scores"])),
+                        key=lambda sk: sk[0], reverse=True)[:top_k]
+        result = {"query": bodies[0]["query"], "keys": [k for _, k in merged]}
+        if with_scores:
+            result["scores"] = [s for s, _ in merged]
+        await _send_json(send, 200, result)
+
+    async def _snapshot(self, scope, send):
+        bodies = await self._gather_json(scope, send, "POST", "/snapshot", b"")
+        if bodies is not None:
+            await _send_json(send, 200, {"status": "ok", "partitions": self.partitions})
+
+    async def _ready(self, send):
+        """Each partition's readiness; 200 only when all of them are ready."""
+        results = await self._scatter({p: self._request(p, "GET", "/health/ready")
+                                       for p in range(self.partitions)})
+        partitions = []
+        for p, result in sorted(results.items()):
+            if isinstance(result, Exception):
+                partitions.append({"status": "starting", "detail": str(result)})
+            else:
+                partitions.append(result.json())
+        ready = all(body.get("status") == "ready" for body in partitions)
+        await _send_json(send, 200 if ready else 503,
+                         {"status": "ready" if ready else "recovering", "partitions": partitions})
+
+
+async def _read_body(receive) -> bytes:
+    chunks = []
+    while True:
+        message = await receive()
+        if message["type"] != "http.request":
+            break
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body", False):
+            break
+    return b"".join(chunks)
+
+
+async def _drain(queue: asyncio.Queue) -> AsyncIterator[bytes]:
+    """Request body fed through `queue`; None ends it."""
+    while True:
+        chunk = await queue.get()
+        if chunk is None:
+            return
+        yield chunk
+
+
+def _replay(body: bytes, receive):
+    """A receive callable that yields an already-read body once, then defers to `receive`."""
+    sent = False
+
+    async def replay():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        return await receive()
+    return replay
+
+
+async def _disconnected():
+    return {"type": "http.disconnect"}
+
+
+def _json_field(body: bytes, field: str) -> Any:
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        return None
+    return payload.get(field) if isinstance(payload, dict) else None
+
+
+async def _send_json(send, status: int, payload: Dict[str, Any]):
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", b"application/json")]})
+    await send({"type": "http.response.body", "body": json.dumps(payload, separators=(",", ":")).encode("utf-8")})
+
+
+async def _send_response(send, response: httpx.Response):
+    """Relay a fully-read httpx response."""
+    headers = [(k, v) for k, v in response.headers.raw if k.lower() not in _HOP_HEADERS]
+    await send({"type": "http.response.start", "status": response.status_code, "headers": headers})
+    await send({"type": "http.response.body", "body": response.content})
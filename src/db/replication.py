@@ -1,38 +1,90 @@
 import asyncio
 import httpx
 import logging
+import random
 import time
-from typing import List, Optional, Callable
+from typing import Dict, List, Optional, Callable
 from enum import Enum
+from src.db import tracing
+from src.db.metrics import MetricsRegistry, REGISTRY
 
 logger = logging.getLogger(__name__)
 
+# Election traffic: sent on its own connections so it never queues behind replication.
+CONTROL_RPCS = ("heartbeat", "vote")
+
 class Role(Enum):
     FOLLOWER = "FOLLOWER"
     CANDIDATE = "CANDIDATE"
     LEADER = "LEADER"
 
 class ReplicationManager:
-    def __init__(self, node_id: int, peers: List[str], db_engine):
+    """
+    Leader election and log shipping for one node.
+
+    `clock`, `rng` and `transport` default to wall time, the global random
+    module and real HTTP; tests/cluster_sim.py replaces them to run several
+    nodes deterministically in one process.
+    """
+
+    def __init__(self, node_id: int, peers: List[str], db_engine, metrics: Optional[MetricsRegistry] = None,
+                 clock: Callable[[], float] = time.time, rng: Optional[random.Random] = None,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
         self.node_id = node_id
         self.peers = peers # List of "http://host:port"
         self.role = Role.FOLLOWER
         self.leader: Optional[str] = None
         self.term = 0
-        self.last_heartbeat = time.time()
+        self.clock = clock
+        self.rng = rng or random
+        self.last_heartbeat = clock()
         self.db = db_engine
         
         self.election_timeout_min = 1.5
         self.election_timeout_max = 3.0
         self.heartbeat_interval = 0.5
-        self.client = httpx.AsyncClient(timeout=1.0)
+        self.client = httpx.AsyncClient(timeout=1.0, transport=transport)
+        self.control_client = httpx.AsyncClient(timeout=1.0, transport=transport)
+        # peer -> records sent to it and not yet acknowledged
+        self._outstanding: Dict[str, int] = {peer: 0 for peer in peers}
         self._loop_task = None
         self._reset_election_deadline()
+
+        m = metrics or REGISTRY
+        self._m_rpc = m.histogram("rpc_seconds", "Latency of internal RPCs to peers", ["peer", "rpc"])
+        self._m_rpc_errors = m.counter("rpc_errors_total", "Failed internal RPCs to peers", ["peer", "rpc"])
+        self._m_lag = m.gauge("replication_lag_seconds", "Time from local commit until the peer acked the last replicated record", ["peer"])
+        self._m_elections = m.counter("elections_started_total", "Elections started by this node")
+        self._m_elections_won = m.counter("elections_won_total", "Elections won by this node")
+        self._m_term = m.gauge("term", "Current election term")
+        self._m_backlog = m.gauge("replication_backlog", "Replicated records not yet acknowledged by the peer", ["peer"])
+
+    async def _post(self, peer: str, rpc: str, payload: dict, content: Optional[bytes] = None) -> httpx.Response:
+        """
+        POST to a peer's internal endpoint, recording latency and failures.
+
+        `content`, if given, is `payload` already encoded as JSON and is sent as-is.
+        """
+        client = self.control_client if rpc in CONTROL_RPCS else self.client
+        t0 = time.perf_counter()
+        try:
+            if content is not None:
+                resp = await client.post(f"{peer}/internal/{rpc}", content=content,
+                                         headers={"content-type": "application/json"})
+            else:
+                resp = await client.post(f"{peer}/internal/{rpc}", json=payload)
+        except Exception:
+            self._m_rpc_errors.labels(peer, rpc).inc()
+            raise
+        finally:
+            self._m_rpc.labels(peer, rpc).observe(time.perf_counter() - t0)
+        if resp.status_code != 200:
+            self._m_rpc_errors.labels(peer, rpc).inc()
+        return resp
     
     def _reset_election_deadline(self):
-        import random
-        delay = random.uniform(self.election_timeout_min, self.election_timeout_max)
-        self.election_deadline = time.time() + delay
+        delay = self.rng.uniform(self.election_timeout_min, self.election_timeout_max)
+        self.election_deadline = self.clock() + delay
 
     async def start(self):
         # Start background tasks
@@ -48,16 +100,14 @@ class ReplicationManager:
             await asyncio.sleep(0.1)
 
     async def _send_heartbeats(self):
-        for peer in self.peers:
-            try:
-                # Fire and forget / Log errors
-                await self.client.post(f"{peer}/internal/heartbeat", json={"term": self.term, "leader_id": self.node_id})
-            except Exception as e:
-                pass
+        # Concurrently, so a slow peer does not delay the others' heartbeats.
+        payload = {"term": self.term, "leader_id": self.node_id}
+        await asyncio.gather(*(self._post(peer, "heartbeat", payload) for peer in self.peers),
+                             return_exceptions=True)
         await asyncio.sleep(self.heartbeat_interval)
 
     async def _check_election_timeout(self):
-        if time.time() > self.election_deadline:
+        if self.clock() > self.election_deadline:
             logger.info("Election timeout! becoming candidate.")
             await self._start_election()
             self._reset_election_deadline()
@@ -65,22 +115,22 @@ class ReplicationManager:
     async def _start_election(self):
         self.role = Role.CANDIDATE
         self.term += 1
+        self._m_term.set(self.term)
+        self._m_elections.inc()
         self.vote_count = 1 # Self
-        # Simplified: Request votes
-        # In this simple logic, highest ID wins or first to request wins?
-        # Let's simple ask everyone.
-        
-        for peer in self.peers:
-            try:
-                resp = await self.client.post(f"{peer}/internal/vote", json={"term": self.term, "candidate_id": self.node_id})
-                if resp.status_code == 200 and resp.json().get("vote_granted"):
-                    self.vote_count += 1
-            except:
-                pass
+        # Ask everyone at once: asking in turn, an unreachable peer's timeout gives
+        # another follower time to start a competing election for the same term.
+        payload = {"term": self.term, "candidate_id": self.node_id}
+        replies = await asyncio.gather(*(self._post(peer, "vote", payload) for peer in self.peers),
+                                       return_exceptions=True)
+        for resp in replies:
+            if isinstance(resp, httpx.Response) and resp.status_code == 200 and resp.json().get("vote_granted"):
+                self.vote_count += 1
         
         if self.vote_count > (len(self.peers) + 1) // 2:
             self.role = Role.LEADER
             self.leader = self.node_id
+            self._m_elections_won.inc()
             logger.info(f"Won election. I am LEADER {self.node_id}")
             # Announce
             await self._send_heartbeats()
@@ -89,33 +139,56 @@ class ReplicationManager:
             await asyncio.sleep(0.5)
 
     def receive_heartbeat(self, term: int, leader_id: int):
-        self.last_heartbeat = time.time()
+        self.last_heartbeat = self.clock()
         self._reset_election_deadline()
         if term >= self.term:
             self.term = term
+            self._m_term.set(term)
             self.role = Role.FOLLOWER
             self.leader = leader_id
 
+    def leader_active(self):
+        """A record replicated from the leader proves it is alive, like a heartbeat would."""
+        self.last_heartbeat = self.clock()
+        self._reset_election_deadline()
+
+    def replication_backlog(self) -> int:
+        """Unacknowledged records of the most lagging peer."""
+        return max(self._outstanding.values(), default=0)
+
     def receive_vote_request(self, term: int, candidate_id: int) -> bool:
         if term > self.term:
             self.term = term
+            self._m_term.set(term)
             self.role = Role.FOLLOWER
             self._reset_election_deadline()
             return True
         return False
 
-    async def replicate_to_peers(self, op_data: dict):
-        # Called by Primary after local write
+    async def replicate_to_peers(self, op_data: dict, raw: Optional[str] = None):
+        # Called by Primary after local write. `raw` is op_data's WAL line, sent
+        # verbatim so large records are not serialized again for every peer.
         if self.role != Role.LEADER:
             return
+        content = raw.encode("utf-8") if raw is not None else None
         
         # Best effort or Quorum? Requirement: "Replicate..."
         # We will try to send to all.
+        committed_at = time.perf_counter()
+        for peer in self.peers:
+            self._outstanding[peer] += 1
+            self._m_backlog.labels(peer).set(self._outstanding[peer])
         for peer in self.peers:
             try:
-                resp = await self.client.post(f"{peer}/internal/replicate", json=op_data)
-                if resp.status_code != 200:
+                with tracing.span("replication.replicate", peer=peer):
+                    resp = await self._post(peer, "replicate", op_data, content=content)
+                if resp.status_code == 200:
+                    self._m_lag.labels(peer).set(time.perf_counter() - committed_at)
+                else:
                     logger.error(f"Replication failed to {peer}: {resp.status_code} {resp.text}")
             except Exception as e:
                 logger.error(f"Replication connection error to {peer}: {e}")
+            finally:
+                self._outstanding[peer] -= 1
+                self._m_backlog.labels(peer).set(self._outstanding[peer])
 
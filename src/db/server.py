@@ -1,13 +1,29 @@
 from fastapi import FastAPI, HTTPException, Body, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from typing import Any, List, Optional, Tuple
+from typing import Any, Dict, List, Optional, Tuple, Union
 import uvicorn
 import os
 import signal
 import sys
 import asyncio
+import logging
+import time
+import json
+from src.db.admission import AdmissionControl
 from src.db.engine import KVStore
+from src.db.health import ReadinessGate
+from src.db.delta import DeltaError, parse_pointer
+from src.db.indexes import resolve_stopwords
+from src.db.changes import filter_record
+from src.db.partition import PartitionRouter
+from src.db.wire import WireError, parse_object, record_line
 from src.db.replication import ReplicationManager, Role
+from src.db.metrics import REGISTRY
+from src.db.tracing import Tracer, current_trace
+
+logger = logging.getLogger(__name__)
 
 app = FastAPI(title="NoSQL KV Store")
 
@@ -16,29 +32,186 @@ data_dir = os.getenv("DB_DATA_DIR", "data")
 node_id = int(os.getenv("DB_NODE_ID", "0"))
 peers_str = os.getenv("DB_PEERS", "")
 peers = [p.strip() for p in peers_str.split(",")] if peers_str else []
+reap_interval = float(os.getenv("DB_REAP_INTERVAL", "1.0"))
+reap_batch = int(os.getenv("DB_REAP_BATCH", "1000"))
+watch_keepalive = float(os.getenv("DB_WATCH_KEEPALIVE", "15"))
+# Admission control (see src/db/admission.py); 0 disables a limit.
+max_inflight_writes = int(os.getenv("DB_MAX_INFLIGHT_WRITES", "1000"))
+max_replication_backlog = int(os.getenv("DB_MAX_REPLICATION_BACKLOG", "1000"))
+max_wal_bytes = int(os.getenv("DB_MAX_WAL_BYTES", "0"))
+retry_after = float(os.getenv("DB_RETRY_AFTER", "1"))
+# Multi-process mode (see src/db/workers.py): this worker serves one key-hash partition.
+partition = int(os.getenv("DB_PARTITION", "0"))
+partitions = int(os.getenv("DB_PARTITIONS", "1"))
 
-db = KVStore(data_dir=data_dir)
+db = KVStore(
+    data_dir=data_dir,
+    value_encoding=os.getenv("DB_VALUE_ENCODING", "object"),
+    compression=os.getenv("DB_VALUE_COMPRESSION", "zlib"),
+    compress_threshold=int(os.getenv("DB_COMPRESS_THRESHOLD", "1024")),
+    storage=os.getenv("DB_STORAGE", "memory"),
+    cache_bytes=int(os.getenv("DB_CACHE_BYTES", "0")),
+    cache_policy=os.getenv("DB_CACHE_POLICY", "lru"),
+    change_log_size=int(os.getenv("DB_CHANGE_LOG_SIZE", "10000")),
+    stopwords=resolve_stopwords(os.getenv("DB_STOPWORDS", "")),
+    vector_index=os.getenv("DB_VECTOR_INDEX", "on") != "off",
+    # Recovered in the background once the server is up (see recover()).
+    recover=False,
+)
 repl_manager = None
+recovery_task: Optional[asyncio.Task] = None
+
+tracer = Tracer.from_env(data_dir)
+
+_m_keys = REGISTRY.gauge("keys", "Number of keys stored")
+_m_is_leader = REGISTRY.gauge("is_leader", "1 if this node is currently the leader")
+_m_watchers = REGISTRY.gauge("watchers", "Open /watch streams")
 
 @app.on_event("startup")
 async def startup_event():
-    global repl_manager
+    global repl_manager, recovery_task
     repl_manager = ReplicationManager(node_id, peers, db)
+    recovery_task = asyncio.create_task(recover())
+
+async def recover():
+    """Load the snapshot and replay the WAL off the event loop, then start serving and electing."""
+    try:
+        await run_in_threadpool(db.load)
+    except Exception as e:
+        logger.exception("Recovery failed")
+        db.recovery.update(phase="failed", error=str(e))
+        return
+    logger.info(f"Recovered {len(db._data)} keys in {db.recovery.get('seconds')}s.")
     # If no peers, we are effectively a single node leader
     if not peers:
         repl_manager.role = Role.LEADER
     else:
         # Start monitoring loop
         await repl_manager.start()
+    asyncio.create_task(reap_expired_keys())
+
+async def reap_expired_keys():
+    """Leader-only: delete expired keys in batches and replicate each batch as one record."""
+    while True:
+        await asyncio.sleep(reap_interval)
+        if repl_manager.role != Role.LEADER:
+            continue
+        try:
+            while True:
+                record = db.reap_expired(max_batch=reap_batch)
+                if record is None:
+                    break
+                await repl_manager.replicate_to_peers(record)
+        except Exception as e:
+            logger.error(f"Expiry reaper failed: {e}")
+
+async def trace_requests(request: Request, call_next):
+    token = tracer.start(f"{request.method} {request.url.path}")
+    trace = current_trace()
+    try:
+        response = await call_next(request)
+        trace.attrs["status"] = response.status_code
+    finally:
+        tracer.finish(token)
+    return response
+
+# Only pay for the middleware when tracing or the slow-op log is configured.
+if tracer.enabled:
+    app.middleware("http")(trace_requests)
+
+checkpoint_task: Optional[asyncio.Task] = None
+
+def start_checkpoint():
+    """Snapshot in the background (at most one at a time) to empty a WAL that reached DB_MAX_WAL_BYTES."""
+    global checkpoint_task
+    if checkpoint_task is None or checkpoint_task.done():
+        logger.warning(f"WAL reached {db.wal_size} bytes; taking a snapshot.")
+        checkpoint_task = asyncio.get_running_loop().create_task(run_in_threadpool(db.create_snapshot))
+
+# Added before the partition router so that it only sees requests this worker handles.
+app.add_middleware(AdmissionControl, max_inflight_writes=max_inflight_writes,
+                   max_replication_backlog=max_replication_backlog, max_wal_bytes=max_wal_bytes,
+                   retry_after=retry_after,
+                   replication_backlog=lambda: repl_manager.replication_backlog() if repl_manager else 0,
+                   wal_bytes=lambda: db.wal_size, on_wal_full=start_checkpoint)
+
+# Outside admission control: a recovering node refuses everything, counted or not.
+app.add_middleware(ReadinessGate, ready=lambda: db.ready, progress=lambda: dict(db.recovery),
+                   retry_after=retry_after)
+
+if partitions > 1:
+    app.add_middleware(PartitionRouter, partition=partition, partitions=partitions,
+                       socket_dir=os.getenv("DB_SOCKET_DIR", data_dir))
 
 class SetRequest(BaseModel):
     key: str
     value: Any
     debug: Optional[bool] = False
+    ttl: Optional[float] = None
 
 class BulkSetRequest(BaseModel):
     items: List[Tuple[str, Any]]
     debug: Optional[bool] = False
+    ttl: Optional[float] = None
+
+class CompareAndSetRequest(BaseModel):
+    key: str
+    value: Any
+    expected_version: int
+    ttl: Optional[float] = None
+
+class TransactionRequest(BaseModel):
+    checks: Dict[str, int] = {}
+    set: List[Tuple[str, Any]] = []
+    delete: List[str] = []
+
+class IncrRequest(BaseModel):
+    key: str
+    by: Union[int, float] = 1
+
+class AppendRequest(BaseModel):
+    key: str
+    value: Any
+
+class PatchRequest(BaseModel):
+    key: str
+    path: str  # RFC 6901 JSON Pointer, e.g. "/profile/name"
+    value: Any
+
+class MergeRequest(BaseModel):
+    key: str
+    patch: Any  # RFC 7396 merge patch
+
+def expire_at_from_ttl(ttl: Optional[float]) -> Optional[float]:
+    if ttl is None:
+        return None
+    if ttl <= 0:
+        raise HTTPException(status_code=400, detail="ttl must be positive")
+    return time.time() + ttl
+
+def request_body_schema(model) -> dict:
+    """OpenAPI body for endpoints that parse the raw body themselves but accept `model`."""
+    return {"requestBody": {"required": True,
+                            "content": {"application/json": {"schema": model.model_json_schema()}}}}
+
+async def read_fields(request: Request) -> dict:
+    try:
+        return parse_object(await request.body())
+    except WireError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+def get_field(fields: dict, name: str, types, default: Any = ...) -> Any:
+    """Value of a parsed body field, checked against `types` (bool is never a number)."""
+    if name not in fields:
+        if default is ...:
+            raise HTTPException(status_code=422, detail=f"Field '{name}' is required")
+        return default
+    value = fields[name][0]
+    if value is None and default is not ...:
+        return default
+    if not isinstance(value, types) or (isinstance(value, bool) and bool not in types):
+        raise HTTPException(status_code=422, detail=f"Field '{name}' has the wrong type")
+    return value
 
 # --- Middleware / Dependency to check Leader ---
 def ensure_leader():
@@ -50,22 +223,38 @@ def ensure_leader():
 @app.get("/get/{key}")
 async def get_key(key: str):
     ensure_leader()
-    val = db.get(key)
-    if val is None:
+    val, version = db.get_with_version(key)
+    if not version:
         raise HTTPException(status_code=404, detail="Key not found")
-    return {"key": key, "value": val}
+    return {"key": key, "value": val, "version": version}
+
+# /set and /bulk parse the raw body instead of going through SetRequest/BulkSetRequest:
+# pydantic validation of Any payloads is expensive, and the value's JSON text from the
+# request is spliced into the WAL line and replication body without re-encoding it.
 
-@app.post("/set")
-async def set_key(req: SetRequest):
+@app.post("/set", openapi_extra=request_body_schema(SetRequest))
+async def set_key(request: Request):
     ensure_leader()
-    success = db.set(req.key, req.value, debug_simulate_error=req.debug)
+    fields = await read_fields(request)
+    key = get_field(fields, "key", (str,))
+    if "value" not in fields:
+        raise HTTPException(status_code=422, detail="Field 'value' is required")
+    value, raw_value = fields["value"]
+    debug = get_field(fields, "debug", (bool,), False)
+    expire_at = expire_at_from_ttl(get_field(fields, "ttl", (int, float), None))
+
+    record = {"op": "SET", "k": key, "v": value}
+    if expire_at is not None:
+        record["exp"] = expire_at
+    line = record_line(record, {"v": raw_value})
+    success = db.set(key, value, debug_simulate_error=debug, expire_at=expire_at, wal_line=line)
     if not success:
         raise HTTPException(status_code=500, detail="Write failed")
     
     # Replicate
-    await repl_manager.replicate_to_peers({"op": "SET", "k": req.key, "v": req.value})
+    await repl_manager.replicate_to_peers(record, raw=line)
     
-    return {"status": "ok", "key": req.key}
+    return {"status": "ok", "key": key}
 
 @app.delete("/delete/{key}")
 async def delete_key(key: str):
@@ -76,17 +265,280 @@ async def delete_key(key: str):
         await repl_manager.replicate_to_peers({"op": "DEL", "k": key})
     return {"status": "ok", "key": key}
 
-@app.post("/bulk")
-async def bulk_set(req: BulkSetRequest):
+@app.post("/bulk", openapi_extra=request_body_schema(BulkSetRequest))
+async def bulk_set(request: Request):
     ensure_leader()
-    success = db.bulk_set(req.items, debug_simulate_error=req.debug)
+    fields = await read_fields(request)
+    items = get_field(fields, "items", (list,))
+    for item in items:
+        if type(item) is not list or len(item) != 2 or type(item[0]) is not str:
+            raise HTTPException(status_code=422, detail="Each item must be a [key, value] pair with a string key")
+    debug = get_field(fields, "debug", (bool,), False)
+    expire_at = expire_at_from_ttl(get_field(fields, "ttl", (int, float), None))
+
+    record = {"op": "BULK", "data": items}
+    if expire_at is not None:
+        record["exp"] = expire_at
+    line = record_line(record, {"data": fields["items"][1]})
+    success = db.bulk_set(items, debug_simulate_error=debug, expire_at=expire_at, wal_line=line)
     if not success:
         raise HTTPException(status_code=500, detail="Bulk write failed")
     
     # Replicate
-    await repl_manager.replicate_to_peers({"op": "BULK", "data": req.items})
+    await repl_manager.replicate_to_peers(record, raw=line)
     
-    return {"status": "ok", "count": len(req.items)}
+    return {"status": "ok", "count": len(items)}
+
+@app.post("/cas")
+async def compare_and_set(req: CompareAndSetRequest):
+    ensure_leader()
+    expire_at = expire_at_from_ttl(req.ttl)
+    success, version = db.compare_and_set(req.key, req.value, req.expected_version, expire_at=expire_at)
+    if not success:
+        if version < 0:
+            raise HTTPException(status_code=500, detail="Write failed")
+        raise HTTPException(status_code=409, detail={"error": "version mismatch", "current_version": version})
+
+    record = {"op": "SET", "k": req.key, "v": req.value}
+    if expire_at is not None:
+        record["exp"] = expire_at
+    await repl_manager.replicate_to_peers(record)
+
+    return {"status": "ok", "key": req.key, "version": version}
+
+@app.post("/txn")
+async def transaction(req: TransactionRequest):
+    ensure_leader()
+    success, versions = db.transact(req.checks, req.set, req.delete)
+    if not success:
+        if not versions:
+            raise HTTPException(status_code=500, detail="Transaction write failed")
+        raise HTTPException(status_code=409, detail={"error": "read set changed", "conflicts": versions})
+
+    # The whole transaction replicates as the same single record the leader logged.
+    record = {"op": "TXN", "set": [[k, v] for k, v in req.set], "del": req.delete}
+    await repl_manager.replicate_to_peers(record)
+
+    return {"status": "ok", "versions": versions}
+
+async def apply_update(record: dict) -> Any:
+    """Log a delta record locally, replicate what was logged, return the new value."""
+    try:
+        logged, value = db.update(record)
+    except DeltaError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if logged is None:
+        raise HTTPException(status_code=500, detail="Write failed")
+    await repl_manager.replicate_to_peers(logged)
+    return value
+
+@app.post("/incr")
+async def incr(req: IncrRequest):
+    ensure_leader()
+    value = await apply_update({"op": "INCR", "k": req.key, "by": req.by})
+    return {"status": "ok", "key": req.key, "value": value}
+
+@app.post("/append")
+async def append(req: AppendRequest):
+    ensure_leader()
+    await apply_update({"op": "APPEND", "k": req.key, "v": req.value})
+    return {"status": "ok", "key": req.key}
+
+@app.post("/patch")
+async def patch(req: PatchRequest):
+    ensure_leader()
+    try:
+        path = parse_pointer(req.path)
+    except DeltaError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    await apply_update({"op": "PATCH", "k": req.key, "path": path, "v": req.value})
+    return {"status": "ok", "key": req.key}
+
+@app.post("/merge")
+async def merge(req: MergeRequest):
+    ensure_leader()
+    await apply_update({"op": "MERGE", "k": req.key, "v": req.patch})
+    return {"status": "ok", "key": req.key}
+
+@app.get("/ttl/{key}")
+async def get_ttl(key: str):
+    ensure_leader()
+    if not db.version(key):  # not get(): a key may hold null
+        raise HTTPException(status_code=404, detail="Key not found")
+    return {"key": key, "ttl": db.ttl(key)}
+
+@app.get("/search")
+async def search(q: str):
+    """Full-text search: every word, `prefix*` term and "quoted phrase" in `q` must match."""
+    ensure_leader()
+    return {"query": q, "keys": db.search(q)}
+
+@app.get("/vector_search")
+async def vector_search(q: str, top_k: int = 5, scores: bool = False):
+    ensure_leader()
+    if not db.indexer.vectors_enabled:
+        raise HTTPException(status_code=400, detail="Vector index is disabled (DB_VECTOR_INDEX=off)")
+    if not scores:
+        return {"query": q, "keys": db.vector_search(q, top_k=top_k)}
+    results = db.vector_search_scored(q, top_k=top_k)
+    return {"query": q, "keys": [k for _, k in results], "scores": [s for s, _ in results]}
+
+def format_change(fmt: str, lsn: int, event: dict, kind: str = "change") -> str:
+    payload = json.dumps({"lsn": lsn, **event})
+    if fmt == "ndjson":
+        return payload + "\n"
+    return f"id: {lsn}\nevent: {kind}\ndata: {payload}\n\n"
+
+async def stream_changes(request: Request, prefix: str, after: int, fmt: str):
+    feed = db.changes
+    watcher = feed.subscribe()
+    try:
+        while True:
+            records, last_lsn = feed.read(after)
+            if records is None:
+                # Too far behind (or an LSN this node never issued): resync and watch from last_lsn.
+                yield format_change(fmt, last_lsn, {"op": "RESET"}, kind="reset")
+                return
+            for lsn, record in records:
+                after = lsn
+                event = filter_record(record, prefix)
+                if event is not None:
+                    yield format_change(fmt, lsn, event)
+            if records:
+                continue
+            if await request.is_disconnected():
+                return
+            if not await feed.wait(watcher, after, watch_keepalive):
+                yield "\n" if fmt == "ndjson" else ": keepalive\n\n"
+    finally:
+        feed.unsubscribe(watcher)
+
+@app.get("/watch")
+async def watch(request: Request, prefix: str = "", since: Optional[int] = None, format: str = "sse"):
+    """
+    Stream committed changes as server-sent events (default) or NDJSON.
+
+    Each event carries the record's LSN; pass it back as `since` (or rely on
+    EventSource's Last-Event-ID) to resume without gaps. Without `since`, only
+    changes made after the request are streamed.
+    """
+    ensure_leader()
+    if db.changes is None:
+        raise HTTPException(status_code=404, detail="Change feed disabled (DB_CHANGE_LOG_SIZE=0)")
+    if format not in ("sse", "ndjson"):
+        raise HTTPException(status_code=400, detail="format must be 'sse' or 'ndjson'")
+    if since is None:
+        last_event_id = request.headers.get("last-event-id")
+        since = int(last_event_id) if last_event_id and last_event_id.isdigit() else db.changes.last_lsn
+    media_type = "application/x-ndjson" if format == "ndjson" else "text/event-stream"
+    return StreamingResponse(stream_changes(request, prefix, since, format), media_type=media_type,
+                             headers={"Cache-Control": "no-cache"})
+
+# --- Bulk import / export (NDJSON, one {"key": ..., "value": ..., "exp": ...} object per line) ---
+
+def parse_import_line(line: bytes, now: float) -> Tuple[str, Any, str, Optional[float]]:
+    """(key, value, value JSON text, expire_at) of one /import line; `exp` is absolute, `ttl` relative."""
+    fields = parse_object(line)
+    key = get_field(fields, "key", (str,))
+    if "value" not in fields:
+        raise HTTPException(status_code=422, detail="Field 'value' is required")
+    value, raw_value = fields["value"]
+    expire_at = get_field(fields, "exp", (int, float), None)
+    ttl = get_field(fields, "ttl", (int, float), None)
+    if ttl is not None:
+        expire_at = now + ttl
+    return key, value, raw_value, expire_at
+
+async def import_batch(items: list, raw_items: list, expire_at: Dict[str, float]):
+    record = {"op": "IMPORT", "data": items}
+    if expire_at:
+        record["exp"] = expire_at
+    line = record_line(record, {"data": "[" + ", ".join(raw_items) + "]"})
+    if not db.import_batch(items, expire_at=expire_at, wal_line=line):
+        raise HTTPException(status_code=500, detail="Import write failed")
+    await repl_manager.replicate_to_peers(record, raw=line)
+
+@app.post("/import")
+async def import_ndjson(request: Request, batch_size: int = 1000):
+    """
+    Stream NDJSON records into the store.
+
+    The body is consumed as it arrives and written in IMPORT batches of
+    `batch_size` records, so memory stays bounded by one batch. Indexing is
+    deferred until the whole body has been written. Records before a malformed
+    line stay imported; the error reports the line number and the count.
+    """
+    ensure_leader()
+    if batch_size <= 0:
+        raise HTTPException(status_code=400, detail="batch_size must be positive")
+    items: list = []
+    raw_items: list = []
+    expire_at: Dict[str, float] = {}
+    count = 0
+    lineno = 0
+    pending = b""
+    now = time.time()
+    try:
+        async for chunk in request.stream():
+            lines = (pending + chunk).split(b"\n")
+            pending = lines.pop()
+            if not chunk:
+                lines.append(pending)  # end of body: the last line needs no newline
+                pending = b""
+            for line in lines:
+                lineno += 1
+                if not line.strip():
+                    continue
+                try:
+                    key, value, raw_value, exp = parse_import_line(line, now)
+                except (WireError, HTTPException) as e:
+                    detail = e.detail if isinstance(e, HTTPException) else str(e)
+                    if items:
+                        await import_batch(items, raw_items, expire_at)
+                        count += len(items)
+                    return JSONResponse(status_code=422, content={
+                        "detail": f"Line {lineno}: {detail} ({count} records imported before it)", "count": count})
+                items.append([key, value])
+                raw_items.append("[" + json.dumps(key) + ", " + raw_value + "]")
+                if exp is not None:
+                    expire_at[key] = exp
+                else:
+                    expire_at.pop(key, None)
+                if len(items) >= batch_size:
+                    await import_batch(items, raw_items, expire_at)
+                    count += len(items)
+                    items, raw_items, expire_at = [], [], {}
+        if items:
+            await import_batch(items, raw_items, expire_at)
+            count += len(items)
+    finally:
+        if count and db.finish_import():
+            await repl_manager.replicate_to_peers({"op": "INDEX"})
+    return {"status": "ok", "count": count}
+
+def export_lines(prefix: str, chunk_size: int):
+    for chunk in db.export(prefix, chunk_size):
+        lines = []
+        for key, value, exp in chunk:
+            item = {"key": key, "value": value}
+            if exp is not None:
+                item["exp"] = exp
+            lines.append(json.dumps(item))
+        if lines:
+            yield "\n".join(lines) + "\n"
+
+@app.get("/export")
+def export_ndjson(prefix: str = "", chunk_size: int = 1000):
+    """
+    Stream a point-in-time NDJSON dump of the keys starting with `prefix`.
+
+    Writes are not blocked while the dump streams: the store is read
+    `chunk_size` keys at a time. The output can be fed back to /import.
+    """
+    ensure_leader()
+    if chunk_size <= 0:
+        raise HTTPException(status_code=400, detail="chunk_size must be positive")
+    return StreamingResponse(export_lines(prefix, chunk_size), media_type="application/x-ndjson")
 
 @app.post("/snapshot")
 def manual_snapshot():
@@ -108,14 +560,40 @@ async def receive_vote(payload: dict = Body(...)):
     return {"vote_granted": granted}
 
 @app.post("/internal/replicate")
-async def receive_replication(record: dict = Body(...)):
+async def receive_replication(request: Request):
     # Direct apply to DB (bypass leader check as we are follower receiving from leader)
     # Note: validation that it came from leader is skipped for simplicity
-    db._apply_record(record)
-    # Also persist to WAL on secondary for durability!
-    db._append_wal(record, sync=True)
+    body = await request.body()
+    try:
+        record = json.loads(body)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=f"Invalid record: {e}")
+    repl_manager.leader_active()
+    logged = db._apply_record(record)
+    # Also persist to WAL on secondary for durability! The leader sends its WAL line,
+    # so it is logged verbatim unless it spans several lines or was rewritten
+    # (a delta on disk storage, see KVStore.update).
+    line = None if logged is not record or b"\n" in body or b"\r" in body else body.decode("utf-8")
+    db._append_wal(logged, sync=True, line=line)
     return {"status": "ack"}
 
+# --- Health ---
+
+@app.get("/health/live")
+def health_live():
+    """The process is up and serving HTTP (it may still be recovering)."""
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+def health_ready():
+    """Recovery is done and the node serves requests; 503 with recovery progress until then."""
+    progress = dict(db.recovery)
+    if not db.ready:
+        status = "failed" if progress["phase"] == "failed" else "recovering"
+        return JSONResponse(status_code=503, content={"status": status, "recovery": progress})
+    return {"status": "ready", "role": repl_manager.role.value, "leader": repl_manager.leader,
+            "recovery": progress}
+
 # --- Utils ---
 
 @app.post("/shutdown")
@@ -130,9 +608,27 @@ def debug_info():
         "role": repl_manager.role.value,
         "leader": repl_manager.leader,
         "term": repl_manager.term,
-        "peers": peers
+        "peers": peers,
+        "lsn": db._lsn,
+        "partition": partition,
+        "partitions": partitions,
     }
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    _m_keys.set(len(db._data))
+    _m_is_leader.set(1 if repl_manager and repl_manager.role == Role.LEADER else 0)
+    _m_watchers.set(db.changes.watchers if db.changes is not None else 0)
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/debug/memory")
+def debug_memory():
+    return db.memory_stats()
+
+@app.get("/debug/cache")
+def debug_cache():
+    return db.cache_stats() or {"enabled": False}
+
 @app.get("/")
 def root():
     return {
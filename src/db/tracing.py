@@ -0,0 +1,193 @@
+"""
+Per-request span tracing and slow-operation logging.
+
+A trace is started for each HTTP request (see the middleware in
+src/db/server.py) and stored in a context variable, so the engine, indexer
+and replication code can open spans without passing anything around:
+
+    with tracing.span("engine.wal_append"):
+        ...
+
+When no trace is active `span()` returns a shared no-op object, so the
+instrumentation costs one context-variable lookup per call site.
+Finished traces are exported to a JSONL file according to the sample rate;
+any request slower than the slow-op threshold is written to the slow log
+with a per-stage breakdown regardless of sampling.
+"""
+import contextvars
+import json
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class Span:
+    __slots__ = ("trace", "name", "attrs", "start", "end", "parent")
+
+    def __init__(self, trace: "Trace", name: str, attrs: Dict[str, Any]):
+        self.trace = trace
+        self.name = name
+        self.attrs = attrs
+        self.parent: Optional[str] = None
+        self.start = 0.0
+        self.end = 0.0
+
+    def __enter__(self):
+        stack = self.trace._stack
+        self.parent = stack[-1].name if stack else None
+        stack.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.end = time.perf_counter()
+        self.trace._stack.pop()
+        self.trace.spans.append(self)
+        self.trace.add_time(self.name, self.end - self.start)
+        return False
+
+    def to_dict(self, origin: float) -> Dict[str, Any]:
+        d = {
+            "name": self.name,
+            "parent": self.parent,
+            "start_ms": round((self.start - origin) * 1000.0, 3),
+            "duration_ms": round((self.end - self.start) * 1000.0, 3),
+        }
+        if self.attrs:
+            d["attrs"] = self.attrs
+        return d
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+class Trace:
+    def __init__(self, name: str, sampled: bool):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.sampled = sampled
+        self.start = time.perf_counter()
+        self.wall_start = time.time()
+        self.end = 0.0
+        self.spans: List[Span] = []
+        self.totals: Dict[str, float] = {}
+        self.attrs: Dict[str, Any] = {}
+        self._stack: List[Span] = []
+
+    def add_time(self, name: str, seconds: float):
+        """Accumulate time under `name` without recording an individual span."""
+        self.totals[name] = self.totals.get(name, 0.0) + seconds
+
+    @property
+    def duration(self) -> float:
+        return (self.end or time.perf_counter()) - self.start
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "ts": self.wall_start,
+            "duration_ms": round(self.duration * 1000.0, 3),
+            "attrs": self.attrs,
+            "breakdown_ms": {k: round(v * 1000.0, 3) for k, v in self.totals.items()},
+            "spans": [s.to_dict(self.start) for s in self.spans],
+        }
+
+
+_current: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("kvstore_trace", default=None)
+
+
+def span(name: str, **attrs):
+    """Open a span in the current trace, or do nothing if there is none."""
+    trace = _current.get()
+    if trace is None:
+        return _NOOP
+    return Span(trace, name, attrs)
+
+
+def add_time(name: str, seconds: float):
+    """Add `seconds` to the `name` bucket of the current trace's breakdown, if any."""
+    trace = _current.get()
+    if trace is not None:
+        trace.add_time(name, seconds)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current.get()
+
+
+class Tracer:
+    """
+    Starts traces and exports finished ones.
+
+    Args:
+        sample_rate (float): Fraction of requests whose full trace is exported (0 disables).
+        export_path (str): JSONL file receiving sampled traces.
+        slow_threshold_ms (float): Requests slower than this go to the slow log (0 disables).
+        slow_log_path (str): JSONL file receiving slow-operation records.
+    """
+
+    def __init__(self, sample_rate: float = 0.0, export_path: str = "traces.jsonl",
+                 slow_threshold_ms: float = 0.0, slow_log_path: str = "slow.log"):
+        self.sample_rate = sample_rate
+        self.export_path = export_path
+        self.slow_threshold = slow_threshold_ms / 1000.0
+        self.slow_log_path = slow_log_path
+        self._write_lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.sample_rate > 0 or self.slow_threshold > 0
+
+    def start(self, name: str) -> contextvars.Token:
+        sampled = self.sample_rate >= 1.0 or (self.sample_rate > 0 and random.random() < self.sample_rate)
+        return _current.set(Trace(name, sampled))
+
+    def finish(self, token: contextvars.Token) -> Optional[Trace]:
+        trace = _current.get()
+        _current.reset(token)
+        if trace is None:
+            return None
+        trace.end = time.perf_counter()
+        slow = self.slow_threshold > 0 and trace.duration >= self.slow_threshold
+        if trace.sampled or slow:
+            record = trace.to_dict()
+            if trace.sampled:
+                self._write(self.export_path, record)
+            if slow:
+                logger.warning(f"Slow operation {trace.name}: {record['duration_ms']}ms {record['breakdown_ms']}")
+                self._write(self.slow_log_path, record)
+        return trace
+
+    def _write(self, path: str, record: Dict[str, Any]):
+        line = json.dumps(record) + "\n"
+        try:
+            with self._write_lock, open(path, "a") as f:
+                f.write(line)
+        except OSError as e:
+            logger.error(f"Trace export to {path} failed: {e}")
+
+    @classmethod
+    def from_env(cls, data_dir: str) -> "Tracer":
+        return cls(
+            sample_rate=float(os.getenv("DB_TRACE_SAMPLE_RATE", "0")),
+            export_path=os.getenv("DB_TRACE_FILE", os.path.join(data_dir, "traces.jsonl")),
+            slow_threshold_ms=float(os.getenv("DB_SLOW_OP_MS", "0")),
+            slow_log_path=os.getenv("DB_SLOW_LOG_FILE", os.path.join(data_dir, "slow.log")),
+        )
@@ -0,0 +1,131 @@
+"""
+Vector index over string values: hash-based embeddings, brute-force cosine search.
+
+This is the only part of indexing that needs numpy, whose import is a
+noticeable share of a node's startup, so IndexManager imports this module
+only when the vector index is enabled (DB_VECTOR_INDEX, on by default).
+"""
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+DIM = 10
+
+# splitmix64 constants (see _embed).
+_GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+_MIX1 = np.uint64(0xBF58476D1CE4E5B9)
+_MIX2 = np.uint64(0x94D049BB133111EB)
+_STREAMS = np.arange(1, DIM + 1, dtype=np.uint64) * _GOLDEN
+_SHIFTS = tuple(np.uint64(n) for n in (30, 27, 31, 11))
+
+
+def _embed(seeds: np.ndarray) -> np.ndarray:
+    """
+    Embeddings for an array of text hashes: one row of DIM floats in [0, 1) each.
+
+    Every component is splitmix64 of seed + i * golden ratio, computed for all
+    seeds at once, so a bulk rebuild embeds a million values in a few numpy calls.
+    """
+    # uint64 array arithmetic wraps silently, which is what the mixing relies on.
+    z = seeds.astype(np.uint64)[:, None] + _STREAMS
+    z = (z ^ (z >> _SHIFTS[0])) * _MIX1
+    z = (z ^ (z >> _SHIFTS[1])) * _MIX2
+    z ^= z >> _SHIFTS[2]
+    return (z >> _SHIFTS[3]) * (1.0 / (1 << 53))
+
+
+def text_seed(text: str) -> int:
+    # crc32 rather than hash(): str hashes are randomized per process, and
+    # embeddings must agree across restarts and worker processes.
+    return zlib.crc32(text.encode("utf-8"))
+
+
+class VectorIndex:
+    """
+    Embeddings of indexed values and nearest-neighbour search over them.
+
+    Vectors live in a base matrix (`_matrix`, row `_rows[key]`) produced by
+    rebuild() or load(), possibly memory-mapped from disk, plus `vectors` for
+    keys embedded since. IndexManager.dump() merges both into a new base
+    matrix (table(), then reset()); write() saves it.
+    """
+
+    dim = DIM
+
+    def __init__(self):
+        # Vectors embedded since the base matrix was built: key -> vector
+        self.vectors: Dict[str, np.ndarray] = {}
+        self._matrix: np.ndarray = np.empty((0, DIM))
+        self._rows: Dict[str, int] = {}
+        # (keys, rows) of the live base-matrix rows, rebuilt lazily after changes
+        self._live: Optional[Tuple[List[str], np.ndarray]] = None
+
+    def embed(self, text: str) -> np.ndarray:
+        # deterministic hash-based embedding for demo purpose
+        # In real world, use a model like SentenceTransformer
+        return _embed(np.array([text_seed(text)], dtype=np.uint64))[0]
+
+    def _drop_row(self, key: str):
+        if self._rows.pop(key, None) is not None:
+            self._live = None
+
+    def update(self, key: str, text: str):
+        self._drop_row(key)
+        self.vectors[key] = self.embed(text)
+
+    def remove(self, key: str):
+        self._drop_row(key)
+        self.vectors.pop(key, None)
+
+    def rebuild(self, keys: List[str], texts: List[str]):
+        """Replace the index with the embeddings of `texts` (texts[i] is the value of keys[i])."""
+        seeds = np.fromiter(map(text_seed, texts), dtype=np.uint64, count=len(texts))
+        self.reset(keys, _embed(seeds) if keys else np.empty((0, DIM)))
+
+    def reset(self, keys: List[str], matrix: np.ndarray):
+        """Make `matrix` (row i embeds keys[i]) the base matrix, dropping everything else."""
+        self.vectors = {}
+        self._matrix = matrix
+        self._rows = dict(zip(keys, range(len(keys))))
+        self._live = None
+
+    def table(self) -> Tuple[List[str], np.ndarray]:
+        """All indexed keys and their vectors, as parallel list and matrix."""
+        if self._live is None:
+            rows = np.fromiter(self._rows.values(), dtype=np.int64, count=len(self._rows))
+            self._live = (list(self._rows), rows)
+        keys, rows = self._live
+        # Rows are assigned in order and never reused, so if none was dropped the
+        # base matrix can be used as is, without a copy.
+        matrix = self._matrix if len(rows) == len(self._matrix) else self._matrix[rows]
+        if self.vectors:
+            keys = keys + list(self.vectors)
+            matrix = np.vstack([matrix, np.array(list(self.vectors.values()))])
+        return keys, matrix
+
+    @staticmethod
+    def save(path: str, matrix: np.ndarray):
+        np.save(path, np.ascontiguousarray(matrix, dtype=np.float64))
+
+    def load(self, path: str, keys: List[str]) -> bool:
+        """Memory-map the matrix saved at `path` for `keys`; False if it does not match them."""
+        matrix = np.load(path, mmap_mode="r")
+        if matrix.shape != (len(keys), DIM):
+            return False
+        self.reset(keys, matrix)
+        return True
+
+    def search_scored(self, query: str, top_k: int = 5) -> List[Tuple[float, str]]:
+        # Brute-force cosine similarity, one matrix-vector product over all vectors
+        keys, matrix = self.table()
+        if not keys or top_k <= 0:
+            return []
+        q_vec = self.embed(query)
+        sims = matrix @ q_vec / (np.linalg.norm(matrix, axis=1) * np.linalg.norm(q_vec) + 1e-9)
+        if top_k < len(keys):
+            top = np.argpartition(-sims, top_k - 1)[:top_k]
+        else:
+            top = np.arange(len(keys))
+        top = top[np.argsort(-sims[top], kind="stable")]
+        return [(float(sims[i]), keys[i]) for i in top]
@@ -0,0 +1,82 @@
+"""
+Raw-body request parsing for the hot write endpoints.
+
+parse_object() walks the top-level JSON object of a request body once with the
+stdlib's C scanner and returns every member as (parsed value, JSON text). The
+text lets the server splice client-supplied values into WAL lines and
+replication bodies with record_line() instead of re-serializing them, and
+skipping pydantic avoids validating `Any` payloads item by item.
+"""
+import json
+import re
+from typing import Any, Dict, Tuple
+
+_scan = json.JSONDecoder().raw_decode
+_WS = re.compile(r"[ \t\n\r]*")
+
+
+class WireError(ValueError):
+    """The request body is not a well-formed JSON object."""
+
+
+def parse_object(body: bytes) -> Dict[str, Tuple[Any, str]]:
+    """Members of the JSON object in `body` as {name: (value, raw JSON text)}."""
+    try:
+        text = body.decode("utf-8")
+    except UnicodeDecodeError:
+        raise WireError("Request body is not valid UTF-8")
+    ws = _WS.match
+    end = len(text)
+    fields: Dict[str, Tuple[Any, str]] = {}
+    try:
+        i = ws(text, 0).end()
+        if text[i] != "{":
+            raise WireError("Request body must be a JSON object")
+        i = ws(text, i + 1).end()
+        if text[i] == "}":
+            i += 1
+        else:
+            while True:
+                if text[i] != '"':
+                    raise WireError(f"Expected a member name at offset {i}")
+                name, i = _scan(text, i)
+                i = ws(text, i).end()
+                if text[i] != ":":
+                    raise WireError(f"Expected ':' at offset {i}")
+                start = ws(text, i + 1).end()
+                value, i = _scan(text, start)
+                fields[name] = (value, text[start:i])
+                i = ws(text, i).end()
+                if text[i] == ",":
+                    i = ws(text, i + 1).end()
+                elif text[i] == "}":
+                    i += 1
+                    break
+                else:
+                    raise WireError(f"Expected ',' or '}}' at offset {i}")
+    except IndexError:
+        raise WireError("Unexpected end of request body")
+    except json.JSONDecodeError as e:
+        raise WireError(f"Invalid JSON: {e}")
+    if ws(text, i).end() != end:
+        raise WireError(f"Unexpected data after the JSON object at offset {i}")
+    return fields
+
+
+def record_line(record: Dict[str, Any], raw: Dict[str, str]) -> str:
+    """
+    Serialize a WAL record, taking the fields named in `raw` as already-encoded JSON text.
+
+    Produces the same layout as json.dumps(record). JSON strings cannot contain raw
+    newlines, so any in the raw text are insignificant whitespace and are replaced
+    to keep the record on one line.
+    """
+    parts = []
+    for name, value in record.items():
+        text = raw.get(name)
+        if text is None:
+            text = json.dumps(value)
+        elif "\n" in text or "\r" in text:
+            text = text.replace("\r", " ").replace("\n", " ")
+        parts.append(json.dumps(name) + ": " + text)
+    return "{" + ", ".join(parts) + "}"
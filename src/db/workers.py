@@ -0,0 +1,123 @@
+"""
+Multi-process serving: one supervisor, N shared-nothing worker processes.
+
+`main.py --workers N` calls supervise(), which starts N copies of main.py with
+DB_PARTITION/DB_PARTITIONS set. Each worker owns one key-hash partition with
+its own data directory (<data dir>/partition-<i>: WAL, snapshots, indexes) and
+serves it with its own interpreter, so request parsing, validation and index
+updates scale with cores instead of sharing one GIL.
+
+Workers bind the public port with SO_REUSEPORT, letting the kernel spread
+connections across them, and additionally listen on a private Unix socket
+(<data dir>/partition-<i>.sock) that PartitionRouter uses to forward requests
+for keys owned by another worker (see src/db/partition.py).
+
+The supervisor forwards SIGINT/SIGTERM to the workers and stops all of them
+when any one exits, so the group lives and dies together.
+"""
+import json
+import logging
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+from typing import List
+
+import uvicorn
+
+from src.db.partition import socket_path
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = "partitions.json"
+
+
+def check_manifest(data_dir: str, workers: int):
+    """Refuse to reopen a data directory with a different partition count: keys would land on the wrong worker."""
+    os.makedirs(data_dir, exist_ok=True)
+    path = os.path.join(data_dir, MANIFEST_FILE)
+    if os.path.exists(path):
+        with open(path) as f:
+            recorded = json.load(f)["partitions"]
+        if recorded != workers:
+            raise SystemExit(f"{data_dir} was partitioned for {recorded} workers, not {workers}; "
+                             f"use --workers {recorded} or a fresh data directory")
+        return
+    with open(path, "w") as f:
+        json.dump({"partitions": workers}, f)
+
+
+def supervise(workers: int, data_dir: str, argv: List[str]) -> int:
+    """Run `workers` worker processes of main.py (with `argv`) until one exits; return its exit code."""
+    check_manifest(data_dir, workers)
+    procs = []
+    for i in range(workers):
+        env = os.environ.copy()
+        env["DB_PARTITION"] = str(i)
+        env["DB_PARTITIONS"] = str(workers)
+        env["DB_DATA_DIR"] = os.path.join(data_dir, f"partition-{i}")
+        env["DB_SOCKET_DIR"] = data_dir
+        procs.append(subprocess.Popen([sys.executable] + argv, env=env))
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    code = 0
+    while not stopping:
+        exited = [p for p in procs if p.poll() is not None]
+        if exited:
+            code = exited[0].returncode
+            logger.error(f"Worker {procs.index(exited[0])} exited with {code}; stopping all workers")
+            break
+        time.sleep(0.2)
+
+    for p in procs:
+        if p.poll() is None:
+            p.terminate()
+    for p in procs:
+        try:
+            p.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            p.kill()
+    return code
+
+
+def bind_sockets(host: str, port: int, uds_path: str) -> List[socket.socket]:
+    """The shared public TCP socket (SO_REUSEPORT) and this worker's private Unix socket."""
+    if not hasattr(socket, "SO_REUSEPORT"):
+        raise SystemExit("--workers needs SO_REUSEPORT, which this platform does not provide")
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    # proto must be explicit: asyncio only enables TCP_NODELAY on accepted sockets whose
+    # proto is IPPROTO_TCP, and Nagle + delayed ACKs add ~40ms to every response.
+    tcp = socket.socket(family, socket.SOCK_STREAM, socket.IPPROTO_TCP)
+    tcp.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    tcp.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    tcp.bind((host, port))
+
+    if os.path.exists(uds_path):
+        os.unlink(uds_path)  # left behind by a previous run
+    uds = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    uds.bind(uds_path)
+    os.chmod(uds_path, 0o600)
+    return [tcp, uds]
+
+
+def serve_partition(app, host: str, port: int):
+    """Worker entry point: serve `app` on the shared port and this partition's Unix socket."""
+    partition = int(os.environ["DB_PARTITION"])
+    uds_path = socket_path(os.environ["DB_SOCKET_DIR"], partition)
+    sockets = bind_sockets(host, port, uds_path)
+    server = uvicorn.Server(uvicorn.Config(app, host=host, port=port))
+    try:
+        server.run(sockets=sockets)
+    finally:
+        if os.path.exists(uds_path):
+            os.unlink(uds_path)
@@ -1,60 +1,451 @@
-import time
-import subprocess
-import sys
+"""
+Load-generation benchmark for the KV store.
+
+Starts a single node (or a local 3-node cluster with --cluster), preloads a
+keyspace and then drives it with N concurrent clients running a weighted mix
+of get/set/delete/bulk/search operations.
+
+Examples:
+    python -m tests.benchmark
+    python -m tests.benchmark --clients 16 --duration 20 --mix get=70,set=25,delete=5
+    python -m tests.benchmark --cluster --distribution zipf --value-size 64:4096 --json run.json
+    python -m tests.benchmark --json new.json --compare old.json
+
+The JSON report contains the run configuration, per-operation latency
+percentiles (p50/p95/p99/p999), a log-scale latency histogram and the
+throughput timeline, so two reports from different releases can be diffed.
+"""
+import argparse
+import bisect
+import json
+import math
 import os
-import shutil
+import platform
 import random
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
 import requests
+
 from src.client.client import DatabaseClient
 
 DB_PORT = 8005
+CLUSTER_PORTS = [8020, 8021, 8022]
 DATA_DIR = "benchmark_data"
 
-def run_benchmark():
-    if os.path.exists(DATA_DIR):
-        shutil.rmtree(DATA_DIR)
-    os.makedirs(DATA_DIR)
+OPS = ("get", "set", "delete", "bulk", "search")
+DEFAULT_MIX = "get=60,set=30,delete=5,bulk=4,search=1"
+
+# Words used to build values, so that search queries actually hit the index.
+VOCABULARY = [
+    "alpha", "bravo", "charlie", "delta", "echo", "foxtrot", "golf", "hotel",
+    "india", "juliet", "kilo", "lima", "mike", "november", "oscar", "papa",
+    "quebec", "romeo", "sierra", "tango", "uniform", "victor", "whiskey", "yankee",
+]
+
+
+# --- Workload generation ---
+
+def parse_mix(spec: str) -> List[Tuple[str, float]]:
+    mix = []
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in OPS:
+            raise ValueError(f"Unknown op '{name}' in mix (expected one of {', '.join(OPS)})")
+        mix.append((name, float(weight or 1)))
+    return mix
+
+
+def parse_value_size(spec: str) -> Tuple[int, int]:
+    lo, _, hi = spec.partition(":")
+    lo = int(lo)
+    return lo, int(hi) if hi else lo
+
+
+class KeyChooser:
+    """Picks key indexes uniformly or following a Zipf distribution."""
+
+    def __init__(self, keyspace: int, distribution: str = "uniform", zipf_s: float = 1.1):
+        self.keyspace = keyspace
+        self.distribution = distribution
+        self._cdf: List[float] = []
+        if distribution == "zipf":
+            total = 0.0
+            for rank in range(1, keyspace + 1):
+                total += 1.0 / (rank ** zipf_s)
+                self._cdf.append(total)
+            self._cdf = [c / total for c in self._cdf]
+        elif distribution != "uniform":
+            raise ValueError(f"Unknown distribution '{distribution}'")
+
+    def choose(self, rng: random.Random) -> int:
+        if self.distribution == "uniform":
+            return rng.randrange(self.keyspace)
+        return min(bisect.bisect_left(self._cdf, rng.random()), self.keyspace - 1)
+
+
+def make_value(rng: random.Random, size_range: Tuple[int, int]) -> str:
+    size = rng.randint(*size_range)
+    words = []
+    length = 0
+    while length < size:
+        word = rng.choice(VOCABULARY)
+        words.append(word)
+        length += len(word) + 1
+    return " ".join(words)[:max(size, 1)]
+
+
+# --- Statistics ---
+
+class LatencyRecorder:
+    """Collects latencies for one operation type."""
+
+    def __init__(self):
+        self.samples: List[float] = []
+        self.errors = 0
+
+    def record(self, latency: float, ok: bool):
+        self.samples.append(latency)
+        if not ok:
+            self.errors += 1
+
+    def merge(self, other: "LatencyRecorder"):
+        self.samples.extend(other.samples)
+        self.errors += other.errors
+
+
+def percentile(sorted_samples: List[float], pct: float) -> float:
+    if not sorted_samples:
+        return 0.0
+    idx = min(len(sorted_samples) - 1, max(0, math.ceil(pct / 100.0 * len(sorted_samples)) - 1))
+    return sorted_samples[idx]
+
+
+def log_histogram(sorted_samples: List[float]) -> Dict[str, int]:
+    """Bucket latencies (ms) into power-of-two upper bounds, e.g. {"0.5": 10, "1": 42}."""
+    buckets: Dict[str, int] = {}
+    for s in sorted_samples:
+        ms = s * 1000.0
+        bound = 2.0 ** math.ceil(math.log2(ms)) if ms > 0 else 0.0
+        label = f"{bound:g}"
+        buckets[label] = buckets.get(label, 0) + 1
+    return buckets
+
+
+def summarize(recorder: LatencyRecorder, duration: float) -> dict:
+    samples = sorted(recorder.samples)
+    count = len(samples)
+    ms = lambda v: round(v * 1000.0, 3)
+    return {
+        "count": count,
+        "errors": recorder.errors,
+        "throughput": round(count / duration, 2) if duration > 0 else 0.0,
+        "latency_ms": {
+            "mean": ms(sum(samples) / count) if count else 0.0,
+            "p50": ms(percentile(samples, 50)),
+            "p95": ms(percentile(samples, 95)),
+            "p99": ms(percentile(samples, 99)),
+            "p999": ms(percentile(samples, 99.9)),
+            "max": ms(samples[-1]) if samples else 0.0,
+        },
+        "histogram_ms": log_histogram(samples),
+    }
+
+
+# --- Load generation ---
+
+class Worker(threading.Thread):
+    def __init__(self, worker_id: int, port: int, args, chooser: KeyChooser, deadline: float, start: float):
+        super().__init__(daemon=True)
+        self.client = DatabaseClient(host="127.0.0.1", port=port)
+        self.rng = random.Random(args.seed + worker_id)
+        self.args = args
+        self.chooser = chooser
+        self.deadline = deadline
+        self.start_time = start
+        self.ops, weights = zip(*parse_mix(args.mix))
+        self.cum_weights = list(weights)
+        for i in range(1, len(self.cum_weights)):
+            self.cum_weights[i] += self.cum_weights[i - 1]
+        self.recorders = {op: LatencyRecorder() for op in OPS}
+        self.timeline: Dict[int, int] = {}
 
-    print("Starting DB Server for Benchmark...")
+    def _key(self) -> str:
+        return f"bench_{self.chooser.choose(self.rng)}"
+
+    def _run_op(self, op: str) -> bool:
+        c = self.client
+        if op == "get":
+            # get() maps errors to None like a miss; this one raises instead.
+            c.get_with_version(self._key())
+            return True  # a miss after deletes is not a failure
+        if op == "set":
+            return c.set(self._key(), make_value(self.rng, self.args.value_range))
+        if op == "delete":
+            return c.delete(self._key())
+        if op == "bulk":
+            items = [(self._key(), make_value(self.rng, self.args.value_range)) for _ in range(self.args.bulk_size)]
+            return c.bulk_set(items)
+        if op == "search":
+            # search() maps errors to an empty result; check the status ourselves.
+            resp = c.session.get(f"{c.base_url}/search", params={"q": self.rng.choice(VOCABULARY)})
+            return resp.status_code == 200
+        raise ValueError(op)
+
+    def run(self):
+        total = self.cum_weights[-1]
+        while time.perf_counter() < self.deadline:
+            op = self.ops[bisect.bisect_right(self.cum_weights, self.rng.random() * total)]
+            t0 = time.perf_counter()
+            try:
+                ok = self._run_op(op)
+            except Exception:
+                ok = False
+            t1 = time.perf_counter()
+            self.recorders[op].record(t1 - t0, ok)
+            second = int(t1 - self.start_time)
+            self.timeline[second] = self.timeline.get(second, 0) + 1
+
+
+def preload(port: int, args, attempts: int = 20):
+    client = DatabaseClient(host="127.0.0.1", port=port)
+    rng = random.Random(args.seed)
+
+    def load(batch):
+        # Batches can be refused (503 while recovering, 429 under admission control):
+        # retry, and give up rather than benchmark a keyspace that was never loaded.
+        for attempt in range(attempts):
+            if client.bulk_set(batch):
+                return
+            time.sleep(min(0.1 * 2 ** attempt, 2.0))
+        raise RuntimeError(f"Preload failed: a batch of {len(batch)} keys was refused {attempts} times")
+
+    batch = []
+    for i in range(args.keyspace):
+        batch.append((f"bench_{i}", make_value(rng, args.value_range)))
+        if len(batch) >= 1000:
+            load(batch)
+            batch = []
+    if batch:
+        load(batch)
+
+
+def run_load(port: int, args) -> dict:
+    chooser = KeyChooser(args.keyspace, args.distribution, args.zipf_s)
+    start = time.perf_counter()
+    deadline = start + args.duration
+    workers = [Worker(i, port, args, chooser, deadline, start) for i in range(args.clients)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - start
+
+    merged = {op: LatencyRecorder() for op in OPS}
+    timeline: Dict[int, int] = {}
+    for w in workers:
+        for op in OPS:
+            merged[op].merge(w.recorders[op])
+        for second, n in w.timeline.items():
+            timeline[second] = timeline.get(second, 0) + n
+
+    all_ops = LatencyRecorder()
+    for rec in merged.values():
+        all_ops.merge(rec)
+
+    return {
+        "elapsed_s": round(elapsed, 3),
+        "total": summarize(all_ops, elapsed),
+        "ops": {op: summarize(rec, elapsed) for op, rec in merged.items() if rec.samples},
+        "timeline": [{"second": s, "ops": timeline[s]} for s in sorted(timeline)],
+    }
+
+
+# --- Server management ---
+
+def wait_until_up(port: int, timeout: float = 30.0):
+    # The port answers (with 503) before recovery is done; wait for readiness.
+    if not DatabaseClient(host="127.0.0.1", port=port).wait_until_ready(timeout=timeout):
+        raise RuntimeError(f"Server on port {port} did not become ready")
+
+
+def start_single(port: int, data_dir: str, workers: int = 1) -> List[subprocess.Popen]:
     env = os.environ.copy()
-    env["DB_DATA_DIR"] = DATA_DIR
+    env["DB_DATA_DIR"] = data_dir
     proc = subprocess.Popen(
-        [sys.executable, "main.py", "--port", str(DB_PORT)],
+        [sys.executable, "main.py", "--port", str(port), "--workers", str(workers)],
         env=env,
         stdout=subprocess.DEVNULL,
         stderr=subprocess.DEVNULL
     )
-    time.sleep(3)
+    wait_until_up(port)
+    return [proc]
 
-    client = DatabaseClient(port=DB_PORT)
-    
-    counts = [100, 1000, 5000]
-    
-    try:
-        print(f"{'Count':<10} | {'Mode':<10} | {'Time (s)':<10} | {'Ops/sec':<10}")
-        print("-" * 50)
-        
-        # Sequential Set
-        for n in counts:
-            start_time = time.time()
-            for i in range(n):
-                client.set(f"key_{n}_{i}", f"val_{i}")
-            duration = time.time() - start_time
-            print(f"{n:<10} | {'SEQ SET':<10} | {duration:<10.4f} | {n/duration:<10.2f}")
-
-        # Bulk Set
-        for n in counts:
-            items = [(f"blk_{n}_{i}", f"val_{i}") for i in range(n)]
-            start_time = time.time()
-            client.bulk_set(items)
-            duration = time.time() - start_time
-            print(f"{n:<10} | {'BULK SET':<10} | {duration:<10.4f} | {n/duration:<10.2f}")
 
-    finally:
+def start_cluster(ports: List[int], data_dir: str) -> List[subprocess.Popen]:
+    hosts = [f"http://127.0.0.1:{p}" for p in ports]
+    procs = []
+    for i, port in enumerate(ports):
+        node_dir = os.path.join(data_dir, f"node_{i}")
+        os.makedirs(node_dir, exist_ok=True)
+        env = os.environ.copy()
+        env["DB_DATA_DIR"] = node_dir
+        peers = ",".join(h for j, h in enumerate(hosts) if j != i)
+        procs.append(subprocess.Popen(
+            [sys.executable, "main.py", "--port", str(port), "--host", "127.0.0.1",
+             "--node-id", str(i), "--peers", peers],
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL
+        ))
+    for port in ports:
+        wait_until_up(port)
+    return procs
+
+
+def find_leader(ports: List[int], timeout: float = 30.0) -> int:
+    end = time.time() + timeout
+    while time.time() < end:
+        for port in ports:
+            try:
+                resp = requests.get(f"http://127.0.0.1:{port}/health/ready", timeout=1)
+                # 503 while still recovering: its body has no role yet.
+                if resp.status_code == 200 and resp.json()["role"] == "LEADER":
+                    return port
+            except requests.RequestException:
+                pass
+        time.sleep(0.2)
+    raise RuntimeError("No leader elected")
+
+
+def stop_all(procs: List[subprocess.Popen]):
+    for proc in procs:
         proc.terminate()
-        proc.wait()
+        try:
+            proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+# --- Reporting ---
+
+def print_report(report: dict):
+    print(f"{'Op':<8} | {'Count':<8} | {'Errors':<6} | {'Ops/sec':<10} | {'p50 ms':<8} | {'p95 ms':<8} | {'p99 ms':<8} | {'p999 ms':<8}")
+    print("-" * 84)
+    rows = list(report["ops"].items()) + [("total", report["total"])]
+    for op, s in rows:
+        lat = s["latency_ms"]
+        print(f"{op:<8} | {s['count']:<8} | {s['errors']:<6} | {s['throughput']:<10.2f} | "
+              f"{lat['p50']:<8.2f} | {lat['p95']:<8.2f} | {lat['p99']:<8.2f} | {lat['p999']:<8.2f}")
+
+
+def print_comparison(report: dict, baseline: dict):
+    print(f"\nCompared to baseline ({baseline.get('config', {}).get('label') or 'unlabelled'}):")
+    print(f"{'Op':<8} | {'Ops/sec':<28} | {'p99 ms':<28}")
+    print("-" * 70)
+    for op, s in list(report["ops"].items()) + [("total", report["total"])]:
+        old = baseline["total"] if op == "total" else baseline.get("ops", {}).get(op)
+        if not old:
+            continue
+        def delta(new, prev):
+            change = ((new - prev) / prev * 100.0) if prev else 0.0
+            return f"{prev:.2f} -> {new:.2f} ({change:+.1f}%)"
+        print(f"{op:<8} | {delta(s['throughput'], old['throughput']):<28} | "
+              f"{delta(s['latency_ms']['p99'], old['latency_ms']['p99']):<28}")
+
+
+def parse_args(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="KV store load benchmark")
+    parser.add_argument("--clients", type=int, default=4, help="Number of concurrent client threads")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds of load per run")
+    parser.add_argument("--mix", type=str, default=DEFAULT_MIX, help="Weighted op mix, e.g. get=60,set=30,delete=5,bulk=4,search=1")
+    parser.add_argument("--keyspace", type=int, default=10000, help="Number of distinct keys")
+    parser.add_argument("--distribution", choices=["uniform", "zipf"], default="uniform", help="Key access distribution")
+    parser.add_argument("--zipf-s", type=float, default=1.1, help="Zipf exponent")
+    parser.add_argument("--value-size", type=str, default="100", help="Value size in bytes, fixed (100) or range (64:4096)")
+    parser.add_argument("--bulk-size", type=int, default=100, help="Items per bulk operation")
+    parser.add_argument("--cluster", action="store_true", help="Run against a local 3-node cluster instead of a single node")
+    parser.add_argument("--workers", type=int, default=1, help="Server worker processes for the single-node topology")
+    parser.add_argument("--port", type=int, default=None, help="Benchmark an already running node instead of starting one")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed")
+    parser.add_argument("--label", type=str, default="", help="Free-form label stored in the JSON report")
+    parser.add_argument("--json", type=str, default=None, help="Write the report to this JSON file")
+    parser.add_argument("--compare", type=str, default=None, help="Baseline JSON report to compare against")
+    args = parser.parse_args(argv)
+    args.value_range = parse_value_size(args.value_size)
+    parse_mix(args.mix)  # validate early
+    return args
+
+
+def run_benchmark(argv: Optional[List[str]] = None) -> dict:
+    args = parse_args(argv)
+
+    procs: List[subprocess.Popen] = []
+    if args.port is None:
         if os.path.exists(DATA_DIR):
             shutil.rmtree(DATA_DIR)
+        os.makedirs(DATA_DIR)
+
+    try:
+        if args.port is not None:
+            port = args.port
+        elif args.cluster:
+            print("Starting 3-node cluster for Benchmark...")
+            procs = start_cluster(CLUSTER_PORTS, DATA_DIR)
+            port = find_leader(CLUSTER_PORTS)
+        else:
+            print(f"Starting DB Server for Benchmark ({args.workers} worker process(es))...")
+            procs = start_single(DB_PORT, DATA_DIR, args.workers)
+            port = DB_PORT
+
+        print(f"Preloading {args.keyspace} keys...")
+        preload(port, args)
+        print(f"Running {args.clients} clients for {args.duration}s (mix: {args.mix}, keys: {args.distribution})")
+        results = run_load(port, args)
+    finally:
+        stop_all(procs)
+        if args.port is None and os.path.exists(DATA_DIR):
+            shutil.rmtree(DATA_DIR)
+
+    report = {
+        "config": {
+            "label": args.label,
+            "topology": "cluster-3" if args.cluster else "single",
+            "workers": 1 if args.cluster else args.workers,
+            "clients": args.clients,
+            "duration_s": args.duration,
+            "mix": args.mix,
+            "keyspace": args.keyspace,
+            "distribution": args.distribution,
+            "zipf_s": args.zipf_s,
+            "value_size": args.value_size,
+            "bulk_size": args.bulk_size,
+            "seed": args.seed,
+        },
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        **results,
+    }
+
+    print_report(report)
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(report, json.load(f))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.json}")
+    return report
+
 
 if __name__ == "__main__":
     run_benchmark()
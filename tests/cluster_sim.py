@@ -0,0 +1,497 @@
+"""
+Deterministic in-process cluster simulator.
+
+tests/test_replication.py runs real processes and sleeps, so measuring how
+long a failover takes is slow and noisy. Here N ReplicationManager + KVStore
+pairs run in one process over a simulated network:
+
+- time is virtual: the event loop jumps straight to the next timer instead of
+  waiting, so a 60 s scenario runs in well under a second and the same seed
+  always gives the same run;
+- every RPC goes through SimulatedTransport, which adds latency, drops
+  messages (the sender sees a timeout) and honours network partitions;
+- nodes can be crashed and restarted from their data directory.
+
+A closed-loop client writes to whichever node it believes is the leader and
+follows "not leader" hints, like a real client. The report has the time to
+elect a leader after startup and after every leader loss, the windows in
+which writes failed, committed and replicated throughput, and how long more
+than one node acted as leader.
+
+Examples:
+    python -m tests.cluster_sim
+    python -m tests.cluster_sim --nodes 5 --loss 0.05 --latency 0.01:0.05
+    python -m tests.cluster_sim --crash-leader-at 10 --restart-after 5
+    python -m tests.cluster_sim --partition-leader-at 20 --heal-after 5 --json run.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import random
+import shutil
+import tempfile
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import httpx
+
+from src.db.engine import KVStore
+from src.db.metrics import MetricsRegistry
+from src.db.replication import ReplicationManager, Role
+
+# How often the cluster state (leaders) is sampled, in virtual seconds.
+SAMPLE_INTERVAL = 0.01
+
+
+class _VirtualSelector:
+    """Selector wrapper that advances the loop's virtual clock instead of blocking."""
+
+    def __init__(self, loop: "SimulatedLoop", selector):
+        self._loop = loop
+        self._selector = selector
+
+    def select(self, timeout=None):
+        events = self._selector.select(0)
+        if not events and timeout:
+            self._loop.advance(timeout)
+        elif not events and timeout is None:
+            raise RuntimeError("Simulation stalled: no timers or I/O left to wait for")
+        return events
+
+    def __getattr__(self, name):
+        return getattr(self._selector, name)
+
+
+class SimulatedLoop(asyncio.SelectorEventLoop):
+    """Event loop running on virtual time: sleeps return as soon as nothing else is runnable."""
+
+    def __init__(self, start: float = 0.0):
+        super().__init__()
+        self._now = start
+        self._selector = _VirtualSelector(self, self._selector)
+
+    def time(self) -> float:
+        return self._now
+
+    def advance(self, seconds: float):
+        self._now += seconds
+
+
+class Network:
+    """
+    Message delivery between simulated nodes.
+
+    Args:
+        rng (random.Random): Source of latency and loss decisions.
+        latency (Tuple[float, float]): One-way delay range in seconds.
+        loss (float): Probability that a message (request or response) is lost.
+    """
+
+    def __init__(self, rng: random.Random, latency: Tuple[float, float] = (0.001, 0.005), loss: float = 0.0):
+        self.rng = rng
+        self.latency = latency
+        self.loss = loss
+        self.nodes: Dict[int, "SimNode"] = {}
+        self._group: Dict[int, int] = {}
+        self.sent: Dict[str, int] = {}
+        self.delivered: Dict[str, int] = {}
+        self.dropped: Dict[str, int] = {}
+
+    def partition(self, *groups: Sequence[int]):
+        """Split the network: nodes only reach nodes of their own group. Unlisted nodes form one more group."""
+        self._group = {node: i for i, group in enumerate(groups) for node in group}
+
+    def heal(self):
+        self._group = {}
+
+    def _reachable(self, src: int, dst: int) -> bool:
+        return self._group.get(src, -1) == self._group.get(dst, -1)
+
+    def _lost(self, src: int, dst: int) -> bool:
+        return not self._reachable(src, dst) or (self.loss > 0 and self.rng.random() < self.loss)
+
+    async def deliver(self, src: int, request: httpx.Request) -> httpx.Response:
+        dst = int(request.url.host[len("node"):])
+        rpc = request.url.path.rsplit("/", 1)[-1]
+        timeout = (request.extensions.get("timeout") or {}).get("read") or 1.0
+        self.sent[rpc] = self.sent.get(rpc, 0) + 1
+
+        async def time_out(elapsed: float):
+            self.dropped[rpc] = self.dropped.get(rpc, 0) + 1
+            await asyncio.sleep(max(0.0, timeout - elapsed))
+            raise httpx.ReadTimeout(f"Simulated timeout {src} -> {dst}", request=request)
+
+        if self._lost(src, dst):
+            await time_out(0.0)
+        there = self.rng.uniform(*self.latency)
+        back = self.rng.uniform(*self.latency)
+        await asyncio.sleep(there)
+        node = self.nodes.get(dst)
+        if node is None or not node.up:
+            raise httpx.ConnectError(f"Simulated node {dst} is down", request=request)
+        status, body = node.handle(rpc, request.content)
+        if self._lost(dst, src) or there + back > timeout:
+            await time_out(there)
+        await asyncio.sleep(back)
+        self.delivered[rpc] = self.delivered.get(rpc, 0) + 1
+        return httpx.Response(status, json=body, request=request)
+
+
+class SimulatedTransport(httpx.AsyncBaseTransport):
+    """httpx transport of one node, sending every request through the Network."""
+
+    def __init__(self, network: Network, source: int):
+        self.network = network
+        self.source = source
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return await self.network.deliver(self.source, request)
+
+
+class SimNode:
+    """One node: a KVStore and its ReplicationManager, reachable as http://node<i>."""
+
+    def __init__(self, node_id: int, size: int, data_dir: str, network: Network, rng: random.Random):
+        self.node_id = node_id
+        self.peers = [url(i) for i in range(size) if i != node_id]
+        self.data_dir = data_dir
+        self.network = network
+        self.rng = rng
+        self.up = False
+        self.db: Optional[KVStore] = None
+        self.repl: Optional[ReplicationManager] = None
+
+    async def start(self):
+        """Start (or restart after crash()) from whatever the data directory holds."""
+        self.db = KVStore(self.data_dir, metrics=MetricsRegistry(), change_log_size=0)
+        self.repl = ReplicationManager(self.node_id, self.peers, self.db, metrics=MetricsRegistry(),
+                                       clock=asyncio.get_running_loop().time,
+                                       rng=random.Random(self.rng.random()),
+                                       transport=SimulatedTransport(self.network, self.node_id))
+        self.up = True
+        await self.repl.start()
+
+    async def crash(self):
+        """Stop abruptly: in-flight work is abandoned and the node stops answering."""
+        self.up = False
+        if self.repl is not None and self.repl._loop_task is not None:
+            self.repl._loop_task.cancel()
+            await asyncio.gather(self.repl._loop_task, return_exceptions=True)
+        await self.close()
+
+    async def close(self):
+        if self.repl is not None:
+            await self.repl.client.aclose()
+            await self.repl.control_client.aclose()
+        if self.db is not None:
+            self.db.close()
+
+    @property
+    def is_leader(self) -> bool:
+        return self.up and self.repl.role == Role.LEADER
+
+    def handle(self, rpc: str, body: bytes) -> Tuple[int, Dict[str, Any]]:
+        """The /internal/* endpoints of src/db/server.py."""
+        payload = json.loads(body)
+        if rpc == "heartbeat":
+            self.repl.receive_heartbeat(payload["term"], payload["leader_id"])
+            return 200, {"status": "ok"}
+        if rpc == "vote":
+            return 200, {"vote_granted": self.repl.receive_vote_request(payload["term"], payload["candidate_id"])}
+        if rpc == "replicate":
+            self.repl.leader_active()
+            logged = self.db._apply_record(payload)
+            # Virtual time does not see fsync cost, so skip it to keep runs fast.
+            self.db._append_wal(logged, sync=False)
+            return 200, {"status": "ack"}
+        return 404, {"detail": "Not Found"}
+
+    async def write(self, key: str, value: Any) -> Tuple[bool, Optional[int]]:
+        """The leader write path of POST /set: (ok, leader hint when refused)."""
+        if not self.up:
+            raise httpx.ConnectError(f"Simulated node {self.node_id} is down")
+        if self.repl.role != Role.LEADER:
+            return False, self.repl.leader
+        if not self.db.set(key, value):
+            return False, None
+        await self.repl.replicate_to_peers({"op": "SET", "k": key, "v": value})
+        return True, None
+
+
+def url(node_id: int) -> str:
+    return f"http://node{node_id}"
+
+
+class Cluster:
+    """
+    N simulated nodes plus a client workload and a recorder of what happened.
+
+    Must be used inside a SimulatedLoop (see simulate()).
+
+    Args:
+        size (int): Number of nodes.
+        seed (int): Seed for every random decision of the run.
+        latency (Tuple[float, float]): One-way network delay range in seconds.
+        loss (float): Message loss probability.
+        data_dir (str, optional): Directory for node data (default: a temporary one, removed by stop()).
+    """
+
+    def __init__(self, size: int = 3, seed: int = 0, latency: Tuple[float, float] = (0.001, 0.005),
+                 loss: float = 0.0, data_dir: Optional[str] = None):
+        self.rng = random.Random(seed)
+        self.network = Network(random.Random(self.rng.random()), latency, loss)
+        self._own_dir = data_dir is None
+        self.data_dir = data_dir or tempfile.mkdtemp(prefix="cluster_sim_")
+        self.nodes = [SimNode(i, size, f"{self.data_dir}/node_{i}", self.network, random.Random(self.rng.random()))
+                      for i in range(size)]
+        self.network.nodes = {n.node_id: n for n in self.nodes}
+        self.events: List[Tuple[float, str]] = []
+        self.writes: List[Tuple[float, float, bool]] = []  # (start, end, ok)
+        self.leaderless: List[Tuple[float, Optional[float]]] = []  # (since, until) without a live leader
+        self.split_brain_seconds = 0.0
+        self._tasks: List[asyncio.Task] = []
+        self._started_at = 0.0
+
+    def now(self) -> float:
+        return asyncio.get_running_loop().time()
+
+    def log(self, event: str):
+        self.events.append((round(self.now() - self._started_at, 3), event))
+
+    async def start(self):
+        self._started_at = self.now()
+        for node in self.nodes:
+            await node.start()
+        self._tasks.append(asyncio.create_task(self._sample()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        for node in self.nodes:
+            if node.up:
+                await node.crash()
+        if self._own_dir:
+            shutil.rmtree(self.data_dir, ignore_errors=True)
+
+    def leaders(self) -> List[int]:
+        return [n.node_id for n in self.nodes if n.is_leader]
+
+    async def wait_for_leader(self, timeout: float = 30.0) -> Optional[int]:
+        deadline = self.now() + timeout
+        while self.now() < deadline:
+            leaders = self.leaders()
+            if leaders:
+                return leaders[0]
+            await asyncio.sleep(SAMPLE_INTERVAL)
+        return None
+
+    async def crash(self, node_id: int):
+        self.log(f"crash node {node_id}")
+        await self.nodes[node_id].crash()
+
+    async def restart(self, node_id: int):
+        self.log(f"restart node {node_id}")
+        await self.nodes[node_id].start()
+
+    def partition(self, *groups: Sequence[int]):
+        self.log(f"partition {[list(g) for g in groups]}")
+        self.network.partition(*groups)
+
+    def heal(self):
+        self.log("heal partition")
+        self.network.heal()
+
+    async def _sample(self):
+        """Record leaderless windows and time spent with several leaders."""
+        while True:
+            leaders = self.leaders()
+            now = self.now() - self._started_at
+            if not leaders and (not self.leaderless or self.leaderless[-1][1] is not None):
+                self.leaderless.append((now, None))
+            elif leaders and self.leaderless and self.leaderless[-1][1] is None:
+                self.leaderless[-1] = (self.leaderless[-1][0], now)
+                self.log(f"node {leaders[0]} elected")
+            if len(leaders) > 1:
+                self.split_brain_seconds += SAMPLE_INTERVAL
+            await asyncio.sleep(SAMPLE_INTERVAL)
+
+    def start_clients(self, clients: int = 1, interval: float = 0.01, retry_interval: float = 0.05):
+        """Closed-loop writers: each writes, waits `interval`, and retries elsewhere after a refusal."""
+        for c in range(clients):
+            self._tasks.append(asyncio.create_task(self._client(c, interval, retry_interval)))
+
+    async def _client(self, client_id: int, interval: float, retry_interval: float):
+        target = 0
+        seq = 0
+        while True:
+            key = f"c{client_id}:{seq}"
+            t0 = self.now()
+            try:
+                ok, hint = await self.nodes[target].write(key, seq)
+            except httpx.TransportError:
+                ok, hint = False, None
+            self.writes.append((t0 - self._started_at, self.now() - self._started_at, ok))
+            if ok:
+                seq += 1
+                await asyncio.sleep(interval)
+            else:
+                target = hint if hint is not None else (target + 1) % len(self.nodes)
+                await asyncio.sleep(retry_interval)
+
+    def report(self, duration: float) -> Dict[str, Any]:
+        elections = [{"at": round(since, 3), "seconds": round(until - since, 3) if until is not None else None}
+                     for since, until in self.leaderless]
+        # A write outage lasts from the first failed attempt to the next success.
+        outages: List[Dict[str, float]] = []
+        failed_since: Optional[float] = None
+        for start, end, ok in sorted(self.writes):
+            if not ok and failed_since is None:
+                failed_since = start
+            elif ok and failed_since is not None:
+                outages.append({"from": round(failed_since, 3), "seconds": round(end - failed_since, 3)})
+                failed_since = None
+        if failed_since is not None:
+            outages.append({"from": round(failed_since, 3), "seconds": round(duration - failed_since, 3)})
+        committed = sum(1 for _, _, ok in self.writes if ok)
+        latencies = sorted(end - start for start, end, ok in self.writes if ok)
+        return {
+            "nodes": len(self.nodes),
+            "duration": duration,
+            "elections": elections,
+            "time_to_elect": elections[0]["seconds"] if elections else None,
+            "unavailable": outages,
+            "unavailable_seconds": round(sum(o["seconds"] for o in outages), 3),
+            "split_brain_seconds": round(self.split_brain_seconds, 3),
+            "writes_committed": committed,
+            "writes_failed": len(self.writes) - committed,
+            "write_throughput": round(committed / duration, 1) if duration else 0.0,
+            "write_p50_ms": round(latencies[len(latencies) // 2] * 1000, 2) if latencies else None,
+            "replicated_throughput": round(self.network.delivered.get("replicate", 0) / duration, 1) if duration else 0.0,
+            "messages": {rpc: {"sent": sent, "delivered": self.network.delivered.get(rpc, 0),
+                               "dropped": self.network.dropped.get(rpc, 0)}
+                         for rpc, sent in sorted(self.network.sent.items())},
+            "events": self.events,
+        }
+
+
+Scenario = Callable[[Cluster], Any]
+
+
+def simulate(scenario: Scenario, duration: float, nodes: int = 3, seed: int = 0, clients: int = 1,
+             latency: Tuple[float, float] = (0.001, 0.005), loss: float = 0.0) -> Dict[str, Any]:
+    """
+    Run `scenario` against a fresh cluster for `duration` virtual seconds and return the report.
+
+    `scenario(cluster)` is a coroutine function started alongside the client
+    workload; it drives failures with cluster.crash()/restart()/partition()/heal()
+    and asyncio.sleep(). Its own result, if any, is stored under "scenario".
+    """
+    async def run():
+        cluster = Cluster(nodes, seed, latency, loss)
+        await cluster.start()
+        cluster.start_clients(clients)
+        task = asyncio.create_task(scenario(cluster))
+        await asyncio.sleep(duration)
+        result = task.result() if task.done() else None
+        if not task.done():
+            task.cancel()
+        report = cluster.report(duration)
+        report["scenario"] = result
+        await cluster.stop()
+        return report
+
+    loop = SimulatedLoop()
+    try:
+        return loop.run_until_complete(run())
+    finally:
+        loop.close()
+
+
+def default_scenario(crash_leader_at: Optional[float], restart_after: Optional[float],
+                     partition_leader_at: Optional[float], heal_after: Optional[float]) -> Scenario:
+    async def scenario(cluster: Cluster):
+        actions: List[Tuple[float, Callable[[], Any]]] = []
+        crashed: List[int] = []
+
+        async def crash_leader():
+            leaders = cluster.leaders()
+            if leaders:
+                crashed.append(leaders[0])
+                await cluster.crash(leaders[0])
+
+        async def restart():
+            if crashed:
+                await cluster.restart(crashed.pop())
+
+        async def partition_leader():
+            leaders = cluster.leaders()
+            if leaders:
+                cluster.partition([leaders[0]])
+
+        async def heal():
+            cluster.heal()
+
+        if crash_leader_at is not None:
+            actions.append((crash_leader_at, crash_leader))
+            if restart_after is not None:
+                actions.append((crash_leader_at + restart_after, restart))
+        if partition_leader_at is not None:
+            actions.append((partition_leader_at, partition_leader))
+            if heal_after is not None:
+                actions.append((partition_leader_at + heal_after, heal))
+        start = cluster.now()
+        for at, action in sorted(actions, key=lambda a: a[0]):
+            await asyncio.sleep(max(0.0, start + at - cluster.now()))
+            await action()
+    return scenario
+
+
+def print_report(report: Dict[str, Any]):
+    print(f"{report['nodes']} nodes, {report['duration']}s simulated")
+    for at, event in report["events"]:
+        print(f"  {at:8.3f}s  {event}")
+    print(f"time to elect:       {report['time_to_elect']}s")
+    for e in report["elections"][1:]:
+        print(f"re-election at {e['at']}s: {e['seconds']}s")
+    print(f"unavailable:         {report['unavailable_seconds']}s in {len(report['unavailable'])} window(s)")
+    for o in report["unavailable"]:
+        print(f"  from {o['from']}s for {o['seconds']}s")
+    print(f"split brain:         {report['split_brain_seconds']}s")
+    print(f"writes:              {report['writes_committed']} committed, {report['writes_failed']} failed, "
+          f"{report['write_throughput']}/s, p50 {report['write_p50_ms']}ms")
+    print(f"replicated:          {report['replicated_throughput']} records/s acked by followers")
+    for rpc, m in report["messages"].items():
+        print(f"  {rpc:10s} sent {m['sent']:7d}  delivered {m['delivered']:7d}  dropped {m['dropped']:6d}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Deterministic in-process cluster simulation")
+    parser.add_argument("--nodes", type=int, default=3, help="Number of nodes")
+    parser.add_argument("--duration", type=float, default=30.0, help="Virtual seconds to simulate")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    parser.add_argument("--clients", type=int, default=1, help="Concurrent closed-loop writers")
+    parser.add_argument("--latency", type=str, default="0.001:0.005", help="One-way latency range in seconds (min:max)")
+    parser.add_argument("--loss", type=float, default=0.0, help="Message loss probability")
+    parser.add_argument("--crash-leader-at", type=float, default=None, help="Crash the leader at this time")
+    parser.add_argument("--restart-after", type=float, default=None, help="Restart the crashed leader this many seconds later")
+    parser.add_argument("--partition-leader-at", type=float, default=None, help="Isolate the leader at this time")
+    parser.add_argument("--heal-after", type=float, default=None, help="Heal the partition this many seconds later")
+    parser.add_argument("--json", type=str, default=None, help="Write the report to this JSON file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.CRITICAL)
+    low, _, high = args.latency.partition(":")
+    latency = (float(low), float(high or low))
+    report = simulate(default_scenario(args.crash_leader_at, args.restart_after,
+                                       args.partition_leader_at, args.heal_after),
+                      args.duration, nodes=args.nodes, seed=args.seed, clients=args.clients,
+                      latency=latency, loss=args.loss)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,349 @@
+"""
+In-process microbenchmarks for the engine and index hot paths.
+
+Unlike tests/benchmark.py nothing here goes through HTTP: KVStore and
+IndexManager are driven directly, so the numbers isolate the cost of WAL
+appends, record application and index maintenance from uvicorn/pydantic.
+
+Examples:
+    python -m tests.microbench
+    python -m tests.microbench --sizes 1000,10000,100000 --only index.
+    python -m tests.microbench --save baseline.json
+    python -m tests.microbench --baseline baseline.json --threshold 0.25
+    python -m tests.microbench --value-encoding json --memory
+    python -m tests.microbench --storage disk --only engine.
+    python -m tests.microbench --storage disk --cache-bytes 1000000 --cache-policy arc --only engine.get
+
+Each case reports time per operation and, from a separate tracemalloc pass
+(tracing slows execution, so it is never mixed with the timing run), the net
+number of memory blocks and bytes retained per operation plus the peak traced
+memory of the run. With --baseline, cases slower than the threshold are
+listed as regressions and the process exits with status 1.
+"""
+import argparse
+import gc
+import json
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional, Tuple
+
+from src.db.codec import ENCODINGS
+from src.db.engine import KVStore
+from src.db.indexes import IndexManager
+from src.db.wire import parse_object, record_line
+
+WORDS = [
+    "alpha", "bravo", "charlie", "delta", "echo", "foxtrot", "golf", "hotel",
+    "india", "juliet", "kilo", "lima", "mike", "november", "oscar", "papa",
+    "quebec", "romeo", "sierra", "tango", "uniform", "victor", "whiskey", "yankee",
+]
+
+# A case prepares its state for a dataset size and returns (op, ops, cleanup).
+# `op(i)` performs one operation; `ops` is how many times it is called.
+Case = Callable[[int, "Context"], Tuple[Callable[[int], None], int, Callable[[], None]]]
+
+
+class Context:
+    def __init__(self, seed: int, ops: int, value_encoding: str = "object", storage: str = "memory",
+                 cache_bytes: int = 0, cache_policy: str = "lru"):
+        self.rng = random.Random(seed)
+        self.ops = ops
+        self.value_encoding = value_encoding
+        self.storage = storage
+        self.cache_bytes = cache_bytes
+        self.cache_policy = cache_policy
+        self._dirs: List[str] = []
+        self._stores: List[KVStore] = []
+
+    def text(self, n_words: int = 8) -> str:
+        return " ".join(self.rng.choice(WORDS) for _ in range(n_words))
+
+    def items(self, size: int) -> List[Tuple[str, str]]:
+        return [(f"key_{i}", self.text()) for i in range(size)]
+
+    def store(self, size: int = 0) -> KVStore:
+        """A fresh KVStore in a temp dir, preloaded with `size` keys."""
+        data_dir = tempfile.mkdtemp(prefix="microbench_")
+        self._dirs.append(data_dir)
+        db = KVStore(data_dir=data_dir, value_encoding=self.value_encoding, storage=self.storage,
+                     cache_bytes=self.cache_bytes, cache_policy=self.cache_policy)
+        self._stores.append(db)
+        if size:
+            db.bulk_set(self.items(size))
+        return db
+
+    def cleanup(self):
+        for db in self._stores:
+            db.close()
+        self._stores = []
+        for d in self._dirs:
+            shutil.rmtree(d, ignore_errors=True)
+        self._dirs = []
+
+
+# --- Engine cases ---
+
+def engine_set(size: int, ctx: Context):
+    db = ctx.store(size)
+    values = [ctx.text() for _ in range(ctx.ops)]
+    return (lambda i: db.set(f"key_{i % size}", values[i])), ctx.ops, ctx.cleanup
+
+
+def engine_get(size: int, ctx: Context):
+    db = ctx.store(size)
+    keys = [f"key_{ctx.rng.randrange(size)}" for _ in range(ctx.ops)]
+    return (lambda i: db.get(keys[i])), ctx.ops, ctx.cleanup
+
+
+def engine_bulk_set(size: int, ctx: Context):
+    db = ctx.store()
+    batches = [ctx.items(size) for _ in range(3)]
+    return (lambda i: db.bulk_set(batches[i])), len(batches), ctx.cleanup
+
+
+def engine_load(size: int, ctx: Context):
+    db = ctx.store()
+    # Half of the data in a snapshot, half replayed from the WAL.
+    db.bulk_set(ctx.items(size // 2))
+    db.create_snapshot()
+    items = ctx.items(size)[size // 2:]
+    for start in range(0, len(items), 1000):
+        db.bulk_set(items[start:start + 1000])
+    return (lambda i: db.load()), 3, ctx.cleanup
+
+
+def engine_create_snapshot(size: int, ctx: Context):
+    db = ctx.store(size)
+    return (lambda i: db.create_snapshot()), 3, ctx.cleanup
+
+
+# --- Index cases ---
+
+def _index(size: int, ctx: Context) -> Tuple[IndexManager, List[Tuple[str, str]]]:
+    idx = IndexManager()
+    items = ctx.items(size)
+    for k, v in items:
+        idx.update(k, v)
+    return idx, items
+
+
+def index_update(size: int, ctx: Context):
+    idx, items = _index(size, ctx)
+    current = dict(items)
+    updates = [(f"key_{ctx.rng.randrange(size)}", ctx.text()) for _ in range(ctx.ops)]
+
+    def op(i):
+        k, v = updates[i]
+        idx.update(k, v, current.get(k))
+        current[k] = v
+    return op, ctx.ops, lambda: None
+
+
+def index_rebuild(size: int, ctx: Context):
+    """Bulk build of both indexes, as recovery does when no persisted index matches the snapshot."""
+    idx = IndexManager()
+    items = ctx.items(size)
+    return (lambda i: idx.rebuild(items)), 3, lambda: None
+
+
+def index_search(size: int, ctx: Context):
+    idx, _ = _index(size, ctx)
+    queries = [" ".join(ctx.rng.sample(WORDS, 2)) for _ in range(ctx.ops)]
+    return (lambda i: idx.search(queries[i])), ctx.ops, lambda: None
+
+
+def index_search_prefix(size: int, ctx: Context):
+    idx, _ = _index(size, ctx)
+    # Values carry one numbered word each (e.g. "item123"), so prefixes expand to many terms.
+    for i in range(size):
+        idx.update(f"num_{i}", f"item{i}")
+    queries = [f"item{ctx.rng.randrange(size // 10 or 1)}* {ctx.rng.choice(WORDS)[:2]}*" for _ in range(ctx.ops)]
+    return (lambda i: idx.search(queries[i])), ctx.ops, lambda: None
+
+
+def index_vector_search(size: int, ctx: Context):
+    idx, _ = _index(size, ctx)
+    queries = [ctx.text(3) for _ in range(10)]
+    return (lambda i: idx.vector_search(queries[i])), len(queries), lambda: None
+
+
+# --- Request decoding ---
+
+def wire_bulk(size: int, ctx: Context):
+    """Raw-body decoding of a /bulk request plus building its WAL line (what the server does before the engine)."""
+    body = json.dumps({"items": ctx.items(size)}).encode("utf-8")
+
+    def op(i):
+        fields = parse_object(body)
+        record_line({"op": "BULK", "data": fields["items"][0]}, {"data": fields["items"][1]})
+    return op, 3, lambda: None
+
+
+CASES: Dict[str, Case] = {
+    "engine.set": engine_set,
+    "engine.get": engine_get,
+    "engine.bulk_set": engine_bulk_set,
+    "engine.load": engine_load,
+    "engine.create_snapshot": engine_create_snapshot,
+    "index.update": index_update,
+    "index.rebuild": index_rebuild,
+    "index.search": index_search,
+    "index.search_prefix": index_search_prefix,
+    "index.vector_search": index_vector_search,
+    "wire.bulk": wire_bulk,
+}
+
+
+# --- Runner ---
+
+def _time_case(case: Case, size: int, args) -> float:
+    ctx = Context(args.seed, args.ops, args.value_encoding, args.storage, args.cache_bytes, args.cache_policy)
+    op, ops, cleanup = case(size, ctx)
+    try:
+        gc.collect()
+        t0 = time.perf_counter()
+        for i in range(ops):
+            op(i)
+        return (time.perf_counter() - t0) / ops
+    finally:
+        cleanup()
+
+
+def _trace_case(case: Case, size: int, args) -> dict:
+    ctx = Context(args.seed, args.ops, args.value_encoding, args.storage, args.cache_bytes, args.cache_policy)
+    op, ops, cleanup = case(size, ctx)
+    try:
+        gc.collect()
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        base, _ = tracemalloc.get_traced_memory()
+        for i in range(ops):
+            op(i)
+        _, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+    finally:
+        cleanup()
+    stats = after.compare_to(before, "filename")
+    blocks = sum(s.count_diff for s in stats)
+    size_diff = sum(s.size_diff for s in stats)
+    return {
+        "blocks_per_op": round(blocks / ops, 2),
+        "bytes_per_op": round(size_diff / ops, 1),
+        "peak_kib": round((peak - base) / 1024.0, 1),
+    }
+
+
+def run_case(name: str, size: int, args) -> dict:
+    case = CASES[name]
+    timings = [_time_case(case, size, args) for _ in range(args.repeat)]
+    result = {
+        "case": name,
+        "size": size,
+        "us_per_op": round(min(timings) * 1e6, 3),
+        "us_per_op_median": round(sorted(timings)[len(timings) // 2] * 1e6, 3),
+    }
+    if not args.no_alloc:
+        result.update(_trace_case(case, size, args))
+    return result
+
+
+def find_regressions(results: List[dict], baseline: dict, threshold: float) -> List[str]:
+    previous = {(r["case"], r["size"]): r for r in baseline.get("results", [])}
+    regressions = []
+    for r in results:
+        old = previous.get((r["case"], r["size"]))
+        if not old or not old["us_per_op"]:
+            continue
+        change = (r["us_per_op"] - old["us_per_op"]) / old["us_per_op"]
+        if change > threshold:
+            regressions.append(f"{r['case']} @ {r['size']}: {old['us_per_op']:.2f}us -> {r['us_per_op']:.2f}us ({change * 100:+.1f}%)")
+    return regressions
+
+
+def memory_report(sizes: List[int], args) -> List[dict]:
+    """Bytes per key for each value encoding, on the same generated dataset."""
+    report = []
+    for size in sizes:
+        for encoding in ENCODINGS:
+            ctx = Context(args.seed, args.ops, encoding)
+            try:
+                stats = ctx.store(size).memory_stats()
+            except RuntimeError as e:  # optional codec dependency missing
+                print(f"  skipping {encoding}: {e}", file=sys.stderr)
+                continue
+            finally:
+                ctx.cleanup()
+            report.append({"size": size, "value_encoding": encoding, "bytes_per_key": stats["bytes_per_key"]})
+    return report
+
+
+def print_results(results: List[dict]):
+    print(f"{'Case':<24} | {'Size':<8} | {'us/op':<12} | {'blocks/op':<10} | {'bytes/op':<10} | {'peak KiB':<10}")
+    print("-" * 88)
+    for r in results:
+        print(f"{r['case']:<24} | {r['size']:<8} | {r['us_per_op']:<12.2f} | "
+              f"{r.get('blocks_per_op', '-'):<10} | {r.get('bytes_per_op', '-'):<10} | {r.get('peak_kib', '-'):<10}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="In-process engine/index microbenchmarks")
+    parser.add_argument("--sizes", type=str, default="1000,10000", help="Comma-separated dataset sizes")
+    parser.add_argument("--ops", type=int, default=200, help="Operations per timed run for per-op cases")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per case (best is reported)")
+    parser.add_argument("--only", type=str, default="", help="Only run cases whose name starts with this prefix")
+    parser.add_argument("--no-alloc", action="store_true", help="Skip the tracemalloc pass")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed")
+    parser.add_argument("--value-encoding", choices=ENCODINGS, default="object", help="KVStore value storage mode")
+    parser.add_argument("--storage", choices=["memory", "disk"], default="memory", help="KVStore storage backend")
+    parser.add_argument("--cache-bytes", type=int, default=0, help="Value cache size in bytes (encoded/disk modes)")
+    parser.add_argument("--cache-policy", choices=["lru", "arc", "tinylfu"], default="lru", help="Value cache eviction policy")
+    parser.add_argument("--memory", action="store_true", help="Also report bytes per key for every value encoding")
+    parser.add_argument("--save", type=str, default=None, help="Write results to this JSON file")
+    parser.add_argument("--baseline", type=str, default=None, help="Compare against a previously saved JSON file")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Relative slowdown counted as a regression")
+    args = parser.parse_args(argv)
+
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+    names = [n for n in CASES if n.startswith(args.only)]
+    results = []
+    for name in names:
+        for size in sizes:
+            results.append(run_case(name, size, args))
+            print(f"  {name} @ {size}: {results[-1]['us_per_op']:.2f} us/op", file=sys.stderr)
+
+    print_results(results)
+
+    memory = []
+    if args.memory:
+        memory = memory_report(sizes, args)
+        print(f"\n{'Size':<8} | {'Encoding':<10} | {'Bytes/key':<10}")
+        print("-" * 34)
+        for m in memory:
+            print(f"{m['size']:<8} | {m['value_encoding']:<10} | {m['bytes_per_key']:<10}")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"sizes": sizes, "ops": args.ops, "value_encoding": args.value_encoding, "storage": args.storage,
+                       "results": results, "memory": memory}, f, indent=2)
+        print(f"Results written to {args.save}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = find_regressions(results, json.load(f), args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) above {args.threshold * 100:.0f}%:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print("\nNo regressions.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+import asyncio
+
+import httpx
+
+from src.db.admission import AdmissionControl
+from src.db.engine import KVStore
+from src.db.metrics import MetricsRegistry
+
+
+def make_app(release: asyncio.Event):
+    async def app(scope, receive, send):
+        if scope["path"] == "/set":
+            await release.wait()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+    return app
+
+
+def test_inflight_limit_sheds_writes_only():
+    async def run():
+        release = asyncio.Event()
+        admission = AdmissionControl(make_app(release), max_inflight_writes=2, retry_after=2.5,
+                                     metrics=MetricsRegistry())
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=admission), base_url="http://db") as c:
+            held = [asyncio.create_task(c.post("/set", content=b"{}")) for _ in range(2)]
+            while admission.inflight_writes < 2:
+                await asyncio.sleep(0)
+            refused = await c.post("/set", content=b"{}")
+            assert refused.status_code == 429
+            assert refused.headers["retry-after"] == "3"
+            assert refused.json()["reason"] == "inflight"
+            # Reads and internal RPCs are not counted against the limit.
+            assert (await c.get("/get/x")).status_code == 200
+            assert (await c.post("/internal/heartbeat")).status_code == 200
+            release.set()
+            assert [r.status_code for r in await asyncio.gather(*held)] == [200, 200]
+            assert admission.inflight_writes == 0
+            assert (await c.post("/set", content=b"{}")).status_code == 200
+    asyncio.run(run())
+
+
+def test_backlog_limits_and_wal_checkpoint_trigger():
+    async def run():
+        release = asyncio.Event()
+        release.set()
+        state = {"backlog": 0, "wal": 0, "checkpoints": 0}
+        admission = AdmissionControl(
+            make_app(release), max_replication_backlog=10, max_wal_bytes=100,
+            replication_backlog=lambda: state["backlog"], wal_bytes=lambda: state["wal"],
+            on_wal_full=lambda: state.__setitem__("checkpoints", state["checkpoints"] + 1),
+            metrics=MetricsRegistry())
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=admission), base_url="http://db") as c:
+            state["backlog"] = 11
+            resp = await c.delete("/delete/k")
+            assert (resp.status_code, resp.json()["reason"]) == (429, "replication")
+            state["backlog"], state["wal"] = 0, 101
+            resp = await c.post("/bulk", content=b"{}")
+            assert (resp.status_code, resp.json()["reason"]) == (429, "wal")
+            assert state["checkpoints"] == 1
+            assert (await c.post("/internal/replicate", content=b"{}")).status_code == 200
+            state["wal"] = 0
+            assert (await c.post("/bulk", content=b"{}")).status_code == 200
+    asyncio.run(run())
+
+
+def test_wal_size_tracks_uncheckpointed_bytes(tmp_path):
+    db = KVStore(str(tmp_path))
+    db.set("a", "x" * 100)
+    db.set("b", "y")
+    size = db.wal_size
+    assert size > 100
+    db = KVStore(str(tmp_path))
+    assert db.wal_size == size
+    db.create_snapshot()
+    assert db.wal_size == 0
+
+
+def test_readiness_gate_refuses_until_recovered():
+    from src.db.health import ReadinessGate
+
+    async def run():
+        release = asyncio.Event()
+        release.set()
+        state = {"ready": False}
+        gate = ReadinessGate(make_app(release), ready=lambda: state["ready"],
+                             progress=lambda: {"phase": "wal", "records_replayed": 7})
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=gate), base_url="http://db") as c:
+            for method, path in (("GET", "/get/k"), ("POST", "/set"), ("POST", "/internal/vote")):
+                resp = await c.request(method, path)
+                assert resp.status_code == 503 and resp.headers["retry-after"] == "1"
+                assert resp.json()["recovery"]["records_replayed"] == 7
+            assert (await c.get("/health/ready")).status_code == 200  # answered by the app
+            assert (await c.get("/metrics")).status_code == 200
+            state["ready"] = True
+            assert (await c.get("/get/k")).status_code == 200
+    asyncio.run(run())
@@ -0,0 +1,66 @@
+import pytest
+from src.db.cache import make_cache
+from src.db.engine import KVStore
+
+
+@pytest.mark.parametrize("policy", ["lru", "arc", "tinylfu"])
+def test_cache_respects_byte_capacity(policy):
+    cache = make_cache(policy, 1000)
+    for i in range(100):
+        cache.get(f"k{i}")
+        cache.put(f"k{i}", i, 100)
+        assert cache.size <= 1000
+    assert len(cache) <= 10
+    assert cache.stats()["misses"] == 100
+
+
+@pytest.mark.parametrize("policy", ["lru", "arc", "tinylfu"])
+def test_cache_hit_and_invalidate(policy):
+    cache = make_cache(policy, 1000)
+    cache.put("a", "va", 10)
+    assert cache.get("a") == "va"
+    cache.invalidate("a")
+    assert cache.get("a") is None
+    assert cache.size == 0
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 1)
+
+
+def test_lru_evicts_least_recently_used():
+    cache = make_cache("lru", 30)
+    for k in "abc":
+        cache.put(k, k, 10)
+    cache.get("a")
+    cache.put("d", "d", 10)
+    assert cache.get("b") is None
+    assert cache.get("a") == "a"
+    assert cache.evictions == 1
+
+
+def test_tinylfu_keeps_popular_keys_under_scan():
+    cache = make_cache("tinylfu", 100)
+    for _ in range(5):
+        for k in range(5):
+            if cache.get(f"hot{k}") is None:
+                cache.put(f"hot{k}", k, 20)
+    for i in range(200):  # one-off scan should not flush the hot set
+        cache.get(f"scan{i}")
+        cache.put(f"scan{i}", i, 20)
+    assert all(cache.get(f"hot{k}") == k for k in range(5))
+    assert cache.rejections > 0
+
+
+def test_store_cache_invalidated_by_writes(tmp_path):
+    db = KVStore(data_dir=str(tmp_path), value_encoding="json", cache_bytes=10000, cache_policy="arc")
+    db.set("k", {"v": 1})
+    assert db.get("k") == {"v": 1}
+    assert db.get("k") == {"v": 1}
+    db.set("k", {"v": 2})
+    assert db.get("k") == {"v": 2}
+    db.bulk_set([("k", {"v": 3})])
+    assert db.get("k") == {"v": 3}
+    # Replicated writes go through _apply_record as well.
+    db._apply_record({"op": "DEL", "k": "k"})
+    assert db.get("k") is None
+    stats = db.cache_stats()
+    assert stats["hits"] >= 1
@@ -19,7 +19,7 @@ def start_server():
         stdout=subprocess.PIPE,
         stderr=subprocess.PIPE
     )
-    time.sleep(2) # Wait for startup
+    assert DatabaseClient(port=DB_PORT).wait_until_ready()
     return proc
 
 def stop_server(proc):
@@ -50,6 +50,13 @@ def test_set_get(server, client):
     assert client.set("foo", "bar")
     assert client.get("foo") == "bar"
 
+def test_health_endpoints(server, client):
+    import requests
+    assert requests.get(f"{client.base_url}/health/live").json() == {"status": "alive"}
+    ready = requests.get(f"{client.base_url}/health/ready")
+    assert ready.status_code == 200
+    assert ready.json()["status"] == "ready" and ready.json()["recovery"]["phase"] == "done"
+
 def test_set_delete_get(server, client):
     assert client.set("del_me", "val")
     assert client.delete("del_me")
@@ -84,10 +91,10 @@ def test_persistence_restart():
     
     # 1. Start Server
     proc = subprocess.Popen([sys.executable, "main.py", "--port", "8002"], env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-    time.sleep(2)
     
     try:
         c = DatabaseClient(port=8002)
+        assert c.wait_until_ready()
         c.set("persist_key", "persist_val")
         assert c.get("persist_key") == "persist_val"
     finally:
@@ -99,10 +106,10 @@ def test_persistence_restart():
 
     # 3. Restart Server
     proc = subprocess.Popen([sys.executable, "main.py", "--port", "8002"], env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-    time.sleep(2)
     
     try:
         c = DatabaseClient(port=8002)
+        assert c.wait_until_ready()
         # 4. Get data
         assert c.get("persist_key") == "persist_val"
     finally:
@@ -111,3 +118,101 @@ def test_persistence_restart():
         if os.path.exists(local_data_dir):
             shutil.rmtree(local_data_dir)
 
+
+def test_set_with_ttl_expires(server, client):
+    assert client.set("ttl_key", "ttl_val", ttl=1)
+    assert client.get("ttl_key") == "ttl_val"
+    assert 0 < client.ttl("ttl_key") <= 1
+    assert client.set("ttl_null", None, ttl=100)
+    assert 0 < client.ttl("ttl_null") <= 100
+    time.sleep(1.5)
+    assert client.get("ttl_key") is None
+
+def test_compare_and_set_and_transaction(server, client):
+    assert client.get_with_version("counter") == (None, 0)
+    ok, v1 = client.compare_and_set("counter", 1, expected_version=0)
+    assert ok
+    assert client.get_with_version("counter") == (1, v1)
+    # A stale version is rejected with the current one.
+    assert client.compare_and_set("counter", 5, expected_version=0) == (False, v1)
+
+    ok, versions = client.transaction({"counter": v1}, sets=[("counter", 2), ("audit", "bumped")])
+    assert ok and versions["counter"] > v1
+    ok, conflicts = client.transaction({"counter": v1}, sets=[("counter", 3)])
+    assert not ok and conflicts == {"counter": versions["counter"]}
+    assert client.get("counter") == 2
+
+def test_server_side_updates(server, client):
+    assert client.incr("hits") == 1
+    assert client.incr("hits", by=4) == 5
+    assert client.set("profile", {"name": "Al", "tags": []})
+    assert client.patch("profile", "/tags/-", "admin")
+    assert client.merge("profile", {"name": "Alice"})
+    assert client.append("greeting", "hello")
+    assert client.append("greeting", " world")
+    assert client.get("profile") == {"name": "Alice", "tags": ["admin"]}
+    assert client.get("greeting") == "hello world"
+    assert client.incr("greeting") is None  # not a number
+
+def test_watch_streams_changes(server, client):
+    import threading
+    assert client.set("watch:a", 1)
+    assert client.set("unwatched", 1)
+    assert client.delete("watch:a")
+
+    stream = client.watch(prefix="watch:", since=0, timeout=10)
+    first, second = next(stream), next(stream)
+    stream.close()
+    assert (first["op"], first["k"], first["v"]) == ("SET", "watch:a", 1)
+    assert (second["op"], second["k"]) == ("DEL", "watch:a")
+
+    # Resume after the last seen LSN and tail a live write.
+    stream = client.watch(prefix="watch:", since=second["lsn"], timeout=10)
+    threading.Timer(0.2, client.bulk_set, args=([("watch:b", 2), ("unwatched", 2)],)).start()
+    event = next(stream)
+    stream.close()
+    assert event["op"] == "BULK" and event["data"] == [["watch:b", 2]]
+    assert event["lsn"] > second["lsn"]
+
+def test_raw_body_writes(server, client):
+    import requests
+    import json
+    url = f"http://localhost:{DB_PORT}"
+    # Pretty-printed bodies are logged on one WAL line with the value text as sent.
+    body = '{\n  "key": "raw_key",\n  "value": {"a": [1, 2,\n 3], "s": "x\\ny"}\n}'
+    resp = requests.post(f"{url}/set", data=body, headers={"content-type": "application/json"})
+    assert resp.status_code == 200
+    assert client.get("raw_key") == {"a": [1, 2, 3], "s": "x\ny"}
+    with open(os.path.join(DATA_DIR, "wal.log"), encoding="utf-8") as f:
+        last = f.readlines()[-1]
+    assert json.loads(last) == {"op": "SET", "k": "raw_key", "v": {"a": [1, 2, 3], "s": "x\ny"}}
+
+    for bad in ['{"key": 1, "value": 2}', '{"value": 2}', '{"key": "k"', '[1]']:
+        resp = requests.post(f"{url}/set", data=bad, headers={"content-type": "application/json"})
+        assert resp.status_code == 422, bad
+    resp = requests.post(f"{url}/bulk", json={"items": [["k", 1, 2]]})
+    assert resp.status_code == 422
+
+def test_streaming_import_export(server, client):
+    import requests
+    url = f"http://localhost:{DB_PORT}"
+    items = ((f"imp:{i:05d}", f"imported item{i}") for i in range(3000))
+    assert client.import_items(items, batch_size=500) == 3000
+    assert client.get("imp:01234") == "imported item1234"
+    assert client.search("item2999") == ["imp:02999"]  # indexed once the import finished
+
+    dump = list(client.export(prefix="imp:"))
+    assert len(dump) == 3000
+    assert dump[7] == ("imp:00007", "imported item7")
+
+    # Raw NDJSON with a TTL, a blank line, and no trailing newline; a bad line reports its number.
+    body = '{"key": "imp:ttl", "value": 1, "ttl": 100}\n\n{"key": "imp:last", "value": [1,\r2]}'
+    resp = requests.post(f"{url}/import", data=body)
+    assert resp.json() == {"status": "ok", "count": 2}
+    assert client.get("imp:last") == [1, 2]
+    assert 0 < client.ttl("imp:ttl") <= 100
+    resp = requests.post(f"{url}/import", data='{"key": "imp:ok", "value": 1}\n{"key": 5}\n')
+    assert resp.status_code == 422
+    assert resp.json()["detail"].startswith("Line 2:")
+    assert resp.json()["count"] == 1
+    assert client.get("imp:ok") == 1
@@ -20,7 +20,7 @@ def start_server():
         stdout=subprocess.DEVNULL,
         stderr=subprocess.DEVNULL
     )
-    time.sleep(2)
+    assert DatabaseClient(port=DB_PORT).wait_until_ready()
     return proc
 
 def test_durability_random_kill():
@@ -108,9 +108,8 @@ def test_bulk_set_atomicity_kill():
         stdout=subprocess.DEVNULL,
         stderr=subprocess.DEVNULL
     )
-    time.sleep(2)
-
     client = DatabaseClient(port=8004)
+    assert client.wait_until_ready()
     batch_size = 100
     batch = [(f"atk_{i}", f"val_{i}") for i in range(batch_size)]
     
@@ -0,0 +1,488 @@
+import json
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+from src.db.engine import KVStore
+
+
+@pytest.fixture(params=["object", "json"])
+def store_factory(tmp_path, request):
+    def make():
+        return KVStore(data_dir=str(tmp_path), value_encoding=request.param, compress_threshold=64)
+    return make
+
+
+def test_encoded_values_roundtrip(store_factory):
+    db = store_factory()
+    doc = {"name": "Alice", "tags": ["a", "b"], "n": 3}
+    big = "word " * 100  # above the compression threshold
+    assert db.set("doc", doc)
+    assert db.bulk_set([("big", big), ("num", 42)])
+    assert db.get("doc") == doc
+    assert db.get("big") == big
+    assert db.get("num") == 42
+    assert db.get("missing") is None
+
+
+def test_encoded_values_survive_snapshot_and_replay(store_factory):
+    db = store_factory()
+    db.set("a", {"x": 1})
+    db.set("b", "hello world " * 20)
+    assert db.create_snapshot()
+    db.set("c", [1, 2, 3])
+    db.delete("a")
+
+    db = store_factory()
+    assert db.get("a") is None
+    assert db.get("b") == "hello world " * 20
+    assert db.get("c") == [1, 2, 3]
+
+
+def test_memory_stats(store_factory):
+    db = store_factory()
+    db.bulk_set([(f"k{i}", {"i": i, "text": "some value"}) for i in range(100)])
+    stats = db.memory_stats()
+    assert stats["keys"] == 100
+    assert stats["bytes_per_key"] > 0
+
+
+def test_disk_storage_survives_restart_and_checkpoint(tmp_path):
+    db = KVStore(data_dir=str(tmp_path), storage="disk")
+    db.bulk_set([(f"k{i}", {"i": i}) for i in range(50)])
+    db.delete("k0")
+    assert db.create_snapshot()
+    db.set("k1", "updated")
+    db.close()
+
+    db = KVStore(data_dir=str(tmp_path), storage="disk")
+    assert db.get("k0") is None
+    assert db.get("k1") == "updated"
+    assert db.get("k49") == {"i": 49}
+    assert len(db._data) == 49
+    db.close()
+
+
+def test_disk_storage_replays_deltas_once(tmp_path):
+    db = KVStore(data_dir=str(tmp_path), storage="disk")
+    db.update({"op": "APPEND", "k": "l", "v": "x"})
+    db.update({"op": "INCR", "k": "n", "by": 2})
+    db.set("t", 1, expire_at=time.time() + 3600)
+    logged, _ = db.update({"op": "INCR", "k": "t"})
+    assert logged["op"] == "SET" and logged["exp"] == db._expiry["t"]
+    db.close()
+
+    for _ in range(2):
+        db = KVStore(data_dir=str(tmp_path), storage="disk")
+        assert (db.get("l"), db.get("n"), db.get("t")) == ("x", 2, 2)
+        assert db.ttl("t") > 3000
+        db.close()
+
+
+def test_disk_storage_reindexes_writes_after_checkpoint(tmp_path):
+    db = KVStore(data_dir=str(tmp_path), storage="disk")
+    db.set("a", "alpha one")
+    assert db.create_snapshot()
+    db.set("b", "hello world")
+    db.set("a", "bravo two")
+    db.close()
+
+    db = KVStore(data_dir=str(tmp_path), storage="disk")
+    assert db.search("hello") == ["b"]
+    assert db.search("bravo") == ["a"]
+    assert db.search("alpha") == []
+    db.close()
+
+
+def test_disk_storage_compaction_keeps_live_values(tmp_path):
+    db = KVStore(data_dir=str(tmp_path), storage="disk", disk_file_bytes=2048)
+    for round_ in range(5):
+        db.bulk_set([(f"k{i}", f"value {round_} {i}") for i in range(40)])
+    db.delete("k3")
+    db._data.compact()
+    assert db._data.dead_ratio() < 0.5
+    db.close()
+
+    db = KVStore(data_dir=str(tmp_path), storage="disk", disk_file_bytes=2048)
+    assert db.get("k3") is None
+    assert db.get("k7") == "value 4 7"
+    assert len(db._data) == 39
+    db.close()
+
+
+def test_disk_storage_truncates_torn_tail(tmp_path):
+    from src.db.bitcask import DiskStore
+    store = DiskStore(str(tmp_path))
+    store["a"] = b"1"
+    store["b"] = b"2"
+    store.close()
+    path = store._active.name
+    with open(path, "ab") as f:
+        f.write(b"\x00\x01garbage")
+
+    store = DiskStore(str(tmp_path))
+    assert store.get("a") == b"1"
+    assert store.get("b") == b"2"
+    store.close()
+
+
+def test_ttl_lazy_expiry_and_batched_reaping(tmp_path):
+    db = KVStore(data_dir=str(tmp_path))
+    now = time.time()
+    db.set("session", "alive token", expire_at=now + 60)
+    db.bulk_set([("s1", "gone soon"), ("s2", "gone soon")], expire_at=now - 1)
+    db.set("plain", "no ttl")
+
+    # Expired keys are hidden before the reaper runs.
+    assert db.get("s1") is None
+    assert db.search("gone") == []
+    assert sorted(db.vector_search("gone soon", top_k=2)) == ["plain", "session"]
+    assert db.vector_search("gone soon", top_k=1)[0] in ("plain", "session")
+    assert 59 < db.ttl("session") <= 60
+    assert db.ttl("plain") is None
+
+    record = db.reap_expired()
+    assert record["op"] == "EXPIRE"
+    assert sorted(record["keys"]) == ["s1", "s2"]
+    assert db.reap_expired() is None
+    assert "s1" not in db._data
+    assert db.indexer.search("gone") == []
+
+    # Rewriting without a TTL clears it.
+    db.set("session", "renewed")
+    assert db.ttl("session") is None
+
+    # Stale heap entries from rewrites are dropped without the reaper (followers never run it).
+    for _ in range(3000):
+        db.set("session", "renewed", expire_at=now + 60)
+    assert len(db._expiry_heap) <= 2 * len(db._expiry) + 1025
+
+
+def test_ttl_survives_snapshot_and_restart(tmp_path):
+    for storage in ("memory", "disk"):
+        data_dir = str(tmp_path / storage)
+        db = KVStore(data_dir=data_dir, storage=storage)
+        db.set("k", "v", expire_at=time.time() + 100)
+        db.create_snapshot()
+        db.close()
+        db = KVStore(data_dir=data_dir, storage=storage)
+        assert db.get("k") == "v"
+        assert db.ttl("k") > 90
+        db.close()
+
+
+def test_legacy_snapshot_format_still_loads(tmp_path):
+    with open(tmp_path / "db.snapshot", "w") as f:
+        json.dump({"old": "value"}, f)
+    db = KVStore(data_dir=str(tmp_path))
+    assert db.get("old") == "value"
+
+
+def test_versions_cas_and_transactions(tmp_path):
+    db = KVStore(data_dir=str(tmp_path))
+    assert db.version("a") == 0
+    ok, v1 = db.compare_and_set("a", 1, expected_version=0)
+    assert ok and v1 > 0
+    assert db.compare_and_set("a", 2, expected_version=0) == (False, v1)
+
+    # Deleting and recreating a key never reuses a version.
+    db.delete("a")
+    assert db.version("a") == 0
+    db.set("a", 1)
+    assert db.version("a") > v1
+
+    va, vb = db.version("a"), db.version("b")
+    ok, written = db.transact({"a": va, "b": vb}, sets=[("b", "new")], deletes=["a"])
+    assert ok and written == {"b": db.version("b"), "a": 0}
+    ok, conflicts = db.transact({"a": va}, sets=[("c", 1)], deletes=[])
+    assert not ok and conflicts == {"a": 0}
+    assert db.get("c") is None
+
+    # Versions are rebuilt identically from snapshot + WAL replay.
+    db.create_snapshot()
+    db.set("d", 4)
+    expected = dict(db._versions)
+    db = KVStore(data_dir=str(tmp_path))
+    assert db._versions == expected
+    assert db.get_with_version("d") == (4, expected["d"])
+
+
+def test_delta_updates_log_only_the_change(tmp_path):
+    from src.db.delta import DeltaError
+    db = KVStore(data_dir=str(tmp_path))
+    db.set("doc", {"profile": {"name": "Al", "tags": ["a"]}, "bio": "x" * 1000})
+    db.update({"op": "INCR", "k": "hits", "by": 2})
+    record, value = db.update({"op": "INCR", "k": "hits", "by": 3})
+    assert value == 5
+    db.update({"op": "APPEND", "k": "log", "v": "ab"})
+    db.update({"op": "APPEND", "k": "log", "v": "cd"})
+    db.update({"op": "PATCH", "k": "doc", "path": ["profile", "tags", "-"], "v": "b"})
+    db.update({"op": "MERGE", "k": "doc", "v": {"profile": {"name": "Alice"}, "bio": None}})
+    with pytest.raises(DeltaError):
+        db.update({"op": "INCR", "k": "log", "by": 1})
+
+    expected = {"profile": {"name": "Alice", "tags": ["a", "b"]}}
+    assert db.get("doc") == expected
+    assert db.get("log") == "abcd"
+    with open(tmp_path / "wal.log") as f:
+        last = json.loads(f.readlines()[-1])
+    assert last["op"] == "MERGE" and "x" * 1000 not in json.dumps(last)
+
+    # Replaying the deltas reproduces the same state.
+    db = KVStore(data_dir=str(tmp_path))
+    assert db.get("doc") == expected
+    assert db.get("hits") == 5
+
+
+def test_delta_on_expired_key_is_logged_as_set(tmp_path):
+    db = KVStore(data_dir=str(tmp_path))
+    db.set("n", 10, expire_at=time.time() - 1)
+    record, value = db.update({"op": "INCR", "k": "n", "by": 1})
+    assert value == 1
+    assert record == {"op": "SET", "k": "n", "v": 1}
+    assert db.ttl("n") is None
+
+    # Otherwise a replicated delta is logged as such, even with watchers getting the SET.
+    delta = {"op": "APPEND", "k": "s", "v": "x"}
+    assert db._apply_record(delta) is delta
+    assert db.changes.read(db.changes.last_lsn - 1)[0][0][1] == {"op": "SET", "k": "s", "v": "x"}
+
+
+def test_change_feed_filters_and_resumes(tmp_path):
+    db = KVStore(data_dir=str(tmp_path), change_log_size=4)
+    db.set("user:1", "a")
+    db.set("other", "x")
+    db.bulk_set([("user:2", "b"), ("misc", "y")])
+    db.update({"op": "INCR", "k": "user:hits", "by": 2})
+
+    from src.db.changes import filter_record
+    records, last = db.changes.read(0)
+    assert last == db._lsn == 4
+    assert [lsn for lsn, _ in records] == [1, 2, 3, 4]
+    events = [filter_record(r, "user:") for _, r in records]
+    assert events[1] is None
+    assert events[2]["data"] == [("user:2", "b")]
+    assert events[3] == {"op": "SET", "k": "user:hits", "v": 2}  # deltas are published as their result
+
+    assert db.changes.read(2, limit=1)[0] == [(3, records[2][1])]
+    assert db.changes.read(4) == ([], 4)
+    db.delete("user:1")
+    assert db.changes.read(0)[0] is None  # LSN 1 fell out of the 4-record buffer
+
+    # After a restart the feed resumes from the replayed log.
+    db = KVStore(data_dir=str(tmp_path), change_log_size=4)
+    assert db.changes.read(4)[0] == [(5, {"op": "DEL", "k": "user:1"})]
+
+
+def test_import_defers_indexing_until_finished(tmp_path):
+    db = KVStore(data_dir=str(tmp_path))
+    db.set("a", "old words")
+    assert db.import_batch([("a", "fresh apple"), ("b", "ripe apple")], expire_at={"b": 9e9})
+    assert db.get("a") == "fresh apple"
+    assert db.ttl("b") is not None
+    assert db.search("apple") == []  # not indexed yet
+    assert db.search("old") == []  # but the overwritten value is gone from the index
+    # Watchers get the imported keys, not the values.
+    assert db.changes.read(1)[0] == [(2, {"op": "IMPORT", "keys": ["a", "b"]})]
+    assert db.finish_import()
+    assert sorted(db.search("apple")) == ["a", "b"]
+
+    # A log that ends inside an import is indexed during recovery.
+    db.import_batch([("c", "sour apple")])
+    db = KVStore(data_dir=str(tmp_path))
+    assert sorted(db.search("apple")) == ["a", "b", "c"]
+    assert db._unindexed == []
+
+
+def test_replicated_import_survives_follower_restart(tmp_path):
+    leader = KVStore(data_dir=str(tmp_path / "leader"))
+    follower = KVStore(data_dir=str(tmp_path / "follower"))
+    leader.import_batch([("a", "apple"), ("b", "berry")])
+    leader.finish_import()
+    leader.set("c", "cherry")
+    # What /internal/replicate does with each record of the leader's WAL.
+    with open(leader.wal_path) as f:
+        for line in f:
+            record = json.loads(line)
+            assert follower._append_wal(follower._apply_record(record))
+    assert follower.changes.read(0)[0][0] == (1, {"op": "IMPORT", "keys": ["a", "b"]})
+
+    follower = KVStore(data_dir=str(tmp_path / "follower"))
+    assert (follower.get("a"), follower.get("c")) == ("apple", "cherry")
+    assert follower.search("berry") == ["b"]
+
+
+def test_export_is_point_in_time(tmp_path):
+    db = KVStore(data_dir=str(tmp_path))
+    db.bulk_set([(f"k{i}", i) for i in range(10)])
+    db.set("gone", 1, expire_at=time.time() - 1)
+
+    export = db.export(chunk_size=4)
+    first = next(export)
+    # Writes between chunks are neither blocked nor visible to the export.
+    db.set("k9", "changed")
+    db.delete("k8")
+    db.set("new", 1)
+    rest = [item for chunk in export for item in chunk]
+    dump = {k: v for k, v, _ in first + rest}
+    assert dump == {f"k{i}": i for i in range(10)}
+    assert db._exports == []
+    assert db.get("k9") == "changed"
+    assert [k for chunk in db.export(prefix="k1") for k, _, _ in chunk] == ["k1"]
+
+
+def test_index_persisted_with_snapshot(tmp_path):
+    import numpy as np
+    db = KVStore(data_dir=str(tmp_path))
+    db.bulk_set([(f"k{i}", f"word{i % 7} common text {i}") for i in range(50)] + [("n", 5)])
+    before = {k: s for s, k in db.vector_search_scored("common text 3", top_k=100)}
+    db.create_snapshot()
+    db.set("k1", "replaced by wal")
+    db.delete("k2")
+
+    db = KVStore(data_dir=str(tmp_path))
+    assert isinstance(db.indexer.vector_index._matrix, np.memmap)  # loaded, not rebuilt
+    assert "k1" in db.search("wal") and "k1" not in db.search("word1")
+    assert "k2" not in db.search("common")
+    assert len(db.search("common")) == 48
+    after = {k: s for s, k in db.vector_search_scored("common text 3", top_k=100)}
+    assert set(after) == set(before) - {"k2"}
+    assert all(after[k] == before[k] for k in after if k != "k1")
+    assert db.vector_search_scored("replaced by wal", top_k=1)[0][1] == "k1"
+
+    # Saving a loaded index (postings still on disk) writes it out in full.
+    db.set("k3", "fresh value")
+    db.create_snapshot()
+    db = KVStore(data_dir=str(tmp_path))
+    assert isinstance(db.indexer.vector_index._matrix, np.memmap)
+    assert sorted(db.search("word4")) == sorted(f"k{i}" for i in range(4, 50, 7))
+
+    # A stale index (the snapshot moved on without it) is rebuilt from the data.
+    db.set("k4", "newer value")
+    db._save_index = lambda dump, lsn: None
+    db.create_snapshot()
+    db = KVStore(data_dir=str(tmp_path))
+    assert not isinstance(db.indexer.vector_index._matrix, np.memmap)
+    assert db.search("newer") == ["k4"] and db.search("fresh") == ["k3"]
+    assert db.search("word4") and "k4" not in db.search("word4")
+
+
+def test_snapshot_writes_outside_the_lock(tmp_path):
+    db = KVStore(data_dir=str(tmp_path), value_encoding="json")
+    db.set("a", 1)
+    write_snapshot = db._write_encoded_snapshot
+
+    def write_during_dump(f, data, meta):
+        writer = threading.Thread(target=db.set, args=("b", 2))
+        writer.start()
+        writer.join(timeout=5)
+        assert not writer.is_alive()
+        write_snapshot(f, data, meta)
+
+    db._write_encoded_snapshot = write_during_dump
+    assert db.create_snapshot()
+    assert db.wal_size > 0  # the write made during the dump is kept for replay
+    db = KVStore(data_dir=str(tmp_path), value_encoding="json")
+    assert (db.get("a"), db.get("b")) == (1, 2)
+    assert db.wal_size > 0
+
+
+def test_bulk_rebuild_matches_incremental_index(tmp_path):
+    from src.db.indexes import IndexManager
+    items = [(f"k{i}", f"alpha beta {i % 5} gamma{i % 3}") for i in range(40)] + [("x", 1)]
+    incremental = IndexManager()
+    for k, v in items:
+        incremental.update(k, v)
+    bulk = IndexManager()
+    bulk.rebuild(items)
+    assert bulk.inverted_index == incremental.inverted_index
+    for q in ("alpha 3", "gamma2", "something else"):
+        assert bulk.vector_search_scored(q, top_k=7) == incremental.vector_search_scored(q, top_k=7)
+
+
+def test_index_dump_is_unaffected_by_later_updates(tmp_path):
+    from src.db.indexes import IndexManager
+    index = IndexManager(vectors=False)
+    index.rebuild([("a", "red apple"), ("b", "green apple"), ("c", "red cherry")])
+    index.save(str(tmp_path), lsn=1)
+    index = IndexManager(vectors=False)
+    assert index.load(str(tmp_path), lsn=1)
+    index.update("d", "red grape")  # "red" materialized, "apple" still loaded
+
+    dump = index.dump()
+    index.update("a", "blue plum", "red apple")
+    index.remove("d", "red grape")
+    index.write(str(tmp_path), 2, dump)
+    assert sorted(index.search("red")) == ["c"] and index.search("apple") == ["b"]
+
+    saved = IndexManager(vectors=False)
+    assert saved.load(str(tmp_path), lsn=2)
+    assert sorted(saved.search("red")) == ["a", "c", "d"]
+    assert sorted(saved.search("apple")) == ["a", "b"]
+    assert saved.search("plum") == []
+
+
+def test_prefix_phrase_and_stopword_search(tmp_path):
+    db = KVStore(data_dir=str(tmp_path), stopwords=["the", "of"])
+    db.set("a", "The quick brown fox")
+    db.set("b", "quick thinking of the brown bear")
+    db.set("c", "brown quick fox")
+    db.set("d", 42)
+    assert sorted(db.search("quick brown")) == ["a", "b", "c"]
+    assert sorted(db.search("qui* fo*")) == ["a", "c"]
+    assert sorted(db.search('"quick brown"')) == ["a"]
+    assert sorted(db.search('"brown quick" fox')) == ["c"]
+    assert db.search('"thinking of the brown"') == ["b"]  # stopwords still count inside phrases
+    assert db.search("the") == [] and "the" not in db.indexer.terms()
+    assert db.search("zzz*") == []
+
+    # Updates only touch the terms that changed; emptied terms leave the dictionary.
+    db.set("c", "brown quick wolf")
+    assert db.search("fox") == ["a"] and db.search("wolf") == ["c"]
+    db.delete("a")
+    db.set("a", "foxglove")
+    assert db.indexer.prefix_terms("fo") == ["foxglove"]
+    assert db.search("fox*") == ["a"]
+
+    # The persisted index is only reused with the same stopwords.
+    db.create_snapshot()
+    db = KVStore(data_dir=str(tmp_path))
+    assert db.search("of") == ["b"]
+
+
+def test_deferred_recovery_reports_progress(tmp_path):
+    db = KVStore(data_dir=str(tmp_path))
+    db.bulk_set([(f"k{i}", f"v{i}") for i in range(10)])
+    db.set("a", "b")
+    size = db.wal_size
+
+    db = KVStore(data_dir=str(tmp_path), recover=False)
+    assert not db.ready and db.recovery == {"phase": "pending"}
+    assert db.get("a") is None
+    db.load()
+    assert db.ready and db.get("a") == "b"
+    assert db.recovery["records_replayed"] == 2
+    assert db.recovery["wal_bytes_replayed"] == db.recovery["wal_bytes"] == size
+
+
+def test_index_without_vectors_skips_numpy(tmp_path):
+    db = KVStore(data_dir=str(tmp_path), vector_index=False)
+    db.bulk_set([(f"k{i}", f"word{i % 3} text") for i in range(9)])
+    assert db.indexer.vector_index is None and db.vector_search("text") == []
+    db.create_snapshot()
+
+    db = KVStore(data_dir=str(tmp_path), vector_index=False)
+    assert db.indexer._loaded_terms  # loaded, not rebuilt
+    assert sorted(db.search("word1")) == ["k1", "k4", "k7"]
+    # An index saved without vectors is rebuilt when they are enabled.
+    db = KVStore(data_dir=str(tmp_path))
+    assert not db.indexer._loaded_terms
+    assert len(db.vector_search("text", top_k=100)) == 9
+
+    code = ("import sys; from src.db.engine import KVStore; "
+            f"db = KVStore(data_dir={str(tmp_path)!r}, vector_index=False); db.set('x', 'some text'); "
+            "assert db.search('some') == ['x']; print('numpy' in sys.modules)")
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == "False"
@@ -36,7 +36,8 @@ def start_cluster():
         proc = subprocess.Popen(cmd, env=env, stdout=log_file, stderr=subprocess.STDOUT)
         procs.append((proc, log_file))
     
-    time.sleep(5) # Give time for election
+    for port in PORTS:
+        assert DatabaseClient(host="127.0.0.1", port=port).wait_until_ready()
     return procs
 
 def stop_cluster(procs):
@@ -87,6 +88,9 @@ def test_replication_flow(cluster):
     # 2. Write to Leader
     client = DatabaseClient(host="127.0.0.1", port=PORTS[leader_idx])
     assert client.set("rep_key", "rep_val")
+    assert client.incr("rep_counter", by=3) == 3
+    assert client.set("rep_doc", {"a": 1})
+    assert client.patch("rep_doc", "/b", 2)
     
     # 3. Check followers have data
     time.sleep(1) # Allow replication
@@ -107,8 +111,8 @@ def test_replication_flow(cluster):
     # 4. Kill Leader
     print(f"Killing Leader Node {leader_id}")
     cluster[leader_idx][0].kill()
-    time.sleep(5) # Wait for new election
     
+    # get_leader_index() polls until a remaining node has won the election.
     new_leader_idx, new_leader_id = get_leader_index()
     assert new_leader_idx is not None
     assert new_leader_idx != leader_idx
@@ -118,6 +122,47 @@ def test_replication_flow(cluster):
     client2 = DatabaseClient(host="127.0.0.1", port=PORTS[new_leader_idx])
     val = client2.get("rep_key")
     assert val == "rep_val", f"Data lost during failover! Got {val}"
+    # Delta records were applied by the followers, not just logged.
+    assert client2.get("rep_counter") == 3
+    assert client2.get("rep_doc") == {"a": 1, "b": 2}
     
     # 6. Write new data to new Leader
     assert client2.set("new_key", "new_val")
+
+
+# --- Simulated cluster (tests/cluster_sim.py): deterministic and in virtual time ---
+
+def test_simulated_failover_is_deterministic():
+    from tests.cluster_sim import default_scenario, simulate
+    scenario = default_scenario(crash_leader_at=5, restart_after=3, partition_leader_at=None, heal_after=None)
+    report = simulate(scenario, duration=12, seed=7, latency=(0.002, 0.01), loss=0.01)
+    assert report == simulate(scenario, duration=12, seed=7, latency=(0.002, 0.01), loss=0.01)
+
+    # Initial election and re-election after the crash both finish within the election timeout.
+    assert len(report["elections"]) == 2
+    assert all(e["seconds"] is not None and e["seconds"] <= 3.5 for e in report["elections"])
+    assert report["unavailable"] and report["unavailable"][-1]["from"] >= 5
+    assert report["writes_committed"] > 0 and report["replicated_throughput"] > 0
+
+
+def test_simulated_partition_elects_majority_leader():
+    import asyncio
+    from tests.cluster_sim import simulate
+
+    async def scenario(cluster):
+        old = await cluster.wait_for_leader()
+        cluster.partition([old])
+        partitioned_at = cluster.now()
+        while not [n for n in cluster.leaders() if n != old]:
+            await asyncio.sleep(0.01)
+        new = [n for n in cluster.leaders() if n != old][0]
+        elected_in = cluster.now() - partitioned_at
+        cluster.heal()
+        await asyncio.sleep(2)
+        # The new leader's heartbeats demote the old one once the network heals.
+        return {"elected_in": elected_in, "leaders": cluster.leaders(), "new": new}
+
+    result = simulate(scenario, duration=15, seed=3)["scenario"]
+    assert result is not None
+    assert result["elected_in"] <= 4.5
+    assert result["leaders"] == [result["new"]]
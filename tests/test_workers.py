@@ -0,0 +1,94 @@
+import pytest
+import subprocess
+import os
+import shutil
+import sys
+import requests
+from src.client.client import DatabaseClient
+from src.db.partition import partition_for
+
+DATA_DIR = "test_data_workers"
+DB_PORT = 8030
+WORKERS = 2
+
+def start_server():
+    env = os.environ.copy()
+    env["DB_DATA_DIR"] = DATA_DIR
+    proc = subprocess.Popen(
+        [sys.executable, "main.py", "--port", str(DB_PORT), "--host", "127.0.0.1", "--workers", str(WORKERS)],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    # Ready once every worker has bound its socket and recovered its partition.
+    assert DatabaseClient(host="127.0.0.1", port=DB_PORT).wait_until_ready()
+    return proc
+
+def stop_server(proc):
+    proc.terminate()
+    try:
+        proc.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+@pytest.fixture
+def data_dir():
+    if os.path.exists(DATA_DIR):
+        shutil.rmtree(DATA_DIR)
+    os.makedirs(DATA_DIR)
+    yield DATA_DIR
+    if os.path.exists(DATA_DIR):
+        shutil.rmtree(DATA_DIR)
+
+def test_partitioned_workers(data_dir):
+    proc = start_server()
+    try:
+        client = DatabaseClient(host="127.0.0.1", port=DB_PORT)
+        keys = [f"key_{i}" for i in range(20)]
+        assert {partition_for(k, WORKERS) for k in keys} == {0, 1}
+
+        for k in keys[:10]:
+            assert client.set(k, f"value {k}")
+        assert client.bulk_set([(k, f"value {k}") for k in keys[10:]])
+        for k in keys:
+            assert client.get(k) == f"value {k}"
+        assert client.incr("counter", by=2) == 2
+        assert sorted(client.search("value")) == sorted(keys)
+
+        # Each key is stored only by the worker that owns it.
+        for p in range(WORKERS):
+            info = requests.get(f"http://127.0.0.1:{DB_PORT}/debug/info", params={"partition": p}).json()
+            assert info["partition"] == p
+        owned = [k for k in keys if partition_for(k, WORKERS) == 0]
+        with open(os.path.join(DATA_DIR, "partition-0", "wal.log")) as f:
+            wal = f.read()
+        assert all(f'"{k}"' in wal for k in owned)
+        assert not any(f'"{k}"' in wal for k in keys if k not in owned)
+
+        # Transactions must stay within one partition.
+        k0 = next(k for k in keys if partition_for(k, WORKERS) == 0)
+        k1 = next(k for k in keys if partition_for(k, WORKERS) == 1)
+        ok, _ = client.transaction({}, sets=[(k0, 1), (k1, 1)])
+        assert not ok
+        ok, _ = client.transaction({}, sets=[(k0, 1)])
+        assert ok
+
+        # Imports are split across partitions; the export gathers all of them.
+        assert client.import_items((f"imp_{i}", f"item {i}") for i in range(200)) == 200
+        assert sorted(client.search("item")) == sorted(f"imp_{i}" for i in range(200))
+        assert dict(client.export(prefix="imp_")) == {f"imp_{i}": f"item {i}" for i in range(200)}
+        resp = requests.post(f"http://127.0.0.1:{DB_PORT}/import", data='{"key": "imp_x", "value": 1}\n{"key": 5}\n')
+        assert resp.status_code == 422
+        assert resp.json()["count"] == 1
+    finally:
+        stop_server(proc)
+
+    # Restart with the same partition count: every worker recovers its own WAL.
+    proc = start_server()
+    try:
+        client = DatabaseClient(host="127.0.0.1", port=DB_PORT)
+        assert client.get(k1) == f"value {k1}"
+        assert client.get(k0) == 1
+        assert client.get("counter") == 2
+    finally:
+        stop_server(proc)